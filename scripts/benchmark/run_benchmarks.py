@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Time the stages of the registration, member database and gallery scripts on
+synthetic exports.
+
+For each number of rows, synthetic_exports.py writes a fresh set of exports
+into a temporary directory, and each stage is then run there and timed:
+
+- metrics: registration-metrics-sqlite.py, run as from the command line with
+  the 4 exports: setup_new_db, generate_metrics and dump_all_data. The time
+  of each of its stages (import, create-master, populate-master, summaries,
+  add-extras, attendance-index, cube, history, metrics and dump) is taken
+  from the report of its Instrumentation, with the CPU time and rows
+- fuzzy: cleaning.suggest_duplicates on the first --fuzzy-rows members, since
+  it compares every pair
+- confmaster: check_confmaster_registrations.py
+- gallery: the search index and the HTML of a gallery with one poster per
+  submission, from a made up thumbnail manifest
+
+The output of the scripts is discarded. The timings are printed, and appended
+to `benchmark-results.json` with the parameters of the run, so that
+regressions can be spotted by comparing runs.
+
+Usage:
+
+    run_benchmarks.py [--rows 1000 10000] [--stages fuzzy gallery ...]
+
+File: run_benchmarks.py
+"""
+
+import argparse
+import contextlib
+import csv
+import importlib.util
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import synthetic_exports
+
+
+scripts_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+results_fn = "benchmark-results.json"
+stages = ["metrics", "fuzzy", "confmaster", "gallery"]
+
+for directory in ["database", "poster-gallery", "registration"]:
+    sys.path.insert(0, os.path.join(scripts_dir, directory))
+
+
+def load_script(path, name):
+    """Import a script whose file name is not a valid module name.
+
+    :path: path of the script, relative to the scripts directory
+    :name: module name to give it
+    :returns: module
+    """
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(scripts_dir, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def metrics_stage(files):
+    """Get the run of registration-metrics-sqlite.py.
+
+    :files: dict returned by synthetic_exports.write_all
+    :returns: (function, Instrumentation that records its stages)
+    """
+    from instrumentation import Instrumentation
+
+    instrumentation = Instrumentation()
+    metrics = load_script("registration/registration-metrics-sqlite.py",
+                          "registration_metrics").Metrics(instrumentation)
+    # Same order as the command line of the script
+    filenames = [None, files["profiles"], files["receipts"],
+                 files["add_to_registration"], files["add_extras"]]
+
+    def run_all():
+        # setup_new_db only imports over an existing database
+        open(metrics.db_name, 'a').close()
+        metrics.setup_new_db(filenames)
+        metrics.generate_metrics()
+        metrics.dump_all_data()
+
+    return run_all, instrumentation
+
+
+def fuzzy_stage(files, fuzzy_rows):
+    """Get the duplicate member search.
+
+    :files: dict returned by synthetic_exports.write_all
+    :fuzzy_rows: number of members to compare
+    :returns: function
+    """
+    import cleaning
+
+    with open(files["active"], 'r', newline='') as csvfile:
+        members = [row for row, _ in zip(csv.DictReader(csvfile),
+                                         range(fuzzy_rows))]
+    return lambda: cleaning.suggest_duplicates(members)
+
+
+def confmaster_stage(files):
+    """Get the check of the Confmaster authors against the registrations.
+
+    :files: dict returned by synthetic_exports.write_all
+    :returns: function
+    """
+    import check_confmaster_registrations
+
+    return lambda: check_confmaster_registrations.check_user_registration(
+        files["submissions"], files["users"], files["receipts"])
+
+
+def gallery_stage(files):
+    """Get the gallery build, for one poster per submission.
+
+    :files: dict returned by synthetic_exports.write_all
+    :returns: function
+    """
+    gallery = load_script("poster-gallery/make-html-gallery.py",
+                          "make_html_gallery")
+    submissions = gallery.read_submissions(files["submissions"])
+    manifest = {}
+    for i, poster in enumerate(sorted(submissions)):
+        # Mostly portrait A0 posters, some landscape
+        width, height = (600, 424) if i % 5 == 0 else (424, 600)
+        manifest[poster] = {
+            "source": poster + ".pdf", "thumbnail": "thumbnail-{}.png".format(poster),
+            "width": width, "height": height,
+            "variants": [{"file": "thumbnail-{}-300w.{}".format(poster, fmt),
+                          "format": fmt, "width": 300,
+                          "height": height * 300 // width}
+                         for fmt in ["png", "webp"]]}
+    posters = gallery.natsorted(manifest)
+
+    def build():
+        gallery.write_index(gallery.build_index(posters, submissions,
+                                                gallery.URL_p))
+        gallery.write_pages(manifest, posters, 100, ".", submissions)
+        gallery.render_gallery(manifest, posters, submissions)
+
+    return build
+
+
+def run(rows, selected, noise=0.05, seed=0, fuzzy_rows=500):
+    """Time the selected stages on synthetic exports of the given size.
+
+    :rows: number of rows of each export
+    :selected: names of the stages to run
+    :noise: probability of each kind of noise in a row
+    :seed: random seed
+    :fuzzy_rows: number of members compared by the fuzzy stage
+    :returns: dict of stage name to dict with seconds, and for metrics the
+        records of its own stages
+    """
+    timings = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            start = time.perf_counter()
+            files = synthetic_exports.write_all(rows, noise, seed, tmpdir)
+            timings["generate"] = {
+                "seconds": round(time.perf_counter() - start, 3)}
+
+            functions = {}
+            instrumentation = None
+            if "metrics" in selected:
+                functions["metrics"], instrumentation = metrics_stage(files)
+            if "fuzzy" in selected:
+                functions["fuzzy"] = fuzzy_stage(files, fuzzy_rows)
+            if "confmaster" in selected:
+                functions["confmaster"] = confmaster_stage(files)
+            if "gallery" in selected:
+                functions["gallery"] = gallery_stage(files)
+
+            for stage in [s for s in stages if s in selected]:
+                with open(os.devnull, 'w') as devnull, \
+                        contextlib.redirect_stdout(devnull):
+                    start = time.perf_counter()
+                    functions[stage]()
+                    seconds = time.perf_counter() - start
+                timings[stage] = {"seconds": round(seconds, 3)}
+                if stage == "metrics":
+                    timings[stage]["stages"] = instrumentation.report()[
+                        "stages"]
+                print("{} rows, {}: {:.2f}s".format(rows, stage, seconds),
+                      file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+    return timings
+
+
+def save_results(runs, filename=results_fn):
+    """Append the results of this run to the results file.
+
+    :runs: dict of number of rows to timings
+    :filename: results file
+    :returns: nothing
+    """
+    results = []
+    if os.path.isfile(filename):
+        with open(filename, 'r') as fh:
+            results = json.load(fh)
+    results.extend(runs)
+    with open(filename, 'w') as fh:
+        json.dump(results, fh, indent=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the scripts on synthetic exports")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000],
+                        help="numbers of rows to run the benchmarks with")
+    parser.add_argument("--stages", nargs="+", choices=stages, default=stages,
+                        help="stages to time")
+    parser.add_argument("--noise", type=float, default=0.05,
+                        help="probability of each kind of noise in a row")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--fuzzy-rows", type=int, default=500,
+                        help="number of members compared by the fuzzy stage")
+    parser.add_argument("--output", default=results_fn,
+                        help="file to append the results to")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    runs = []
+    for rows in args.rows:
+        runs.append({
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "rows": rows, "noise": args.noise, "seed": args.seed,
+            "fuzzy_rows": min(rows, args.fuzzy_rows),
+            "stages": run(rows, args.stages, args.noise, args.seed,
+                          args.fuzzy_rows)})
+    save_results(runs, output)
+    print("Results appended to {}".format(output), file=sys.stderr)
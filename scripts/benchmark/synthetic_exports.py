@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic Memberclicks and Confmaster exports for benchmarking.
+
+Real member data cannot be shared, so the scripts in this repository can only
+be timed on exports that look like the real ones. The following files are
+written, with the columns the scripts read:
+
+- profiles.csv: registration profile export
+- receipts.csv: registration receipts export
+- add-to-registration.csv: add to registration receipts export
+- add-extras.csv: add extras (banquet tickets, t-shirts) receipts export
+- active.csv, inactive.csv: active and inactive member exports
+- submissions.csv, users.csv: Confmaster submission and user exports
+
+The data is noisy like the real exports, with the given probability for each
+row:
+
+- typos in names and institutions
+- mojibake: UTF-8 names that were decoded as Latin-1 somewhere on the way
+- duplicates: the same person again, with a typo in the name and another
+  e-mail address
+- accented names are always mixed in
+
+The same seed always gives the same files. Rows are written as they are
+generated, so that a million rows do not need to fit in memory.
+
+Usage:
+
+    synthetic_exports.py [--rows 10000] [--noise 0.05] [--seed 0] [--output-dir .]
+
+File: synthetic_exports.py
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import unicodedata
+from datetime import datetime, timedelta
+
+
+first_names = ["Anna", "Ben", "Chen", "David", "Elena", "Fatima", "Georg",
+               "Hiroshi", "Ines", "Jan", "Kavya", "Lucas", "Maria", "Nikolai",
+               "Olga", "Pedro", "Qi", "Rosa", "Sven", "Tariq", "Uma",
+               "Viktor", "Wei", "Yusuf", "Zoe"]
+accented_first_names = ["José", "Zoë", "Łukasz", "Anaïs", "Søren", "Björn",
+                        "Ramón", "Hélène", "Jürgen", "Iñaki"]
+last_names = ["Smith", "Garcia", "Wang", "Kumar", "Novak", "Schmidt",
+              "Rossi", "Tanaka", "Kowalski", "Silva", "Brown", "Ivanova",
+              "Nguyen", "Okafor", "Larsen", "Dubois", "Cohen", "Ahmed"]
+accented_last_names = ["Müller", "Núñez", "Sánchez", "Øster", "Çelik",
+                       "Dvořák", "Gómez", "Lefèvre", "Strauß", "Åberg"]
+institutions = ["University of Hertfordshire", "Université de Montréal",
+                "ETH Zürich", "Karolinska Institutet", "Universidad de Chile",
+                "University of Tokyo", "Max Planck Institute", "Imperial College",
+                "Indian Institute of Science", "Universität Wien"]
+countries = ["United Kingdom", "Canada", "Switzerland", "Sweden", "Chile",
+             "Japan", "Germany", "United States", "India", "Austria"]
+cities = ["Hatfield", "Montréal", "Zürich", "Stockholm", "Santiago", "Tokyo",
+          "Göttingen", "Boston", "Bangalore", "Wien"]
+domains = ["example.org", "example.edu", "example.ac.uk", "example.de"]
+groups = ["Faculty", "Postdoc", "Student", "Board"]
+keywords = ["Neural coding", "Synaptic plasticity", "Network dynamics",
+            "Dendrites", "Oscillations", "Learning", "Simulation tools",
+            "Sensory processing", "Motor control", "Decision making"]
+registrations = ["Main Meeting", "Main Meeting, Tutorial",
+                 "Main Meeting, Workshops", "Main Meeting, Tutorial, Workshops",
+                 "Workshops", "Tutorial"]
+special_meals = ["None", "", "Vegetarian", "Vegan", "Gluten free"]
+date_format = '%m/%d/%Y %H:%M:%S'
+accented_fraction = 0.2
+
+reg_fee_columns = ["Reg Fee (Non-Member)", "Reg Fee (Faculty)",
+                   "Reg Fee (Postdoc)", "Reg Fee (Student)", "Reg Fee (Board)"]
+extras_columns = ["BanquetTickets", "ExtraBanquetTickets", "Special Meal",
+                  "Shirt S", "Shirt M", "Shirt L", "Shirt XL"]
+profile_columns = ["Username", "Email", "Contact Name", "First Name",
+                   "Middle Name", "Last Name", "Gender", "Institution",
+                   "Country"]
+receipt_columns = (["Email", "First Name", "Middle Name", "Last Name",
+                    "Gender", "Institution", "Country", "Invitation Letter",
+                    "Registration Type"] + reg_fee_columns + extras_columns +
+                   ["Payment Type", "Payment Total", "Balance",
+                    "Discount Code", "Submit Date"])
+add_to_registration_columns = (["Email", "First Name", "Last Name"] +
+                               reg_fee_columns +
+                               ["Payment Total", "Discount Code",
+                                "Submit Date"])
+add_extras_columns = (["Email", "First Name", "Last Name"] + extras_columns +
+                      ["Payment Total", "Submit Date"])
+member_columns = ["Username", "Email", "Contact Name", "First Name",
+                  "Last Name", "Gender", "Salutation", "Group",
+                  "Created On Date", "Institution", "City", "Country"]
+user_columns = ["UserID", "First Name", "Last Name", "Affiliation 1",
+                "Country", "email"]
+submission_columns = ["PaperID", "Label", "Authors", "ContactAuthor",
+                      "Keywords", "Title"]
+
+filenames = {"profiles": "profiles.csv",
+             "receipts": "receipts.csv",
+             "add_to_registration": "add-to-registration.csv",
+             "add_extras": "add-extras.csv",
+             "active": "active.csv",
+             "inactive": "inactive.csv",
+             "submissions": "submissions.csv",
+             "users": "users.csv"}
+
+
+def typo(text, rng):
+    """Swap, drop or repeat a character.
+
+    :text: string
+    :rng: random.Random
+    :returns: string with a typo
+    """
+    if len(text) < 3:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    kind = rng.randrange(3)
+    if kind == 0:
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    if kind == 1:
+        return text[:i] + text[i + 1:]
+    return text[:i] + text[i] + text[i:]
+
+
+def mojibake(text):
+    """Garble non ASCII characters like the Memberclicks exports do.
+
+    :text: string
+    :returns: string
+    """
+    return text.encode("utf-8").decode("latin-1")
+
+
+def make_person(i, rng, noise):
+    """Make up a person.
+
+    :i: number of the person, used to keep usernames and e-mails unique
+    :rng: random.Random
+    :noise: probability of each kind of noise
+    :returns: dict
+    """
+    first = rng.choice(accented_first_names if rng.random() < accented_fraction
+                       else first_names)
+    last = rng.choice(accented_last_names if rng.random() < accented_fraction
+                      else last_names)
+    email = "{}.{}{}@{}".format(first, last, i, rng.choice(domains)).lower()
+    email = unicodedata.normalize("NFKD", email).encode("ascii", "ignore"
+                                                         ).decode("ascii")
+    institution = rng.choice(institutions)
+    if rng.random() < noise:
+        first = typo(first, rng)
+    if rng.random() < noise:
+        institution = typo(institution, rng)
+    if rng.random() < noise:
+        first, last, institution = (mojibake(first), mojibake(last),
+                                    mojibake(institution))
+    place = rng.randrange(len(countries))
+    gender = rng.choice(["Male", "Female", "Other", ""])
+    return {
+        "Username": "user{}".format(i),
+        "Email": email,
+        "First Name": first,
+        "Middle Name": rng.choice(["", "", "", "J.", "M."]),
+        "Last Name": last,
+        "Contact Name": "{} {}".format(first, last),
+        "Gender": gender,
+        "Salutation": {"Male": "Mr.", "Female": "Ms."}.get(gender, "Dr."),
+        "Group": rng.choice(groups),
+        "Institution": institution,
+        "City": cities[place],
+        "Country": countries[place],
+    }
+
+
+def duplicate(person, i, rng):
+    """Make a near duplicate of a person, as when they make a second profile.
+
+    :person: dict returned by make_person
+    :i: number of the duplicate, used to keep usernames and e-mails unique
+    :rng: random.Random
+    :returns: dict
+    """
+    dup = dict(person)
+    dup["Username"] = "user{}".format(i)
+    dup["Last Name"] = typo(person["Last Name"], rng)
+    dup["Contact Name"] = "{} {}".format(dup["First Name"], dup["Last Name"])
+    dup["Email"] = "{}{}@gmail.example.com".format(
+        person["Email"].split("@")[0], i)
+    return dup
+
+
+def people(rows, noise, rng):
+    """Generate people, with near duplicates.
+
+    :rows: number of people to generate, including the duplicates
+    :noise: probability of each kind of noise
+    :rng: random.Random
+    :returns: generator of dicts
+    """
+    i = 0
+    while i < rows:
+        person = make_person(i, rng, noise)
+        yield person
+        i += 1
+        if i < rows and rng.random() < noise:
+            yield duplicate(person, i, rng)
+            i += 1
+
+
+def submit_date(rng, start=datetime(2019, 2, 1)):
+    """Pick a submit date during the registration period."""
+    return (start + timedelta(seconds=rng.randrange(120 * 24 * 3600))
+            ).strftime(date_format)
+
+
+def registration_fees(group, rng):
+    """Get the registration fee columns of a receipt.
+
+    :group: member group, or None for non members
+    :rng: random.Random
+    :returns: dict
+    """
+    fees = {c: "" for c in reg_fee_columns}
+    column = ("Reg Fee (Non-Member)" if group is None
+              else "Reg Fee ({})".format(group))
+    fees[column] = rng.choice(registrations)
+    return fees
+
+
+def extras(rng):
+    """Get the banquet ticket and t-shirt columns of a receipt."""
+    row = {c: str(rng.choice([0, 0, 0, 1])) for c in extras_columns}
+    row["BanquetTickets"] = str(rng.choice([0, 1, 1]))
+    row["Special Meal"] = rng.choice(special_meals)
+    return row
+
+
+def open_writers(output_dir, names):
+    """Open csv writers for some of the exports.
+
+    :output_dir: directory to write to
+    :names: dict of key in filenames to column list
+    :returns: (dict of key to csv.DictWriter, list of open files)
+    """
+    writers = {}
+    handles = []
+    for key, columns in names.items():
+        fh = open(os.path.join(output_dir, filenames[key]), 'w', newline='')
+        handles.append(fh)
+        writers[key] = csv.DictWriter(fh, fieldnames=columns,
+                                      extrasaction='ignore')
+        writers[key].writeheader()
+    return writers, handles
+
+
+def write_registration_exports(rows, noise, seed, output_dir="."):
+    """Write the profile, receipt, add to registration and add extras exports.
+
+    :rows: number of registrants
+    :noise: probability of each kind of noise
+    :seed: random seed
+    :output_dir: directory to write to
+    :returns: nothing
+    """
+    rng = random.Random(seed)
+    writers, handles = open_writers(output_dir, {
+        "profiles": profile_columns,
+        "receipts": receipt_columns,
+        "add_to_registration": add_to_registration_columns,
+        "add_extras": add_extras_columns})
+    try:
+        for person in people(rows, noise, rng):
+            writers["profiles"].writerow(person)
+
+            member = rng.random() < 0.6
+            receipt = dict(person)
+            receipt.update(registration_fees(
+                person["Group"] if member else None, rng))
+            receipt.update(extras(rng))
+            receipt.update({
+                "Invitation Letter": rng.choice(["Yes", "No", "No", "No"]),
+                "Registration Type": "" if member else person["Group"],
+                "Payment Type": rng.choice(["Credit Card", "Check", "Wire"]),
+                "Payment Total": "{:.2f}".format(rng.choice([150, 300, 450])),
+                "Balance": "0.00",
+                "Discount Code": rng.choice(["None", "", "", "SPEAKER"]),
+                "Submit Date": submit_date(rng)})
+            writers["receipts"].writerow(receipt)
+
+            # Only people who registered can add to their registrations
+            if rng.random() < 0.1:
+                added = dict(person)
+                added.update(registration_fees(
+                    person["Group"] if member else None, rng))
+                added.update({"Payment Total": "50.00", "Discount Code": "",
+                              "Submit Date": submit_date(rng)})
+                writers["add_to_registration"].writerow(added)
+            if rng.random() < 0.1:
+                added = dict(person)
+                added.update(extras(rng))
+                added.update({"Payment Total": "25.00",
+                              "Submit Date": submit_date(rng)})
+                writers["add_extras"].writerow(added)
+    finally:
+        for fh in handles:
+            fh.close()
+
+
+def write_member_exports(rows, noise, seed, output_dir="."):
+    """Write the active and inactive member exports.
+
+    :rows: total number of members
+    :noise: probability of each kind of noise
+    :seed: random seed
+    :output_dir: directory to write to
+    :returns: nothing
+    """
+    rng = random.Random(seed + 1)
+    writers, handles = open_writers(output_dir, {"active": member_columns,
+                                                 "inactive": member_columns})
+    try:
+        for person in people(rows, noise, rng):
+            member = dict(person)
+            member["Group"] = person["Group"] + " Member"
+            member["Created On Date"] = (
+                datetime(2008, 1, 1) +
+                timedelta(seconds=rng.randrange(12 * 365 * 24 * 3600))
+            ).strftime(date_format)
+            writers["active" if rng.random() < 0.7 else "inactive"].writerow(
+                member)
+    finally:
+        for fh in handles:
+            fh.close()
+
+
+def write_confmaster_exports(rows, noise, seed, output_dir="."):
+    """Write the Confmaster submission and user exports.
+
+    The users are the registrants of write_registration_exports with the same
+    seed, so that most first authors are registered, plus users who did not
+    register. There is one submission for every four users.
+
+    :rows: number of users
+    :noise: probability of each kind of noise
+    :seed: random seed
+    :output_dir: directory to write to
+    :returns: nothing
+    """
+    rng = random.Random(seed + 2)
+    writers, handles = open_writers(output_dir, {"users": user_columns,
+                                                 "submissions":
+                                                 submission_columns})
+    try:
+        registrants = people(rows, noise, random.Random(seed))
+        users = []
+        for userid, person in enumerate(registrants, start=1):
+            if rng.random() < 0.1:
+                # Not registered
+                person = make_person(rows + userid, rng, noise)
+            writers["users"].writerow({
+                "UserID": userid, "First Name": person["First Name"],
+                "Last Name": person["Last Name"],
+                "Affiliation 1": person["Institution"],
+                "Country": person["Country"], "email": person["Email"]})
+            users.append("{} {} (#{})".format(person["First Name"],
+                                              person["Last Name"], userid))
+            if len(users) == 4:
+                rng.shuffle(users)
+                paperid = userid // 4
+                writers["submissions"].writerow({
+                    "PaperID": paperid, "Label": "P{}".format(paperid),
+                    "Authors": ", ".join(users), "ContactAuthor": users[0],
+                    "Keywords": ", ".join(rng.sample(keywords, 3)),
+                    "Title": "{} in a model of {}".format(
+                        rng.choice(keywords), rng.choice(keywords).lower())})
+                users = []
+    finally:
+        for fh in handles:
+            fh.close()
+
+
+def write_all(rows, noise=0.05, seed=0, output_dir="."):
+    """Write all synthetic exports.
+
+    :rows: number of rows of each export
+    :noise: probability of each kind of noise
+    :seed: random seed
+    :output_dir: directory to write to
+    :returns: dict of key to file path
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    write_registration_exports(rows, noise, seed, output_dir)
+    write_member_exports(rows, noise, seed, output_dir)
+    write_confmaster_exports(rows, noise, seed, output_dir)
+    return {key: os.path.join(output_dir, fname)
+            for key, fname in filenames.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic Memberclicks and Confmaster exports")
+    parser.add_argument("--rows", type=int, default=10000,
+                        help="number of rows of each export")
+    parser.add_argument("--noise", type=float, default=0.05,
+                        help="probability of each kind of noise in a row")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--output-dir", default=".",
+                        help="directory to write the exports to")
+    args = parser.parse_args()
+
+    for key, path in write_all(args.rows, args.noise, args.seed,
+                               args.output_dir).items():
+        print("Wrote {}".format(path), file=sys.stderr)
@@ -1,7 +1,14 @@
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+"""
+Clean up the character encoding issues in the Memberclicks member exports.
+
+The same clean up is applied by member_store.py when loading the exports into
+the member store.
+
+File: cleaning.py
+"""
 import csv
-import sys
-import time
 
 
 
@@ -11,10 +18,38 @@ clean_inactive_csv = 'inactive_clean.csv'
 clean_active_csv   = 'active_clean.csv'
 duplicate_thresh   = 1.5
 
+# Replacements are applied in this order
+replacements = [("¿", ""),
+                ("â", ""),
+                ("é", ""),
+                ("®", "é"),
+                ("Ã¶", "ö"),
+                ('©', ""),
+                ('ñ', "ä"),
+                ('í', "i")]
+
+
+def clean_row(row, fieldnames):
+    """Fix the encoding issues in all fields of a row, in place.
+
+    :row: dict as returned by csv.DictReader
+    :fieldnames: fields to clean
+    :returns: the cleaned row
+    """
+    for field in fieldnames:
+        for old, new in replacements:
+            row[field] = row[field].replace(old, new)
+
+        if field == 'Contact Name':
+            row[field] = row[field].title()
+
+    return row
+
+
 def suggest_duplicates(all_rows, criteria=duplicate_thresh):
     from difflib import SequenceMatcher
     duplicates = []
-    print "Looking for duplicates..."
+    print("Looking for duplicates...")
 
     for count, user in enumerate(all_rows):
         ratios       = []
@@ -28,38 +63,39 @@ def suggest_duplicates(all_rows, criteria=duplicate_thresh):
                 ratios += [user]
 
         if len(ratios) > 0:
-            print "User %s may be duplicated with: %s" %(contact_name, [user['Contact Name'] for user in ratios])
+            print("User %s may be duplicated with: %s" %(contact_name, [user['Contact Name'] for user in ratios]))
             duplicates += [contact_name]
 
     return duplicates
 
 
-with open(inactive_csv, 'rb') as csvfile:
-    
-    reader      = csv.DictReader(csvfile, delimiter=',', quotechar='"')
-    output_file = open(clean_inactive_csv, 'w')
-    writer      = csv.DictWriter(output_file, fieldnames=reader.fieldnames, delimiter=',', quotechar='"')
-    writer.writeheader()
-    users       = []
+def clean_export(input_csv, output_csv):
+    """Write a cleaned copy of a member export.
 
-    for row in reader:
-        for field in reader.fieldnames:
-            row[field] = row[field].replace("¿", "")
-            row[field] = row[field].replace("â", "")
-            row[field] = row[field].replace("é", "")
-            row[field] = row[field].replace("®", "é")
-            row[field] = row[field].replace("Ã¶", "ö")
-            row[field] = row[field].replace('©', "")
-            row[field] = row[field].replace('ñ', "ä")
-            row[field] = row[field].replace('í', "i")
+    :input_csv: export to clean
+    :output_csv: file to write the cleaned export to
+    :returns: list of cleaned rows
+    """
+    with open(input_csv, 'r', newline='') as csvfile:
 
-            if field == 'Contact Name':
-                row[field] = row[field].title()
+        reader      = csv.DictReader(csvfile, delimiter=',', quotechar='"')
+        output_file = open(output_csv, 'w', newline='')
+        writer      = csv.DictWriter(output_file, fieldnames=reader.fieldnames, delimiter=',', quotechar='"')
+        writer.writeheader()
+        users       = []
 
-        writer.writerow(row)
-        users += [row]
+        for row in reader:
+            clean_row(row, reader.fieldnames)
+            writer.writerow(row)
+            users += [row]
 
-    output_file.close()
+        output_file.close()
+
+    return users
+
+
+if __name__ == "__main__":
+    users = clean_export(inactive_csv, clean_inactive_csv)
 
     # duplicates = suggest_duplicates(users)
     # f = open('inactive_duplicates.txt', 'w')
@@ -67,34 +103,7 @@ with open(inactive_csv, 'rb') as csvfile:
     #     f.write('%s\n' %user)
     # f.close()
 
-
-with open(active_csv, 'rb') as csvfile:
-    
-    reader      = csv.DictReader(csvfile, delimiter=',', quotechar='"')
-    output_file = open(clean_active_csv, 'w')
-    writer      = csv.DictWriter(output_file, fieldnames=reader.fieldnames, delimiter=',', quotechar='"')
-    writer.writeheader()
-    users       = []
-
-    for row in reader:
-        for field in reader.fieldnames:
-            row[field] = row[field].replace("¿", "")
-            row[field] = row[field].replace("â", "")
-            row[field] = row[field].replace("é", "")
-            row[field] = row[field].replace("®", "é")
-            row[field] = row[field].replace("Ã¶", "ö")
-            row[field] = row[field].replace('©', "")
-            row[field] = row[field].replace('ñ', "ä")
-            row[field] = row[field].replace('í', "i")
-
-
-            if field == 'Contact Name':
-                row[field] = row[field].title()
-
-        writer.writerow(row)
-        users += [row]
-
-    output_file.close()
+    users = clean_export(active_csv, clean_active_csv)
 
     # duplicates = suggest_duplicates(users)
     # f = open('active_duplicates.txt', 'w')
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Shared store for the Memberclicks active and inactive member exports.
+
+Each pair of exports is loaded once into an indexed sqlite database, and the
+other scripts query the database instead of parsing the csv files again.
+
+The following tables are created:
+
+- snapshots: one row per loaded pair of exports
+- members: current state of every profile, keyed by "Username", with indexes
+  on the lower-cased e-mail, the normalised name, and the group
+- member_history: one row each time a profile is added, changes, or
+  disappears from the exports, so that status changes can be computed
+  without re-reading old exports
+
+Loading is incremental: profiles whose data has not changed since the last
+snapshot are not rewritten. With --clean, the encoding fixes from cleaning.py
+are applied to the exports while loading them.
+
+Usage: member_store.py [--clean] active.csv inactive.csv [snapshot date]
+
+File: member_store.py
+"""
+
+import csv
+import hashlib
+import json
+import sqlite3
+import sys
+import unicodedata
+from datetime import date
+
+from cleaning import clean_row
+
+
+store_db = "members.sqlite"
+statuses = ["active", "inactive"]
+# Columns that get their own column in the store, the complete row is also
+# kept as JSON in "data"
+columns = ["Email", "First Name", "Last Name", "Gender", "Salutation", "Group",
+           "Created On Date", "Institution", "City", "Country"]
+
+
+def normalise_name(last_name, first_name):
+    """Normalise a name for matching.
+
+    Accents are removed, and case and white space are ignored.
+
+    :last_name: last name
+    :first_name: first name
+    :returns: normalised "last first" string
+    """
+    name = "{} {}".format(last_name, first_name)
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(name.casefold().split())
+
+
+def get_conn(db_name=store_db):
+    """Connect to the store, creating the tables if required.
+
+    :db_name: name of the sqlite database
+    :returns: connection to the db
+    """
+    conn = sqlite3.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    quoted = ",\n".join('"{}" TEXT'.format(c) for c in columns)
+    conn.executescript(
+        """\
+        CREATE TABLE IF NOT EXISTS snapshots (
+        "id" INTEGER PRIMARY KEY,
+        "taken" TEXT
+        );
+        CREATE TABLE IF NOT EXISTS members (
+        "Username" TEXT PRIMARY KEY,
+        "status" TEXT,
+        "email_key" TEXT,
+        "name_key" TEXT,
+        {},
+        "data" TEXT,
+        "row_hash" TEXT,
+        "snapshot" INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS members_email ON members ("email_key");
+        CREATE INDEX IF NOT EXISTS members_name ON members ("name_key");
+        CREATE INDEX IF NOT EXISTS members_group ON members ("Group");
+        CREATE TABLE IF NOT EXISTS member_history (
+        "Username" TEXT,
+        "snapshot" INTEGER,
+        "status" TEXT,
+        "Group" TEXT,
+        "row_hash" TEXT
+        );
+        CREATE INDEX IF NOT EXISTS member_history_user
+            ON member_history ("Username", "snapshot");
+        """.format(quoted))
+    return conn
+
+
+def read_export(filename, clean=False):
+    """Read a member export.
+
+    :filename: csv export
+    :clean: apply the encoding fixes from cleaning.py
+    :returns: generator of rows
+    """
+    with open(filename, 'r', newline='') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
+        for row in reader:
+            yield clean_row(row, reader.fieldnames) if clean else row
+
+
+def load_snapshot(conn, active_csv, inactive_csv, taken=None, clean=False):
+    """Load a pair of exports into the store.
+
+    Only profiles that are new or have changed are written. Profiles that are
+    in neither export are marked as "removed".
+
+    :conn: connection to the store
+    :active_csv: export of active members
+    :inactive_csv: export of inactive members
+    :taken: date of the exports, defaults to today
+    :clean: apply the encoding fixes from cleaning.py
+    :returns: dict with the number of added, changed, and removed profiles
+    """
+    taken = taken or date.today().isoformat()
+    known = {row["Username"]: (row["status"], row["row_hash"]) for row in
+             conn.execute('SELECT "Username", "status", "row_hash" FROM members')}
+    seen = set()
+    changes = {"added": 0, "changed": 0, "removed": 0}
+
+    upsert = 'INSERT OR REPLACE INTO members VALUES ({})'.format(
+        ", ".join(["?"] * (len(columns) + 7)))
+    history = 'INSERT INTO member_history VALUES (?, ?, ?, ?, ?)'
+
+    with conn:
+        snapshot = conn.execute('INSERT INTO snapshots ("taken") VALUES (?)',
+                                (taken,)).lastrowid
+
+        for status, filename in zip(statuses, [active_csv, inactive_csv]):
+            for row in read_export(filename, clean):
+                username = row["Username"]
+                seen.add(username)
+                data = json.dumps(row, sort_keys=True)
+                row_hash = hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+                if known.get(username) == (status, row_hash):
+                    continue
+                changes["changed" if username in known else "added"] += 1
+
+                conn.execute(upsert, [
+                    username, status, row["Email"].strip().lower(),
+                    normalise_name(row["Last Name"], row["First Name"])] +
+                    [row.get(c, "") for c in columns] +
+                    [data, row_hash, snapshot])
+                conn.execute(history, (username, snapshot, status,
+                                       row["Group"], row_hash))
+
+        for username, (status, row_hash) in known.items():
+            if username not in seen and status != "removed":
+                changes["removed"] += 1
+                conn.execute('UPDATE members SET "status" = ?, "snapshot" = ? '
+                             'WHERE "Username" = ?',
+                             ("removed", snapshot, username))
+                conn.execute(history, (username, snapshot, "removed", None,
+                                       row_hash))
+
+    return changes
+
+
+def find_by_email(conn, email):
+    """Get profiles with the given e-mail address.
+
+    :conn: connection to the store
+    :email: e-mail address, case is ignored
+    :returns: list of rows
+    """
+    return conn.execute('SELECT * FROM members WHERE "email_key" = ?',
+                        (email.strip().lower(),)).fetchall()
+
+
+def find_by_name(conn, last_name, first_name):
+    """Get profiles with the given name.
+
+    :conn: connection to the store
+    :last_name: last name
+    :first_name: first name
+    :returns: list of rows
+    """
+    return conn.execute('SELECT * FROM members WHERE "name_key" = ?',
+                        (normalise_name(last_name, first_name),)).fetchall()
+
+
+def status_changes(conn, since):
+    """Get the profiles whose status or group changed after a snapshot.
+
+    :conn: connection to the store
+    :since: id of the snapshot to compare against
+    :returns: list of (Username, old status, old group, new status, new group)
+    """
+    query = """\
+        SELECT h."Username", old."status", old."Group", h."status", h."Group"
+        FROM member_history h
+        LEFT JOIN member_history old ON old."Username" = h."Username"
+            AND old."snapshot" = (
+                SELECT MAX("snapshot") FROM member_history
+                WHERE "Username" = h."Username" AND "snapshot" <= ?)
+        WHERE h."snapshot" = (
+            SELECT MAX("snapshot") FROM member_history
+            WHERE "Username" = h."Username")
+        AND h."snapshot" > ?
+        AND (old."status" IS NOT h."status" OR old."Group" IS NOT h."Group")
+        """
+    return [tuple(row) for row in conn.execute(query, (since, since))]
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--clean"]
+    if len(args) not in [2, 3]:
+        print("Usage: {} [--clean] active.csv inactive.csv [snapshot date]".format(
+            sys.argv[0]), file=sys.stderr)
+        sys.exit(-1)
+
+    conn = get_conn()
+    changes = load_snapshot(conn, args[0], args[1],
+                            args[2] if len(args) == 3 else None,
+                            "--clean" in sys.argv)
+    print("Loaded snapshot into {}: {}".format(store_db, changes))
+    conn.close()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Send the status update reminders to the profiles flagged by update_status.py.
+
+The messages are rendered from status-update-email.txt for every row of
+active_update.csv and inactive_update.csv, and written to a local outbox
+(mbox, or Maildir with --maildir) so that they can be checked before anything
+is sent:
+
+    notify_status.py render --sender "OCNS <address>" [--maildir] \
+        [--campaign 2019-06]
+
+Each message gets a Message-ID derived from the campaign, its recipient and
+its update file, so rendering again only adds the messages of the campaign
+that are not in the outbox yet. update_status.py always writes the same
+update files, so the campaign defaults to a hash of their contents: a new
+run of update_status.py that flags other profiles, or the same ones later
+on, is a new campaign, and everyone flagged in it is reminded again.
+
+The outbox can then be sent. All messages go through one SMTP connection,
+which is re-opened only if the server drops it, at no more than --rate
+messages per second. Message-IDs of sent messages are recorded in sent.txt so
+that an interrupted run can be resumed without sending duplicates. A message
+that the server refuses is reported and skipped, and is tried again on the
+next run. If the connection cannot be opened, or the login fails, sending
+stops and the error is reported:
+
+    notify_status.py send [--maildir] [--host localhost] [--port 25] [--rate 5]
+
+To test, run a local debugging SMTP server first, for example:
+
+    python3 -m aiosmtpd -n -l localhost:1025
+
+and send with --host localhost --port 1025.
+
+File: notify_status.py
+"""
+
+import argparse
+import csv
+import getpass
+import hashlib
+import mailbox
+import os
+import re
+import smtplib
+import sys
+import time
+from email.message import EmailMessage
+from email.utils import formatdate, parseaddr
+from string import Template
+
+
+update_active_csv = "active_update.csv"
+update_inactive_csv = "inactive_update.csv"
+template_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "status-update-email.txt")
+outbox_mbox = "outbox.mbox"
+outbox_maildir = "outbox"
+sent_log = "sent.txt"
+subject = "Please confirm your OCNS member type"
+
+
+def read_template(filename=template_file):
+    """Read and compile the message template.
+
+    :filename: template file, using $placeholders
+    :returns: string.Template
+    """
+    with open(filename, 'r') as fh:
+        return Template(fh.read())
+
+
+def default_campaign(filenames):
+    """Get the campaign key of a set of update files.
+
+    :filenames: update files written by update_status.py
+    :returns: first 12 hex digits of the sha256 of their contents
+    """
+    digest = hashlib.sha256()
+    for filename in filenames:
+        with open(filename, 'rb') as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()[:12]
+
+
+def message_id(campaign, recipient, filename, sender):
+    """Get the Message-ID of the reminder of a recipient.
+
+    The same campaign, recipient and update file always give the same
+    Message-ID.
+
+    :campaign: campaign key
+    :recipient: e-mail of the recipient
+    :filename: update file the recipient was flagged in
+    :sender: From address, whose domain is used
+    :returns: Message-ID
+    """
+    digest = hashlib.sha256("{}\n{}\n{}".format(
+        campaign, os.path.basename(filename),
+        recipient).encode("utf-8")).hexdigest()
+    domain = parseaddr(sender)[1].rpartition("@")[2] or "localhost"
+    return "<status-update.{}.{}@{}>".format(campaign, digest[:32], domain)
+
+
+def render_messages(template, filenames, sender, campaign):
+    """Render one message per flagged profile.
+
+    The placeholders available in the template are the lower-cased column
+    names of the update files, with spaces replaced by underscores.
+
+    :template: compiled string.Template
+    :filenames: update files written by update_status.py
+    :sender: From address
+    :campaign: campaign key
+    :returns: generator of EmailMessage
+    """
+    for filename in filenames:
+        with open(filename, 'r', newline='') as csvfile:
+            reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
+            fields = {f: f.lower().replace(' ', '_') for f in reader.fieldnames}
+            for row in reader:
+                values = {fields[f]: v for f, v in row.items()}
+                values['group'] = values['group'].replace(' Member', '')
+
+                message = EmailMessage()
+                message['From'] = sender
+                message['To'] = row['Email']
+                message['Subject'] = subject
+                message['Date'] = formatdate(localtime=True)
+                message['Message-ID'] = message_id(campaign, row['Email'],
+                                                   filename, sender)
+                message.set_content(template.safe_substitute(values))
+                yield message
+
+
+def open_outbox(maildir=False):
+    """Open the local outbox.
+
+    :maildir: use a Maildir instead of an mbox file
+    :returns: mailbox.Mailbox
+    """
+    if maildir:
+        return mailbox.Maildir(outbox_maildir, create=True)
+    return mailbox.mbox(outbox_mbox)
+
+
+def write_outbox(messages, outbox):
+    """Add messages to the outbox in one locked write.
+
+    Messages whose Message-ID is already in the outbox are skipped.
+
+    :messages: iterable of EmailMessage
+    :outbox: mailbox.Mailbox
+    :returns: number of messages written
+    """
+    count = 0
+    outbox.lock()
+    try:
+        queued = set(m['Message-ID'] for m in outbox.itervalues())
+        for message in messages:
+            if message['Message-ID'] in queued:
+                continue
+            queued.add(message['Message-ID'])
+            outbox.add(message)
+            count += 1
+        outbox.flush()
+    finally:
+        outbox.unlock()
+    return count
+
+
+def read_sent_log():
+    """Get the Message-IDs that were already sent.
+
+    :returns: set of Message-IDs
+    """
+    try:
+        with open(sent_log, 'r') as fh:
+            return set(line.strip() for line in fh)
+    except FileNotFoundError:
+        return set()
+
+
+class SMTPConnection():
+
+    """A single SMTP connection that is re-used for all messages."""
+
+    def __init__(self, host, port, user=None, password=None, starttls=False):
+        """Initialise, the connection is opened on first use."""
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.smtp = None
+
+    def connect(self):
+        """Open the connection, logging in if a user is set."""
+        self.smtp = smtplib.SMTP(self.host, self.port)
+        if self.starttls:
+            self.smtp.starttls()
+        if self.user:
+            self.smtp.login(self.user, self.password)
+
+    def send(self, message):
+        """Send a message, reconnecting once if the server hung up."""
+        if self.smtp is None:
+            self.connect()
+        try:
+            self.smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self.connect()
+            self.smtp.send_message(message)
+
+    def close(self):
+        """Close the connection."""
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except smtplib.SMTPServerDisconnected:
+                pass
+            self.smtp = None
+
+
+def send_outbox(outbox, connection, rate):
+    """Send all messages in the outbox that have not been sent yet.
+
+    Messages the server refuses are reported and skipped. If the connection
+    cannot be opened or the login fails, the error is reported and sending
+    stops.
+
+    :outbox: mailbox.Mailbox
+    :connection: SMTPConnection
+    :rate: maximum number of messages per second
+    :returns: number of messages sent
+    """
+    sent = read_sent_log()
+    interval = 1.0 / rate
+    count = 0
+    last = 0.0
+
+    with open(sent_log, 'a') as log:
+        try:
+            for message in outbox.itervalues():
+                if message['Message-ID'] in sent:
+                    continue
+
+                wait = last + interval - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                last = time.monotonic()
+
+                try:
+                    connection.send(message)
+                except (smtplib.SMTPRecipientsRefused,
+                        smtplib.SMTPSenderRefused,
+                        smtplib.SMTPDataError) as e:
+                    print("ERROR: {}: {}".format(message['To'], e),
+                          file=sys.stderr)
+                    continue
+                except (smtplib.SMTPException, OSError) as e:
+                    # Login failed, or the server cannot be reached
+                    print("ERROR: stopped sending: {}".format(e),
+                          file=sys.stderr)
+                    break
+                print(message['Message-ID'], file=log, flush=True)
+                count += 1
+        finally:
+            connection.close()
+
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Send status update reminders to flagged members")
+    parser.add_argument("action", choices=["render", "send"])
+    parser.add_argument("--sender",
+                        help="From address of the messages, needed to render")
+    parser.add_argument("--campaign",
+                        help="campaign key of the messages rendered, defaults "
+                        "to a hash of the update files")
+    parser.add_argument("--maildir", action="store_true",
+                        help="use a Maildir outbox instead of an mbox file")
+    parser.add_argument("--host", default="localhost", help="SMTP server")
+    parser.add_argument("--port", type=int, default=25, help="SMTP port")
+    parser.add_argument("--user", help="SMTP user, the password is prompted")
+    parser.add_argument("--starttls", action="store_true",
+                        help="use STARTTLS")
+    parser.add_argument("--rate", type=float, default=5,
+                        help="maximum number of messages per second")
+    args = parser.parse_args()
+    if args.action == "render" and not args.sender:
+        parser.error("--sender is needed to render the messages")
+    if args.campaign and not re.fullmatch(r"[\w.-]+", args.campaign):
+        parser.error("--campaign may only have letters, digits, '.', '-' "
+                     "and '_'")
+
+    outbox = open_outbox(args.maildir)
+
+    if args.action == "render":
+        filenames = [update_active_csv, update_inactive_csv]
+        campaign = args.campaign or default_campaign(filenames)
+        messages = render_messages(read_template(), filenames, args.sender,
+                                   campaign)
+        print("Campaign {}".format(campaign))
+        print("Wrote {} messages to the outbox".format(
+            write_outbox(messages, outbox)))
+    else:
+        password = getpass.getpass() if args.user else None
+        connection = SMTPConnection(args.host, args.port, args.user, password,
+                                    args.starttls)
+        print("Sent {} messages".format(
+            send_outbox(outbox, connection, args.rate)), file=sys.stderr)
+
+    outbox.close()
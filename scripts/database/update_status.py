@@ -1,110 +1,120 @@
-# -*- coding: utf-8 -*-
-import csv
-import sys
-import time
+#!/usr/bin/env python3
+"""
+Find Student and Postdoc profiles that have not been updated for a number of
+years so that they can be asked to confirm their membership type.
 
+The active and inactive member exports are processed concurrently. For each
+export, the "Created On Date" column is parsed once, the elapsed years are
+computed for the whole column, and the per-group thresholds are applied as
+masks so that the selected rows can be written out in one go.
 
+If the path to the member store (see member_store.py) is given, the profiles
+are read from the store instead of the csv exports:
 
-active_csv          = 'active.csv'   #  All reciepts exported, e.g. Export-OCNS-Receipts-475-25-Jun-2015-05-35-34.csv
-inactive_csv        = 'inactive.csv'   #  Add to regs..
-update_inactive_csv = 'inactive_update.csv'
-update_active_csv   = 'active_update.csv'
-sutdent_threshold   = 5
-postdoc_threshold   = 5
-to_write            = ['Username', 'Elapsed Time', 'Email', 'First Name', 'Last Name', 'Gender', 'Salutation', 'Group']
+    update_status.py [members.sqlite]
 
-need_to_be_updated = {'Student' : 0, 'Postdoc' : 0}
+The flagged profiles can then be e-mailed using notify_status.py.
 
-with open(inactive_csv, 'rb') as csvfile:
-    
-    reader      = csv.DictReader(csvfile, delimiter=',', quotechar='"')
-    output_file = open(update_inactive_csv, 'w')
-    writer      = csv.DictWriter(output_file, fieldnames=to_write, delimiter=',', quotechar='"')
-    writer.writeheader()
-    users       = []
-
-    for row in reader:
+File: update_status.py
+"""
 
-        member_type = row['Group'].replace(' Member', '') 
-        date = time.strptime(row['Created On Date'], '%m/%d/%Y %H:%M:%S')
-        to_update = False
-    
-        time_diff = time.localtime().tm_year - date.tm_year
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-        if member_type == 'Student' and (time_diff >= sutdent_threshold):
-            to_update = True
-            need_to_be_updated['Student'] += 1
-        elif member_type == 'Postdoc' and (time_diff >= postdoc_threshold):
-            to_update = True
-            need_to_be_updated['Postdoc'] += 1
+import pandas as pd
 
-        if to_update:
-            data = {}
-            for item in to_write:
-                if item != 'Elapsed Time':
-                    data[item] = row[item]
 
-            data['Elapsed Time'] = time_diff
+active_csv          = 'active.csv'   #  All reciepts exported, e.g. Export-OCNS-Receipts-475-25-Jun-2015-05-35-34.csv
+inactive_csv        = 'inactive.csv'   #  Add to regs..
+update_inactive_csv = 'inactive_update.csv'
+update_active_csv   = 'active_update.csv'
+date_format         = '%m/%d/%Y %H:%M:%S'
+to_write            = ['Username', 'Elapsed Time', 'Email', 'First Name', 'Last Name', 'Gender', 'Salutation', 'Group']
 
-            writer.writerow(data)
+# Number of years after which a profile of the given member group should be
+# updated. Groups not listed here are never flagged.
+thresholds = {'Student' : 5,
+              'Postdoc' : 5}
 
-    output_file.close()
-    print "Inactive profiles that should be updated", need_to_be_updated
+# (label, input file, status in the member store, output file, whether the
+# threshold year itself counts)
+exports = [('Inactive', inactive_csv, 'inactive', update_inactive_csv, True),
+           ('Active', active_csv, 'active', update_active_csv, False)]
 
 
-need_to_be_updated = {'Student' : 0, 'Postdoc' : 0}
+def read_export(input_csv):
+    """Read a member export.
 
-with open(active_csv, 'rb') as csvfile:
-    
-    reader      = csv.DictReader(csvfile, delimiter=',', quotechar='"')
-    output_file = open(update_active_csv, 'w')
-    writer      = csv.DictWriter(output_file, fieldnames=to_write, delimiter=',', quotechar='"')
-    writer.writeheader()
-    users       = []
+    :input_csv: member export to read
+    :returns: pandas DataFrame with all columns as strings
+    """
+    return pd.read_csv(input_csv, dtype=str, keep_default_na=False)
 
-    for row in reader:
 
-        member_type = row['Group'].replace(' Member', '') 
-        date = time.strptime(row['Created On Date'], '%m/%d/%Y %H:%M:%S')
-        to_update = False
-    
-        time_diff = time.localtime().tm_year - date.tm_year
+def read_store(store, status):
+    """Read the profiles with the given status from the member store.
 
-        if member_type == 'Student' and (time_diff > sutdent_threshold):
-            to_update = True
-            need_to_be_updated['Student'] += 1
-        elif member_type == 'Postdoc' and (time_diff > postdoc_threshold):
-            to_update = True
-            need_to_be_updated['Postdoc'] += 1
+    :store: path to the member store database
+    :status: "active" or "inactive"
+    :returns: pandas DataFrame with the columns needed here
+    """
+    columns = ['Username', 'Created On Date'] + [c for c in to_write if c not in
+                                                 ['Username', 'Elapsed Time']]
+    query = 'SELECT {} FROM members WHERE "status" = ? ORDER BY "Username"'.format(
+        ", ".join('"{}"'.format(c) for c in columns))
+    conn = sqlite3.connect(store)
+    members = pd.read_sql_query(query, conn, params=(status,))
+    conn.close()
+    return members
 
-        if to_update:
-            data = {}
-            for item in to_write:
-                if item != 'Elapsed Time':
-                    data[item] = row[item]
 
-            data['Elapsed Time'] = time_diff
+def find_profiles_to_update(members, output_csv, inclusive,
+                            thresholds=thresholds):
+    """Write the profiles that exceed their group threshold.
 
-            writer.writerow(data)
+    :members: pandas DataFrame of member profiles
+    :output_csv: file to write the selected profiles to
+    :inclusive: flag profiles whose elapsed time equals the threshold too
+    :thresholds: dict of member group to number of years
+    :returns: dict with the number of flagged profiles per member group
+    """
+    member_type = members['Group'].str.replace(' Member', '', regex=False)
+    created = pd.to_datetime(members['Created On Date'], format=date_format)
+    elapsed = pd.Timestamp.now().year - created.dt.year
 
-    output_file.close()
-    print "Active profiles that should be updated",  need_to_be_updated
+    limit = member_type.map(thresholds)
+    if inclusive:
+        to_update = elapsed >= limit
+    else:
+        to_update = elapsed > limit
 
+    selected = members.loc[to_update].assign(**{'Elapsed Time': elapsed[to_update]})
+    selected[to_write].to_csv(output_csv, index=False, lineterminator='\r\n')
 
+    counts = member_type[to_update].value_counts()
+    return {group: int(counts.get(group, 0)) for group in thresholds}
 
-"""
-Dear user
 
-You are receiving this automatic email because you registered for the OCNS organization, more than 5 years ago. 
+def process_export(input_csv, status, output_csv, inclusive, store=None):
+    """Read one export, from the store if given, and write its updates.
 
-We would like to thank you for 
+    :returns: dict with the number of flagged profiles per member group
+    """
+    members = read_store(store, status) if store else read_export(input_csv)
+    return find_profiles_to_update(members, output_csv, inclusive)
 
-We would like to remind you that you should notify us if your status has been updated (Student, PostDoc, Faculty). 
 
-Note that OCNS is a non-profit organization, 
+if __name__ == "__main__":
+    store = sys.argv[1] if len(sys.argv) > 1 else None
 
-Kind Regards, 
+    with ThreadPoolExecutor(max_workers=len(exports)) as executor:
+        futures = [(label, executor.submit(process_export, input_csv, status,
+                                           output_csv, inclusive, store))
+                   for label, input_csv, status, output_csv, inclusive
+                   in exports]
 
-OCNS Webmaster
+        for label, future in futures:
+            print("{} profiles that should be updated".format(label),
+                  future.result())
 
-"""
@@ -9,28 +9,56 @@ The inputs this script requires are:
 
 Please ensure that the names of the exported files match the names set in this
 script below.
+
+Both member exports are read once into an index on the e-mail address and the
+normalised name (active members take precedence), and each candidate is looked
+up by e-mail first and by name otherwise. Candidates are rendered through a
+compiled template and written straight to the output file.
+
+If the member exports have been loaded into the member store (see
+scripts/database/member_store.py), the path to the store can be given instead,
+and the index is built from the store:
+
+    create_director_candidate_page.py [members.sqlite]
+
+If make_candidate_photos.py has been run, the resized photos are used, with
+their sizes from its manifest.
 """
 
 import csv
+import json
+import os
+import sqlite3
+import sys
+from string import Template
+
+# The names are normalised as in the member store, so that the index built
+# from the exports and the one built from the store match the same candidates
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, "database"))
+from member_store import normalise_name  # noqa: E402
 
 year = 2020
 fn = "ReceiptExport.csv"
 active_members = "active.csv"
 inactive_members = "inactive.csv"
 output_file = "candidates_{}.html".format(year)
-template = """
+member_keys = ['Group', 'City', 'Institution', 'Country']
+photos_url = "https://ocns.memberclicks.net/assets/images/Elections/{}/".format(year)
+photos_manifest = "photos-manifest.json"
+template = Template("""
 
-<table border="1" frame="above" id="{}">
+<table border="1" frame="above" id="$name">
     <tbody>
         <tr valign="middle"  style="background : #eff8fd">
-            <td style="border: 0px; width:100px"><img style="width: 100px; float: left; margin-right: 10px; margin-left: 10px;" src="{}" alt="Picture of {}" /></td>
+            <td style="border: 0px; width:100px"><img style="width: 100px; float: left; margin-right: 10px; margin-left: 10px;" src="$pic"$pic_attrs alt="Picture of $name" /></td>
             <td style="border: 0px; width:200px; margin-top: 0px; margin-right: 10px; margin-bottom: 5px; margin-left: 10px; outline-width: 0px; outline-style: initial; outline-color: initial; line-height: 18px; padding: 0px;">
-                <p><strong><a href="{}" target="_blank">{}</a></strong></p>
-                <address>{}</address>
-                <address>{}<br />{}<br />{}</address>
+                <p><strong><a href="$url" target="_blank">$name</a></strong></p>
+                <address>$memb</address>
+                <address>$addr1<br />$addr2<br />$addr3</address>
             </td>
             <td style="width:400px; border: 0px; margin-top: 0px; margin-right: 0px; margin-bottom: 5px; margin-left: 0px; outline-width: 0px; outline-style: initial; outline-color: initial; line-height: 18px; padding: 0px;">
-                <p>{}</p>
+                <p>$info</p>
             </td>
         </tr>
     </tbody>
@@ -40,63 +68,117 @@ template = """
         <tr>
             <td style="border: 0px; width: 10px; float: left; margin-right: 10px; margin-left: 10px;">&nbsp;</td>
             <td style="border: 0px; margin-top: 0px; margin-right: 0px; margin-bottom: 1px; margin-left: 0px; outline-width: 0px; outline-style: initial; outline-color: initial; line-height: 18px; padding: 0px;">
-                <p><h2>Motivation:</h2>{}</p>
-                <p>{}</p>
-                <p>{}</p>
+                <p><h2>Motivation:</h2>$mot</p>
+                <p>$particip</p>
+                <p>$oth</p>
             </td>
         </tr>
     </tbody>
 </table>
-"""
-
-out = open(output_file, "w")
-body = ""
-candidates = {}
-
-with open(fn, 'r') as csvfile:
-    reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
-
-    for row in reader:
-        candidates["{} {}".format(row['Last Name'].title(), row['First Name'].title())] = row
-
-    ordered = []
-    for n in list(candidates.keys()):
-        ordered.append(n)
-    ordered.sort()
-
-with open(active_members, 'r') as csvfile:
-    reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
-
-    for row in reader:
-        name = "{} {}".format(row['Last Name'].title(), row['First Name'].title())
-        if name in candidates:
-            for key in ['Group', 'City', 'Institution', 'Country']:
-                candidates[name][key] = row[key].title()
-
-"""
-with open(inactive_members, 'r') as csvfile:
-    reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
-
-    for row in reader:
-        name = "{} {}".format(
-            row['Last Name'].title(), row['First Name'].title())
-
-        if name in candidates:
-            for key in ['Group', 'City', 'Institution', 'Country']:
-                candidates[name][key] = row[key].title()
-"""
-
-for surname in ordered:
-
-    row = candidates[surname]
+""")
+
+
+def add_to_index(index, row):
+    """Add a member to the index, unless already there.
+
+    :index: (dict of e-mail to row, dict of normalised name to row)
+    :row: member profile
+    """
+    by_email, by_name = index
+    by_email.setdefault(row['Email'].strip().lower(), row)
+    by_name.setdefault(normalise_name(row['Last Name'], row['First Name']), row)
+
+
+def index_exports(filenames):
+    """Index the member exports, earlier files take precedence.
+
+    :filenames: list of member exports
+    :returns: (dict of e-mail to row, dict of normalised name to row)
+    """
+    index = ({}, {})
+    for filename in filenames:
+        with open(filename, 'r') as csvfile:
+            reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
+            for row in reader:
+                add_to_index(index, row)
+    return index
+
+
+def index_store(store):
+    """Index the members in the member store, active members first.
+
+    :store: path to the member store database
+    :returns: (dict of e-mail to row, dict of normalised name to row)
+    """
+    index = ({}, {})
+    conn = sqlite3.connect(store)
+    conn.row_factory = sqlite3.Row
+    for row in conn.execute(
+            'SELECT * FROM members WHERE "status" != ? ORDER BY "status" = ? DESC',
+            ("removed", "active")):
+        add_to_index(index, row)
+    conn.close()
+    return index
+
+
+def find_member(candidate, index):
+    """Find the member profile of a candidate.
+
+    :candidate: row of the candidate form export
+    :index: (dict of e-mail to row, dict of normalised name to row)
+    :returns: member profile, or None
+    """
+    by_email, by_name = index
+    member = by_email.get(candidate.get('Email', '').strip().lower())
+    if member is None:
+        member = by_name.get(normalise_name(candidate['Last Name'],
+                                            candidate['First Name']))
+    return member
+
+
+def read_photos_manifest():
+    """Read the manifest of the resized photos.
+
+    :returns: dict of last name to list of variants, empty if there is none
+    """
+    if not os.path.isfile(photos_manifest):
+        return {}
+    with open(photos_manifest, 'r') as fh:
+        return json.load(fh)
+
+
+def picture(last_name, photos):
+    """Get the URL and extra attributes of the picture of a candidate.
+
+    :last_name: last name of the candidate
+    :photos: dict returned by read_photos_manifest
+    :returns: (URL, attributes string)
+    """
+    variants = photos.get(last_name)
+    if not variants:
+        return "{}{}.jpg".format(photos_url, last_name), ""
+    srcset = ", ".join("{}{} {}x".format(photos_url, v["file"], v["density"])
+                       for v in variants)
+    return photos_url + variants[0]["file"], \
+        ' width="{}" height="{}" srcset="{}"'.format(
+            variants[0]["width"], variants[0]["height"], srcset)
+
+
+def render(surname, row, member, photos):
+    """Render the HTML of a candidate.
+
+    :surname: sort key of the candidate
+    :row: row of the candidate form export
+    :member: member profile of the candidate, or None
+    :photos: dict returned by read_photos_manifest
+    :returns: HTML string
+    """
     name = row['First Name'] + " " + row['Last Name']
 
     # SHOULD BE RETRIEVED FROM VALID MEMBERS
-    if 'Country' in row:
-        addr1 = row['Institution']
-        addr2 = row['City']
-        addr3 = row['Country']
-        memb = row['Group']
+    if member is not None:
+        addr1, addr2, addr3, memb = [member[key].title() for key in
+                                     ['Institution', 'City', 'Country', 'Group']]
     else:
         print(surname, "is not a valid member: details should be manually provided")
         addr1 = ''
@@ -120,11 +202,32 @@ for surname in ordered:
 
     particip = "<h2>OCNS and CNS participation:</h2>Attended {} CNS meeting(s).  {}. OCNS member since {}.".format(att, rev, member_year)
 
-    pic = "https://ocns.memberclicks.net/assets/images/Elections/{}/{}.jpg".format(year, row['Last Name'])
+    pic, pic_attrs = picture(row['Last Name'], photos)
     url = row['URL']
 
-    body += template.format(name, pic, name, url, name, memb, addr1, addr2, addr3,
-                            info, mot, particip, oth)
+    return template.substitute(name=name, pic=pic, pic_attrs=pic_attrs,
+                               url=url, memb=memb,
+                               addr1=addr1, addr2=addr2, addr3=addr3,
+                               info=info, mot=mot, particip=particip, oth=oth)
+
+
+if __name__ == "__main__":
+    candidates = {}
+
+    with open(fn, 'r') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
+
+        for row in reader:
+            candidates["{} {}".format(row['Last Name'].title(), row['First Name'].title())] = row
+
+    if len(sys.argv) > 1:
+        index = index_store(sys.argv[1])
+    else:
+        index = index_exports([active_members, inactive_members])
+
+    photos = read_photos_manifest()
 
-out.write(body)
-out.close()
+    with open(output_file, "w") as out:
+        for surname in sorted(candidates):
+            row = candidates[surname]
+            out.write(render(surname, row, find_member(row, index), photos))
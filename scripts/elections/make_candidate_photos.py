@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Resize and compress the candidate photos for the elections page.
+
+The photos uploaded by the candidates must be in the `photos` directory,
+named after the last name of the candidate as in the candidate form export,
+e.g. `photos/Smith.jpg` (JPEG or PNG). They are saved as progressive JPEGs at
+the display width of the candidates page and at twice that for high density
+screens, in parallel, into `Elections/{year}`, which must then be uploaded to
+`assets/images/Elections/{year}` on Memberclicks. Photos are never enlarged:
+the high density variant of a photo narrower than twice the display width is
+labelled with the density it really has (e.g. 1.5x), and is left out if the
+photo is no wider than the display width.
+
+The sizes of the resized photos are written to `photos-manifest.json`, which
+create_director_candidate_page.py uses for the `width`, `height` and `srcset`
+of the pictures.
+
+Candidates without a photo, or whose photo cannot be read, are reported, and
+the script then exits with a non zero status. The manifest is written for the
+other photos in any case.
+
+File: make_candidate_photos.py
+"""
+
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+from create_director_candidate_page import fn, year
+
+
+photo_dir = "photos"
+output_dir = os.path.join("Elections", str(year))
+manifest_fn = "photos-manifest.json"
+display_width = 100
+# Pixel density of each variant
+densities = [1, 2]
+photo_extensions = [".jpg", ".jpeg", ".png"]
+
+
+def find_photo(last_name):
+    """Find the uploaded photo of a candidate.
+
+    :last_name: last name of the candidate
+    :returns: path to the photo, or None
+    """
+    for ext in photo_extensions:
+        for name in [last_name + ext, last_name + ext.upper()]:
+            path = os.path.join(photo_dir, name)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def resize_photo(last_name, path):
+    """Save the variants of a photo.
+
+    :last_name: last name of the candidate
+    :path: path to the uploaded photo
+    :returns: (last name, list of variants)
+    """
+    variants = []
+    with Image.open(path) as im:
+        # Phones store the orientation in the EXIF data
+        im = ImageOps.exif_transpose(im).convert("RGB")
+        for density in densities:
+            width = min(display_width * density, im.width)
+            if variants:
+                # Label the variant with the density it really has
+                density = round(width / variants[0]["width"], 2)
+                if density <= variants[-1]["density"]:
+                    continue
+                if density == int(density):
+                    density = int(density)
+            height = round(im.height * width / im.width)
+            fname = "{}-{}x.jpg".format(last_name, density)
+            im.resize((width, height), Image.LANCZOS).save(
+                os.path.join(output_dir, fname), quality=80, optimize=True,
+                progressive=True)
+            variants.append({"file": fname, "density": density,
+                             "width": width, "height": height,
+                             "bytes": os.path.getsize(
+                                 os.path.join(output_dir, fname))})
+    return last_name, variants
+
+
+if __name__ == "__main__":
+    with open(fn, 'r') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
+        last_names = sorted(set(row['Last Name'] for row in reader))
+
+    photos = {name: find_photo(name) for name in last_names}
+    missing = [name for name, path in photos.items() if path is None]
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {}
+    unreadable = []
+    with ProcessPoolExecutor() as executor:
+        futures = {executor.submit(resize_photo, name, path): name
+                   for name, path in photos.items() if path is not None}
+        for future in futures:
+            try:
+                name, variants = future.result()
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                # Not an image, truncated, or too large to open
+                unreadable.append((futures[future], e))
+                continue
+            manifest[name] = variants
+            print("{}: {} -> {} bytes".format(
+                name, os.path.getsize(photos[name]),
+                sum(v["bytes"] for v in variants)))
+
+    with open(manifest_fn, 'w') as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+
+    for name in missing:
+        print("ERROR: no photo for {} in {}".format(name, photo_dir),
+              file=sys.stderr)
+    for name, e in unreadable:
+        print("ERROR: cannot resize {}: {}".format(photos[name], e),
+              file=sys.stderr)
+    if missing or unreadable:
+        sys.exit(1)
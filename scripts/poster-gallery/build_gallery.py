@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Build the poster gallery from the poster PDFs in one go.
+
+This must be run in the directory where all the PDF files are. The build is
+a small dependency graph of targets:
+
+    rename -> validate -> thumbnails -> manifest -> html
+
+Each target has a stamp, a hash of its inputs and of the stamps of the
+targets it depends on, which is kept in `.gallery-build.json`. A target is
+only run if its stamp changed or its outputs are missing, like make. The PDF
+checks and the thumbnails are also incremental per poster, so adding a few
+late posters only does the work for those posters.
+
+The time taken by each target is printed, and appended to
+`gallery-build-timings.json`.
+
+Options after `--` are passed on to make-html-gallery.py, for example:
+
+    build_gallery.py -- --page-size 100 --submissions submissions.csv
+
+File: build_gallery.py
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import make_thumbnails
+import rename_posters
+from poster_index import index_fn
+
+
+state_fn = ".gallery-build.json"
+timings_fn = "gallery-build-timings.json"
+gallery_fn = "gallery.html"
+script_dir = os.path.dirname(os.path.abspath(__file__))
+gallery_script = os.path.join(script_dir, "make-html-gallery.py")
+# Sources of the gallery HTML: a change to any of them rebuilds it
+gallery_sources = [gallery_script] + [
+    os.path.join(script_dir, name)
+    for name in ["gallery_layout.py", "poster_index.py"]]
+page_fn = "gallery-{}.html"
+
+
+class BuildError(Exception):
+
+    """A target failed."""
+
+
+def stamp_of(*parts):
+    """Hash a JSON serialisable description of some inputs.
+
+    :parts: inputs
+    :returns: hex digest
+    """
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def list_pdfs():
+    """Get the PDFs in the current directory with their size and mtime.
+
+    :returns: dict of file name to [size, mtime in ns]
+    """
+    pdfs = {}
+    for entry in os.scandir("."):
+        if entry.is_file() and entry.name.lower().endswith(".pdf"):
+            stat = entry.stat()
+            pdfs[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return pdfs
+
+
+class Target():
+
+    """A step of the build."""
+
+    def __init__(self, name, deps, inputs, action, outputs=None):
+        """Initialise
+
+        :name: name of the target
+        :deps: names of the targets this one depends on
+        :inputs: function returning a JSON serialisable description of the
+            inputs
+        :action: function that builds the target, given the build state
+        :outputs: function returning the list of files the target makes
+        """
+        self.name = name
+        self.deps = deps
+        self.inputs = inputs
+        self.action = action
+        self.outputs = outputs or (lambda: [])
+
+
+class Build():
+
+    """Run targets in dependency order, skipping the ones up to date."""
+
+    def __init__(self, targets):
+        """Initialise
+
+        :targets: list of Target
+        """
+        self.targets = {t.name: t for t in targets}
+        self.order = self.__sort(targets)
+        if os.path.isfile(state_fn):
+            with open(state_fn, 'r') as fh:
+                self.state = json.load(fh)
+        else:
+            self.state = {"stamps": {}, "valid_pdfs": {}}
+        self.timings = {}
+
+    def __sort(self, targets):
+        """Sort targets so that dependencies come first.
+
+        :targets: list of Target
+        :returns: list of target names
+        """
+        order = []
+        visiting = set()
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise BuildError("Dependency cycle at {}".format(name))
+            visiting.add(name)
+            for dep in self.targets[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            order.append(name)
+
+        for target in targets:
+            visit(target.name)
+        return order
+
+    def run(self):
+        """Build all targets.
+
+        :returns: nothing
+        :raises BuildError: if a target fails
+        """
+        stamps = {}
+        try:
+            for name in self.order:
+                target = self.targets[name]
+                stamps[name] = stamp_of(target.inputs(),
+                                        [stamps[d] for d in target.deps])
+                up_to_date = (
+                    self.state["stamps"].get(name) == stamps[name] and
+                    all(os.path.exists(f) for f in target.outputs()))
+
+                start = time.perf_counter()
+                if not up_to_date:
+                    # Forget the old stamp in case the action fails
+                    self.state["stamps"].pop(name, None)
+                    try:
+                        target.action(self.state)
+                    except Exception:
+                        self.timings[name] = {
+                            "status": "failed",
+                            "seconds": round(time.perf_counter() - start, 3)}
+                        raise
+                    # The action may have changed its own inputs (rename)
+                    stamps[name] = stamp_of(target.inputs(),
+                                            [stamps[d] for d in target.deps])
+                    self.state["stamps"][name] = stamps[name]
+                seconds = time.perf_counter() - start
+
+                self.timings[name] = {
+                    "status": "up to date" if up_to_date else "built",
+                    "seconds": round(seconds, 3)}
+                print("{}: {} ({:.2f}s)".format(
+                    name, self.timings[name]["status"], seconds),
+                    file=sys.stderr)
+        finally:
+            self.__save()
+
+    def __save(self):
+        """Write the build state and append the timings of this run."""
+        with open(state_fn, 'w') as fh:
+            json.dump(self.state, fh, indent=1, sort_keys=True)
+
+        runs = []
+        if os.path.isfile(timings_fn):
+            with open(timings_fn, 'r') as fh:
+                runs = json.load(fh)
+        runs.append({"date": datetime.now().isoformat(timespec="seconds"),
+                     "targets": self.timings})
+        with open(timings_fn, 'w') as fh:
+            json.dump(runs, fh, indent=1)
+
+
+def rename(state):
+    """Rename `P123 - Title.pdf` files to `P123.pdf`."""
+    renames, problems = rename_posters.plan_renames(list(list_pdfs()))
+    if problems:
+        raise BuildError("\n".join(problems))
+    for old, new in renames.items():
+        if old != new:
+            print("Renaming {} -> {}".format(old, new), file=sys.stderr)
+            os.rename(old, new)
+
+
+def validate(state):
+    """Check the PDFs that are new or changed since they were last valid."""
+    pdfs = list_pdfs()
+    valid = state["valid_pdfs"]
+    todo = [f for f, stat in pdfs.items() if valid.get(f) != stat]
+    print("Checking {} of {} PDFs".format(len(todo), len(pdfs)),
+          file=sys.stderr)
+    pages, problems = rename_posters.validate_pdfs(todo)
+
+    state["valid_pdfs"] = {f: stat for f, stat in pdfs.items()
+                           if f in pages or (f not in todo and f in valid)}
+    if problems:
+        raise BuildError("\n".join(problems))
+
+
+def thumbnails(state):
+    """Make the thumbnails of the new or changed posters."""
+    manifest = make_thumbnails.make_thumbnails(sorted(list_pdfs()))
+    missing = [f for f in list_pdfs() if f.split(".")[0] not in manifest]
+    if missing:
+        raise BuildError("No thumbnails for: {}".format(", ".join(missing)))
+
+
+def manifest_files():
+    """Get all files listed in the thumbnail manifest."""
+    files = [make_thumbnails.manifest_fn]
+    for entry in make_thumbnails.read_manifest().values():
+        names = [entry["thumbnail"]] + [v["file"] for v in
+                                        entry.get("variants", [])]
+        files += [os.path.join(make_thumbnails.thumbnail_dir, name)
+                  for name in names]
+    return files
+
+
+def check_manifest(state):
+    """Check that the manifest lists every poster and all its files exist."""
+    manifest = make_thumbnails.read_manifest()
+    problems = ["{}: not in the manifest".format(f) for f in list_pdfs()
+                if f.split(".")[0] not in manifest]
+    problems += ["{}: missing".format(f) for f in manifest_files()
+                 if not os.path.exists(f)]
+    if problems:
+        raise BuildError("\n".join(problems))
+
+
+def parse_gallery_args(gallery_args):
+    """Get the options of make-html-gallery.py that decide its outputs.
+
+    :gallery_args: extra arguments for make-html-gallery.py
+    :returns: argparse.Namespace with page_size, output_dir and submissions
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--page-size", type=int)
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--submissions")
+    return parser.parse_known_args(gallery_args)[0]
+
+
+def html_files(gallery_args):
+    """Get the files the gallery HTML is written to.
+
+    :gallery_args: extra arguments for make-html-gallery.py
+    :returns: list of file names
+    """
+    options = parse_gallery_args(gallery_args)
+    if not options.page_size:
+        files = [gallery_fn]
+    else:
+        pages = math.ceil(len(make_thumbnails.read_manifest()) /
+                          max(options.page_size, 1))
+        files = [os.path.join(options.output_dir, page_fn.format(page))
+                 for page in range(1, pages + 1)]
+    if options.submissions:
+        files.append(os.path.join(options.output_dir, index_fn))
+    return files
+
+
+def html(gallery_args):
+    """Get the action that writes the gallery HTML.
+
+    :gallery_args: extra arguments for make-html-gallery.py
+    :returns: function
+    """
+    def action(state):
+        command = [sys.executable, gallery_script] + gallery_args
+        if parse_gallery_args(gallery_args).page_size:
+            subprocess.run(command, check=True)
+        else:
+            with open(gallery_fn, 'w') as fh:
+                subprocess.run(command, stdout=fh, check=True)
+            print("Wrote {}".format(gallery_fn), file=sys.stderr)
+    return action
+
+
+def file_stamp(fname):
+    """Get the size and mtime of a file, None if it does not exist."""
+    if not os.path.isfile(fname):
+        return None
+    stat = os.stat(fname)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def gallery_targets(gallery_args):
+    """Get the targets of the gallery build.
+
+    :gallery_args: extra arguments for make-html-gallery.py
+    :returns: list of Target
+    """
+    extra_inputs = [a for a in gallery_args if os.path.isfile(a)]
+    return [
+        Target("rename", [], lambda: sorted(list_pdfs()), rename),
+        Target("validate", ["rename"], list_pdfs, validate),
+        Target("thumbnails", ["validate"], list_pdfs, thumbnails,
+               manifest_files),
+        Target("manifest", ["thumbnails"],
+               lambda: file_stamp(make_thumbnails.manifest_fn),
+               check_manifest, lambda: [make_thumbnails.manifest_fn]),
+        Target("html", ["manifest"],
+               lambda: [gallery_args] +
+               [file_stamp(f) for f in gallery_sources + extra_inputs],
+               html(gallery_args),
+               lambda: html_files(gallery_args)),
+    ]
+
+
+if __name__ == "__main__":
+    gallery_args = sys.argv[sys.argv.index("--") + 1:] \
+        if "--" in sys.argv else []
+
+    start = time.perf_counter()
+    try:
+        Build(gallery_targets(gallery_args)).run()
+    except (BuildError, subprocess.CalledProcessError) as e:
+        print("ERROR: {}".format(e), file=sys.stderr)
+        sys.exit(1)
+    print("Build finished in {:.2f}s".format(time.perf_counter() - start),
+          file=sys.stderr)
@@ -0,0 +1,73 @@
+/*
+ * Client side search for the poster gallery.
+ *
+ * Loads the index written by poster_index.py and, as the visitor types in
+ * the #poster-search box, lists the matching posters in
+ * #poster-search-results and hides the non-matching posters on the page.
+ * All words typed must match, each as a prefix of a word in the title,
+ * authors, keywords or poster ID.
+ *
+ * File: gallery-search.js
+ */
+(function () {
+    "use strict";
+
+    var script = document.currentScript;
+    var indexUrl = script.getAttribute("data-index");
+    var maxResults = 50;
+
+    function lookup(index, word) {
+        var matches = {};
+        Object.keys(index.index).forEach(function (token) {
+            if (token.indexOf(word) === 0) {
+                index.index[token].forEach(function (i) { matches[i] = true; });
+            }
+        });
+        return matches;
+    }
+
+    function search(index, query) {
+        var words = query.toLowerCase().match(/[\w\u00C0-\uFFFF]+/g) || [];
+        var result = null;
+        words.forEach(function (word) {
+            var matches = lookup(index, word);
+            if (result === null) {
+                result = matches;
+            } else {
+                Object.keys(result).forEach(function (i) {
+                    if (!matches[i]) { delete result[i]; }
+                });
+            }
+        });
+        return result;
+    }
+
+    function show(index, result, list) {
+        list.innerHTML = "";
+        index.posters.forEach(function (poster, i) {
+            var cell = document.getElementById("poster-" + poster[0]);
+            var match = result === null || result[i];
+            if (cell) { cell.style.display = match ? "" : "none"; }
+            if (result !== null && match && list.children.length < maxResults) {
+                var item = document.createElement("li");
+                var link = document.createElement("a");
+                link.href = poster[3];
+                link.target = "_blank";
+                link.textContent = poster[0] + ": " + poster[1];
+                item.appendChild(link);
+                item.appendChild(document.createTextNode(" " + poster[2]));
+                list.appendChild(item);
+            }
+        });
+    }
+
+    fetch(indexUrl).then(function (response) {
+        return response.json();
+    }).then(function (index) {
+        var box = document.getElementById("poster-search");
+        var list = document.getElementById("poster-search-results");
+        box.addEventListener("input", function () {
+            show(index, search(index, box.value), list);
+        });
+    });
+}());
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Row layout for the poster gallery.
+
+Posters are kept in their order and split into rows. All thumbnails of a row
+are shown at the same height, scaled so that the row is exactly the target
+row width. The row breaks are chosen by dynamic programming over the aspect
+ratios of the thumbnails so that the row heights are as close as possible to
+the target row height (a linear partition problem). This avoids the gaps that
+a greedy placement leaves when a landscape poster follows a portrait one.
+
+File: gallery_layout.py
+"""
+
+
+def row_cost(aspect_sum, target_row_width, target_row_height, last=False):
+    """Cost of a row whose thumbnails have the given sum of aspect ratios.
+
+    :aspect_sum: sum of width/height of the thumbnails in the row
+    :target_row_width: width each row is scaled to
+    :target_row_height: preferred height of the rows
+    :last: whether this is the last row, which is not stretched
+    :returns: squared deviation of the row height from the target
+    """
+    height = target_row_width / aspect_sum
+    if last and height > target_row_height:
+        return 0
+    return (height - target_row_height) ** 2
+
+
+def partition_rows(aspects, target_row_width, target_row_height, max_columns):
+    """Split a sequence of thumbnails into rows.
+
+    :aspects: list of width/height of the thumbnails, in display order
+    :target_row_width: width each row is scaled to
+    :target_row_height: preferred height of the rows
+    :max_columns: maximum number of thumbnails in a row
+    :returns: list of (start, end) index pairs, one per row
+    """
+    n = len(aspects)
+    prefix = [0.0]
+    for aspect in aspects:
+        prefix.append(prefix[-1] + aspect)
+
+    # best[i]: lowest cost of laying out the first i thumbnails
+    best = [0.0] + [float("inf")] * n
+    start_of_row = [0] * (n + 1)
+    for end in range(1, n + 1):
+        for start in range(max(0, end - max_columns), end):
+            cost = best[start] + row_cost(prefix[end] - prefix[start],
+                                          target_row_width, target_row_height,
+                                          last=(end == n))
+            if cost < best[end]:
+                best[end] = cost
+                start_of_row[end] = start
+
+    rows = []
+    end = n
+    while end > 0:
+        rows.append((start_of_row[end], end))
+        end = start_of_row[end]
+    rows.reverse()
+    return rows
+
+
+def layout_rows(items, target_row_width, target_row_height, max_columns):
+    """Lay out thumbnails in rows.
+
+    :items: list of (key, width, height) of the thumbnails, in display order
+    :target_row_width: width each row is scaled to
+    :target_row_height: preferred height of the rows
+    :max_columns: maximum number of thumbnails in a row
+    :returns: list of rows, each a list of (key, display width, display height)
+    """
+    aspects = [width / height for key, width, height in items]
+    rows = []
+    for start, end in partition_rows(aspects, target_row_width,
+                                     target_row_height, max_columns):
+        height = target_row_width / sum(aspects[start:end])
+        if end == len(items):
+            height = min(height, target_row_height)
+        rows.append([(items[i][0], round(aspects[i] * height), round(height))
+                     for i in range(start, end)])
+    return rows
@@ -11,77 +11,235 @@ Author: Ankur Sinha <sanjay DOT ankur AT gmail DOT com>
 This must be run in the directory where all the PDF files are. They must be
 named `P123.pdf` and so on. The directory should contain the thumbnails in the
 `thumbnails` directory. They should be named `thumbnail-P123.png1`.
+make_thumbnails.py generates them, along with `thumbnails/manifest.json`
+which has the sizes of the thumbnails. Only the manifest is read here, the
+images themselves are not opened.
+
+The posters are packed into rows by gallery_layout.py: each row is scaled to
+the same width, and the row breaks are chosen so that the row heights are as
+close as possible to the target height. Each row is a separate table since
+Memberclicks does not support figure and figcaption tags.
+
+Images are loaded lazily, and the smaller variants made by make_thumbnails.py
+are offered through `srcset` so that browsers only fetch what they display.
+Memberclicks is not known to keep `picture` and `source` tags (it drops
+figure and figcaption), so each thumbnail is a single `img`: its `srcset`
+lists the variants in `srcset_format`, WebP by default, which all current
+browsers support, and its `src` is the PNG thumbnail, which is what is shown
+if the srcset is stripped. Set srcset_format to "png" to only serve PNG.
+
+By default, the whole gallery is printed to stdout. With --page-size, the
+gallery is split into pages of that many posters, written to
+`gallery-1.html`, `gallery-2.html` and so on, with links between them.
+
+With --submissions, the posters are joined with the Confmaster submission
+export: titles are shown under the thumbnails, and poster_index.py writes a
+search index that gallery-search.js (which must be uploaded next to the
+posters) uses to search and filter the posters in the browser.
 """
 
-from os import listdir
-from os.path import isfile, join
+import argparse
+import html
+import json
+import os
+import sys
 from natsort import natsorted
-from PIL import Image
 
+from gallery_layout import layout_rows
+from poster_index import (build_index, read_submissions, write_index, index_fn,
+                          unmatched_posters)
 
-# Number of columns in tables
-num_columns = 2
-max_thumbnail_width = 800
-max_row_width = 1600
+
+# Maximum number of posters in a row
+num_columns = 3
+# Display width of each row, and preferred display height of the thumbnails
+row_width = 1200
+row_height = 600
 URL_p = "https://ocns.memberclicks.net/assets/CNS_Meetings/CNS2019/Posters/"
 URL_t = URL_p + "thumbnails/"
-filelist = [f for f in listdir(".") if isfile(join(".", f))]
-sorted_list = natsorted(filelist)
-
-# Print table headers
-print("""
-<table border="1" align="center">
-<tbody>
-<tr>
-""")
-
-counter = 0
-row_width = 0
-imgwidth = 0
-for afile in sorted_list:
-    # check thumbnail size. If it's landscape, only put two images on a line
-    thumbnail = "thumbnail-" + afile.split(".")[0] + ".png"
-    im = Image.open("./thumbnails/" + thumbnail)
-    # They are all 800px in height
-    thumbnail_width = im.size[0]
-    row_width += thumbnail_width
-
-    if thumbnail_width > max_thumbnail_width:
-        colspan = 2
-        imgwidth = 1200
-    else:
-        colspan = 1
-        imgwidth = 600
+manifest_fn = "thumbnails/manifest.json"
+# File name of each page, and how other pages link to it
+page_fn = "gallery-{}.html"
+page_url = "gallery-{}.html"
+search_script = URL_p + "gallery-search.js"
+search_index = URL_p + index_fn
+# Format of the variants in the srcset of the thumbnails, PNG is used for
+# posters that have no variants in this format
+srcset_format = "webp"
+
+
+def srcset(entry, fmt):
+    """Get the srcset of a thumbnail in a format.
+
+    :entry: manifest entry of the poster
+    :fmt: image format
+    :returns: srcset attribute value, empty if there are no such variants
+    """
+    candidates = ["{} {}w".format(URL_t + v["file"], v["width"])
+                  for v in entry.get("variants", []) if v["format"] == fmt]
+    if fmt == "png":
+        candidates.append("{} {}w".format(URL_t + entry["thumbnail"],
+                                          entry["width"]))
+    return ", ".join(candidates)
+
+
+def render_search_box():
+    """Get the search box and the script that runs the search.
+
+    :returns: HTML string
+    """
+    return """
+<p align="center"><input type="search" id="poster-search" placeholder="Search posters by title, author, or keyword" size="60"></p>
+<ul id="poster-search-results"></ul>
+<script src="{}" data-index="{}" defer></script>
+""".format(search_script, search_index)
+
+
+def render_cell(poster, entry, imgwidth, imgheight, title=""):
+    """Get the table cell of a poster.
 
-    # New row starts
-    if counter + colspan > num_columns or row_width > max_row_width:
-        print("</tr><tr>")
-        counter = 0
-        row_width = 0
+    :poster: poster ID
+    :entry: manifest entry of the poster
+    :imgwidth: display width
+    :imgheight: display height
+    :title: title of the poster, if known
+    :returns: HTML string
+    """
+    afile = entry["source"]
+    caption = poster if not title else "{}: {}".format(poster, html.escape(title))
+    fmt = srcset_format if srcset(entry, srcset_format) else "png"
 
     # Member clicks does not support figure and figcaption tags.
-    print("""
-          <td colspan="{}" align="center">
+    return """
+          <td align="center" id="poster-{}">
           <a href="{}" target="_blank">
-          <img title="{}" src="{}" alt="{}" width="{}">
+          <img title="{}" src="{}" srcset="{}" sizes="{}px" alt="{}" width="{}" height="{}" loading="lazy">
           </a>
           <br />
           <strong>{}</strong>
           </td>
-          """.format(colspan, URL_p + afile,
+          """.format(poster, URL_p + afile,
                      "Poster: " + afile,
-                     URL_t + "thumbnail-" + afile.split(".")[0] + ".png",
-                     "Poster: " + afile, imgwidth,
-                     afile.split(".")[0]
+                     URL_t + entry["thumbnail"],
+                     srcset(entry, fmt), imgwidth,
+                     "Poster: " + afile, imgwidth, imgheight,
+                     caption
                      )
-          )
 
-    counter += colspan
-#
 
-# End the table
-print("""
-</tr>
-</tbody>
-</table>
-""")
+def render_gallery(manifest, posters, submissions=None):
+    """Get the tables for a list of posters.
+
+    :manifest: thumbnail manifest
+    :posters: poster IDs, in display order
+    :submissions: dict returned by poster_index.read_submissions, if any
+    :returns: HTML string
+    """
+    submissions = submissions or {}
+    rows = layout_rows([(poster, manifest[poster]["width"],
+                         manifest[poster]["height"]) for poster in posters],
+                       row_width, row_height, num_columns)
+    tables = []
+    if submissions:
+        tables.append(render_search_box())
+    for row in rows:
+        # Print table headers
+        tables.append('<table border="1" align="center"><tbody><tr>')
+        for poster, imgwidth, imgheight in row:
+            tables.append(render_cell(
+                poster, manifest[poster], imgwidth, imgheight,
+                submissions.get(poster, {}).get("title", "")))
+        # End the table
+        tables.append("</tr></tbody></table>")
+    return "\n".join(tables)
+
+
+def render_navigation(page, num_pages):
+    """Get the links to the other pages.
+
+    :page: current page number, starting at 1
+    :num_pages: total number of pages
+    :returns: HTML string
+    """
+    links = []
+    if page > 1:
+        links.append('<a href="{}">&laquo; Previous</a>'.format(
+            page_url.format(page - 1)))
+    for other in range(1, num_pages + 1):
+        if other == page:
+            links.append("<strong>{}</strong>".format(other))
+        else:
+            links.append('<a href="{}">{}</a>'.format(page_url.format(other),
+                                                     other))
+    if page < num_pages:
+        links.append('<a href="{}">Next &raquo;</a>'.format(
+            page_url.format(page + 1)))
+    return '<p align="center">{}</p>'.format(" | ".join(links))
+
+
+def write_pages(manifest, posters, page_size, output_dir=".",
+                submissions=None):
+    """Write the gallery split into pages.
+
+    :manifest: thumbnail manifest
+    :posters: poster IDs, in display order
+    :page_size: number of posters per page
+    :output_dir: directory to write the pages to
+    :submissions: dict returned by poster_index.read_submissions, if any
+    :returns: list of file names written
+    """
+    pages = [posters[i:i + page_size]
+             for i in range(0, len(posters), page_size)]
+    written = []
+    for page, page_posters in enumerate(pages, start=1):
+        navigation = render_navigation(page, len(pages))
+        fname = os.path.join(output_dir, page_fn.format(page))
+        with open(fname, 'w') as fh:
+            print(navigation, file=fh)
+            print(render_gallery(manifest, page_posters, submissions),
+                  file=fh)
+            print(navigation, file=fh)
+        written.append(fname)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate the HTML code for the poster gallery")
+    parser.add_argument("--page-size", type=int,
+                        help="split the gallery into pages of this many posters")
+    parser.add_argument("--output-dir", default=".",
+                        help="directory to write the pages and index to")
+    parser.add_argument("--submissions",
+                        help="Confmaster submission export, to add titles "
+                        "and build the search index")
+    args = parser.parse_args()
+    if args.page_size is not None and args.page_size < 1:
+        parser.error("--page-size must be at least 1")
+
+    with open(manifest_fn, 'r') as fh:
+        manifest = json.load(fh)
+    sorted_list = natsorted(manifest.keys())
+
+    submissions = None
+    if args.submissions:
+        try:
+            submissions = read_submissions(args.submissions)
+        except ValueError as e:
+            print("ERROR: {}".format(e), file=sys.stderr)
+            sys.exit(1)
+        unmatched = unmatched_posters(sorted_list, submissions)
+        if unmatched:
+            print("WARNING: {} of {} posters match no submission in {} (see "
+                  "poster_index.py for the expected columns): {}".format(
+                      len(unmatched), len(sorted_list), args.submissions,
+                      ", ".join(unmatched)), file=sys.stderr)
+        write_index(build_index(sorted_list, submissions, URL_p),
+                    os.path.join(args.output_dir, index_fn))
+
+    if args.page_size is not None:
+        for fname in write_pages(manifest, sorted_list, args.page_size,
+                                 args.output_dir, submissions):
+            print("Wrote {}".format(fname))
+    else:
+        print(render_gallery(manifest, sorted_list, submissions))
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Generate the thumbnails for the poster gallery.
+
+This must be run in the directory where all the PDF files are. The first page
+of each PDF is rasterized with ImageMagick's `convert` into the `thumbnails`
+directory as `thumbnail-P123.png`, which is where make-html-gallery.py
+expects them.
+
+Posters are rasterized in parallel on all available cores. Posters whose
+thumbnail is newer than the PDF, or whose PDF has the same content hash as
+when the thumbnail was last made, are skipped.
+
+Each thumbnail is also saved at smaller widths and in WebP next to the PNG,
+so that the gallery can let browsers pick the smallest file through `srcset`.
+
+The manifest `thumbnails/manifest.json` records the source hash, width,
+height, orientation and byte size of every thumbnail and of its variants, so
+that make-html-gallery.py does not need to open the images.
+
+File: make_thumbnails.py
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+
+thumbnail_dir = "thumbnails"
+manifest_fn = os.path.join(thumbnail_dir, "manifest.json")
+thumbnail_height = 600
+# Widths of the smaller variants, in pixels
+variant_widths = [300, 600]
+variant_formats = ["png", "webp"]
+
+
+def thumbnail_name(pdf):
+    """Get the thumbnail file name for a poster.
+
+    :pdf: file name of the poster PDF
+    :returns: file name of the thumbnail
+    """
+    return "thumbnail-" + pdf.split(".")[0] + ".png"
+
+
+def file_hash(filename):
+    """Get the sha256 hash of a file.
+
+    :filename: file to hash
+    :returns: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest():
+    """Read the thumbnail manifest.
+
+    :returns: dict of poster ID to manifest entry
+    """
+    if os.path.isfile(manifest_fn):
+        with open(manifest_fn, 'r') as fh:
+            return json.load(fh)
+    return {}
+
+
+def write_manifest(manifest):
+    """Write the thumbnail manifest.
+
+    :manifest: dict of poster ID to manifest entry
+    :returns: nothing
+    """
+    with open(manifest_fn, 'w') as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+
+
+def is_up_to_date(pdf, entry):
+    """Check if the thumbnail of a poster needs to be made again.
+
+    :pdf: file name of the poster PDF
+    :entry: manifest entry of the poster, or None
+    :returns: (True if up to date, hash of the PDF if it was computed)
+    """
+    thumbnail = os.path.join(thumbnail_dir, thumbnail_name(pdf))
+    if not os.path.isfile(thumbnail):
+        return False, None
+    if os.path.getmtime(thumbnail) >= os.path.getmtime(pdf):
+        return True, None
+    source_hash = file_hash(pdf)
+    return (entry is not None and entry.get("source_hash") == source_hash,
+            source_hash)
+
+
+def describe_thumbnail(entry):
+    """Add the thumbnail dimensions and size to a manifest entry.
+
+    :entry: manifest entry, updated in place
+    :returns: the entry
+    """
+    thumbnail = os.path.join(thumbnail_dir, entry["thumbnail"])
+    with Image.open(thumbnail) as im:
+        width, height = im.size
+    entry["width"] = width
+    entry["height"] = height
+    entry["orientation"] = "landscape" if width > height else "portrait"
+    entry["bytes"] = os.path.getsize(thumbnail)
+    return entry
+
+
+def make_variants(entry):
+    """Save the thumbnail at the variant widths and formats.
+
+    Variants are never larger than the thumbnail itself. The full size
+    thumbnail is included for the formats other than PNG.
+
+    :entry: manifest entry with the thumbnail size, updated in place
+    :returns: the entry
+    """
+    base = entry["thumbnail"].rsplit(".", 1)[0]
+    variants = []
+    with Image.open(os.path.join(thumbnail_dir, entry["thumbnail"])) as im:
+        im.load()
+        widths = [w for w in variant_widths if w < entry["width"]]
+        for width in widths + [entry["width"]]:
+            height = round(entry["height"] * width / entry["width"])
+            resized = (im if width == entry["width"] else
+                       im.resize((width, height), Image.LANCZOS))
+            for fmt in variant_formats:
+                if width == entry["width"] and fmt == "png":
+                    continue
+                fname = "{}-{}w.{}".format(base, width, fmt)
+                path = os.path.join(thumbnail_dir, fname)
+                if fmt == "png":
+                    resized.save(path, optimize=True)
+                else:
+                    resized.save(path, quality=80)
+                variants.append({"file": fname, "format": fmt,
+                                 "width": width, "height": height,
+                                 "bytes": os.path.getsize(path)})
+    entry["variants"] = variants
+    return entry
+
+
+def make_thumbnail(pdf, source_hash=None, entry=None):
+    """Rasterize the first page of a poster, and make its variants.
+
+    :pdf: file name of the poster PDF
+    :source_hash: hash of the PDF if already known
+    :entry: manifest entry of an up to date thumbnail that only needs its
+        description and variants
+    :returns: (manifest entry, seconds taken)
+    """
+    start = time.perf_counter()
+    if entry is None:
+        thumbnail = thumbnail_name(pdf)
+        subprocess.run(["convert", "-thumbnail", "x{}".format(thumbnail_height),
+                        pdf + "[0]", os.path.join(thumbnail_dir, thumbnail)],
+                       check=True)
+        entry = {
+            "source": pdf,
+            "thumbnail": thumbnail,
+            "source_hash": source_hash or file_hash(pdf),
+        }
+    describe_thumbnail(entry)
+    make_variants(entry)
+    return entry, time.perf_counter() - start
+
+
+def make_thumbnails(pdfs, workers=None):
+    """Make the thumbnails of all posters that need one.
+
+    :pdfs: list of poster PDF file names
+    :workers: number of processes, defaults to the number of available cores
+    :returns: the updated manifest
+    """
+    if workers is None:
+        # sched_getaffinity is only available on Linux
+        affinity = getattr(os, "sched_getaffinity", None)
+        workers = len(affinity(0)) if affinity else os.cpu_count() or 1
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    previous = read_manifest()
+    # Only posters that are still there are kept in the manifest
+    manifest = {}
+
+    todo = []
+    for pdf in pdfs:
+        poster = pdf.split(".")[0]
+        up_to_date, source_hash = is_up_to_date(pdf, previous.get(poster))
+        if up_to_date:
+            if source_hash:
+                # Same content, so do not hash it again on the next run
+                os.utime(os.path.join(thumbnail_dir, thumbnail_name(pdf)))
+            entry = previous.get(poster) or {
+                "source": pdf,
+                "thumbnail": thumbnail_name(pdf),
+                "source_hash": source_hash or file_hash(pdf),
+            }
+            if "variants" in entry and all(
+                    os.path.isfile(os.path.join(thumbnail_dir, v["file"]))
+                    for v in entry["variants"]):
+                manifest[poster] = entry
+            else:
+                todo.append((pdf, None, entry))
+        else:
+            todo.append((pdf, source_hash, None))
+
+    print("{} posters, {} thumbnails to make on {} processes".format(
+        len(pdfs), len(todo), workers), file=sys.stderr)
+
+    made = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(make_thumbnail, pdf, source_hash, entry): pdf
+                   for pdf, source_hash, entry in todo}
+        for future in as_completed(futures):
+            pdf = futures[future]
+            try:
+                entry, seconds = future.result()
+            except (subprocess.CalledProcessError, OSError, ValueError) as e:
+                # convert failed, or Pillow could not read or save the image
+                print("ERROR: {}: {}".format(pdf, e), file=sys.stderr)
+                continue
+            manifest[pdf.split(".")[0]] = entry
+            made += 1
+            print("{}: {:.2f}s".format(pdf, seconds), file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    if todo:
+        print("Made {} of {} thumbnails in {:.2f}s ({:.2f} posters/s)".format(
+            made, len(todo), elapsed, made / elapsed), file=sys.stderr)
+
+    write_manifest(manifest)
+    return manifest
+
+
+if __name__ == "__main__":
+    pdfs = sorted(f for f in os.listdir(".") if f.endswith(".pdf"))
+    make_thumbnails(pdfs)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Build the search index for the poster gallery.
+
+The poster IDs are joined with the Confmaster submission export (the same
+export that check_confmaster_registrations.py reads) to get the title,
+authors and keywords of each poster. The export must have these columns:
+
+- PaperID, Title, Authors and Keywords, as in the Confmaster export
+- Label, optional: the poster ID of the submission, e.g. P123
+
+Without a Label column, the poster IDs are taken to be "P" + PaperID, which
+only holds if the posters were numbered by their Confmaster paper ID. If they
+were numbered otherwise, add a Label column to the export before building
+the gallery. Posters that match no submission are reported by
+make-html-gallery.py, and are indexed by their ID only.
+
+The index is written as compact JSON:
+
+    {
+        "posters": [[id, title, authors, url], ...],
+        "index": {token: [position in posters, ...], ...}
+    }
+
+so that gallery-search.js can search and filter in the browser without a
+server.
+
+File: poster_index.py
+"""
+
+import csv
+import json
+import re
+
+
+index_fn = "search-index.json"
+token_regex = re.compile(r"\w+")
+# Confmaster lists authors as "First Last (#123)"
+author_id_regex = re.compile(r"\s*\(#?\d+\)")
+
+
+def read_submissions(filename):
+    """Read the Confmaster submission export.
+
+    :filename: csv export of the submissions
+    :returns: dict of poster ID to dict with title, authors and keywords
+    :raises ValueError: if the export has neither a Label nor a PaperID column
+    """
+    submissions = {}
+    with open(filename, 'r', newline='') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
+        if not {"Label", "PaperID"} & set(reader.fieldnames or []):
+            raise ValueError("{}: a Label or PaperID column is needed to "
+                             "match the posters".format(filename))
+        for row in reader:
+            label = row.get("Label") or "P{}".format(row["PaperID"])
+            submissions[label.strip()] = {
+                "title": row.get("Title", "").strip(),
+                "authors": author_id_regex.sub("", row.get("Authors", "")).strip(),
+                "keywords": row.get("Keywords", "").strip(),
+            }
+    return submissions
+
+
+def unmatched_posters(posters, submissions):
+    """Get the posters that match no submission.
+
+    :posters: poster IDs
+    :submissions: dict returned by read_submissions
+    :returns: list of poster IDs, in the order given
+    """
+    return [poster for poster in posters if poster not in submissions]
+
+
+def tokenize(text):
+    """Split text into lower case search tokens.
+
+    :text: string
+    :returns: set of tokens
+    """
+    return set(token_regex.findall(text.casefold()))
+
+
+def build_index(posters, submissions, url_prefix):
+    """Build the inverted index.
+
+    :posters: poster IDs, in display order
+    :submissions: dict returned by read_submissions
+    :url_prefix: URL of the directory with the poster PDFs
+    :returns: dict with "posters" and "index"
+    """
+    docs = []
+    index = {}
+    for position, poster in enumerate(posters):
+        info = submissions.get(poster, {})
+        docs.append([poster, info.get("title", ""), info.get("authors", ""),
+                     url_prefix + poster + ".pdf"])
+        text = " ".join([poster, info.get("title", ""), info.get("authors", ""),
+                         info.get("keywords", "")])
+        for token in tokenize(text):
+            index.setdefault(token, []).append(position)
+    return {"posters": docs, "index": index}
+
+
+def write_index(index, filename=index_fn):
+    """Write the index as compact JSON.
+
+    :index: dict returned by build_index
+    :filename: output file
+    :returns: nothing
+    """
+    with open(filename, 'w') as fh:
+        json.dump(index, fh, separators=(",", ":"), ensure_ascii=False)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Rename and validate the poster PDFs before the gallery is built.
+
+Posters are uploaded as `P123 - Title.pdf` and are renamed to `P123.pdf`.
+This must be run in the directory where all the PDF files are.
+
+Before anything is renamed, all files are checked, and nothing is renamed if
+there is a problem:
+
+- files whose name does not start with a poster ID
+- several files with the same poster ID, including a renamed file that would
+  overwrite an existing `P123.pdf`
+- files that are not valid PDFs: the header or the end of file marker is
+  missing, or no pages are found
+
+The PDF checks run in parallel. With --dry-run, the report is printed and
+nothing is renamed. The script exits with a non zero status if there are
+problems, so that a build can stop before the thumbnails are made.
+
+File: rename_posters.py
+"""
+
+import argparse
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+
+poster_regex = re.compile(r"^(P\d+)\b.*\.pdf$", re.IGNORECASE)
+page_regex = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+count_regex = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|"
+                         rb"/Count\s+(\d+)[^>]*?/Type\s*/Pages\b")
+chunk_size = 1 << 20
+# Longest match of the regexes that is looked for across two chunks
+chunk_overlap = 4096
+
+
+def plan_renames(filenames):
+    """Work out the new name of every poster.
+
+    :filenames: list of PDF file names
+    :returns: (dict of old name to new name, list of problems)
+    """
+    renames = {}
+    problems = []
+    targets = {}
+    for fname in sorted(filenames):
+        match = poster_regex.match(fname)
+        if not match:
+            problems.append("{}: no poster ID in the file name".format(fname))
+            continue
+        target = match.group(1).upper() + ".pdf"
+        if target in targets:
+            problems.append("{}: same poster ID as {}".format(
+                fname, targets[target]))
+            continue
+        targets[target] = fname
+        renames[fname] = target
+    return renames, problems
+
+
+def scan_pages(fh):
+    """Find the page counts and page objects of a PDF, a chunk at a time.
+
+    :fh: PDF file, opened in binary mode
+    :returns: (list of /Count values of the page trees, number of page
+        objects)
+    """
+    counts = []
+    page_objects = 0
+    carry = b""
+    for block in iter(lambda: fh.read(chunk_size), b""):
+        data = carry + block
+        # Matches that start in the last chunk_overlap bytes are counted
+        # with the next chunk, where they are complete
+        cut = max(len(data) - chunk_overlap, 0)
+        counts += [int(a or b) for a, b in count_regex.findall(data)]
+        page_objects += sum(1 for m in page_regex.finditer(data)
+                            if m.start() < cut)
+        carry = data[cut:]
+    page_objects += len(page_regex.findall(carry))
+    return counts, page_objects
+
+
+def count_pages(fname):
+    """Check that a file looks like a PDF, and count its pages.
+
+    The file is read in chunks, so that large posters are not read into
+    memory at once.
+
+    :fname: PDF file name
+    :returns: (file name, number of pages, or None if unknown, error or None)
+    """
+    try:
+        with open(fname, 'rb') as fh:
+            if not fh.read(1024).lstrip().startswith(b"%PDF-"):
+                return fname, None, "no PDF header"
+            size = fh.seek(0, os.SEEK_END)
+            fh.seek(max(size - 2048, 0))
+            if b"%%EOF" not in fh.read():
+                return (fname, None,
+                        "no end of file marker, the file may be truncated")
+            fh.seek(0)
+            counts, page_objects = scan_pages(fh)
+    except OSError as e:
+        return fname, None, str(e)
+
+    if counts:
+        pages = max(counts)
+    else:
+        # Page objects may be compressed in object streams, where they
+        # cannot be counted without a PDF library
+        pages = page_objects or None
+    if pages == 0:
+        return fname, pages, "no pages"
+    return fname, pages, None
+
+
+def validate_pdfs(filenames, workers=None):
+    """Check all PDFs in parallel.
+
+    :filenames: list of PDF paths
+    :workers: number of processes, defaults to the number of available cores
+    :returns: (dict of file name to number of pages for the valid PDFs,
+        list of problems)
+    """
+    if workers is None:
+        # sched_getaffinity is only available on Linux
+        affinity = getattr(os, "sched_getaffinity", None)
+        workers = len(affinity(0)) if affinity else os.cpu_count() or 1
+    pages = {}
+    problems = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for fname, num_pages, error in executor.map(count_pages, filenames,
+                                                    chunksize=16):
+            fname = os.path.basename(fname)
+            if error:
+                problems.append("{}: {}".format(fname, error))
+            else:
+                pages[fname] = num_pages
+    return pages, problems
+
+
+def check_posters(directory=".", dry_run=False):
+    """Validate and rename all posters in a directory.
+
+    :directory: directory with the poster PDFs
+    :dry_run: only print the report
+    :returns: True if there were no problems
+    """
+    filenames = [f for f in os.listdir(directory)
+                 if f.lower().endswith(".pdf") and
+                 os.path.isfile(os.path.join(directory, f))]
+    renames, problems = plan_renames(filenames)
+    pages, pdf_problems = validate_pdfs(
+        [os.path.join(directory, f) for f in filenames])
+    problems += pdf_problems
+
+    to_rename = {old: new for old, new in renames.items() if old != new}
+    print("{} posters, {} to rename, {} problems".format(
+        len(filenames), len(to_rename), len(problems)), file=sys.stderr)
+    for old, new in sorted(to_rename.items()):
+        print("{} {} -> {}".format("Would rename" if dry_run else "Renaming",
+                                   old, new), file=sys.stderr)
+    unknown = [f for f, n in pages.items() if n is None]
+    if unknown:
+        print("Could not count the pages of {} posters".format(len(unknown)),
+              file=sys.stderr)
+    for problem in problems:
+        print("ERROR: {}".format(problem), file=sys.stderr)
+
+    if problems or dry_run:
+        return not problems
+
+    for old, new in to_rename.items():
+        os.rename(os.path.join(directory, old), os.path.join(directory, new))
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rename and validate the poster PDFs")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only report, do not rename anything")
+    args = parser.parse_args()
+
+    sys.exit(0 if check_posters(".", args.dry_run) else 1)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Index of who attends what, as bitmaps over the registrants.
+
+Each registrant of the master table gets a dense id, 0 to n - 1, in the
+order of their e-mails, and each event, add on and category is a bitmap with
+bit i set if registrant i has it:
+
+- main_meeting, workshops, tutorials
+- banquet (at least one ticket), special_meal, invitation_letter
+- member, and group:<Registration Group>
+- meal:<Special Meal>, shirt:<size>
+
+add_extras appends the meal of the extras export to the one of the receipt
+without a separator, e.g. "VeganVegan" or "Gluten freeVegetarian". The meal
+bitmaps split these values on the meals of `special_meals`, so a registrant
+is in meal:Vegan once, and in both meal:Gluten free and meal:Vegetarian.
+
+The index is stored in the database next to the master table:
+
+    attendees (id INTEGER PRIMARY KEY, "Email")
+    attendance_bitmaps (name TEXT PRIMARY KEY, bitmap BLOB, registrants INT)
+
+and registration-metrics-sqlite.py builds it on import, after the extras are
+added. Questions over several events are then bit operations, e.g. workshop
+attendees without a banquet ticket who need a special meal:
+
+    attendance_index.py count "workshops & ~banquet & special_meal"
+    attendance_index.py list "tutorials & group:Student"
+
+Expressions use & (and), | (or) and ~ (not), with parentheses.
+The catering and room planning reports are made from the index too:
+
+    attendance_index.py report catering|rooms
+
+The banquet line of the catering report is the number of tickets, not of
+registrants, since registrants can buy tickets for guests.
+
+File: attendance_index.py
+"""
+
+import argparse
+import re
+import sys
+import textwrap
+import sqlite3
+
+
+master_table = "registration_master"
+# Bitmaps of the conditions on the master table
+events = {
+    "main_meeting": """"Main meeting Registration" == 'Y'""",
+    "workshops": """"Workshop Registration" == 'Y'""",
+    "tutorials": """"Tutorial Registration" == 'Y'""",
+    "banquet": '"Banquet Tickets" > 0',
+    "special_meal": """"Special Meal" != ''""",
+    "invitation_letter": """"Invitation Letter" == 'Yes'""",
+    "member": """"OCNS Member" == 'Y'""",
+}
+# Bitmaps of each value of these columns, named <prefix>:<value>
+categories = {
+    "group": "Registration Group",
+    "meal": "Special Meal",
+}
+shirt_sizes = ["S", "M", "L", "XL"]
+# Meals offered in the registration forms, to split concatenated values
+special_meals = ["Vegetarian", "Vegan", "Gluten free", "Kosher", "Halal"]
+meal_regex = re.compile("({})".format("|".join(
+    re.escape(m) for m in sorted(special_meals, key=len, reverse=True))),
+    re.IGNORECASE)
+
+
+def split_meals(value):
+    """Split a Special Meal value into the meals it names.
+
+    :value: e.g. "Gluten freeVegetarian"
+    :returns: set of meals, e.g. {"Gluten free", "Vegetarian"}. Text that is
+        not one of special_meals is kept as it is.
+    """
+    canonical = {m.lower(): m for m in special_meals}
+    meals = set()
+    for part in meal_regex.split(value or ""):
+        part = part.strip()
+        if part and part.lower() != "none":
+            meals.add(canonical.get(part.lower(), part))
+    return meals
+
+
+def build(conn, master=master_table):
+    """Build the index from the master table, replacing the previous one.
+
+    :conn: sqlite3 connection
+    :master: name of the master table
+    :returns: number of registrants indexed
+    """
+    columns = ["({})".format(c) for c in events.values()]
+    columns += ['"{}"'.format(c) for c in categories.values()]
+    columns += ['"Shirt {}" > 0'.format(size) for size in shirt_sizes]
+    rows = conn.execute(textwrap.dedent(
+        """\
+        SELECT "Email", {} FROM {}\
+        ORDER BY "Email"
+        """
+    ).format(", ".join(columns), master)).fetchall()
+
+    size = (len(rows) + 7) // 8
+    bitmaps = {}
+
+    def set_bit(name, i):
+        if name not in bitmaps:
+            bitmaps[name] = bytearray(size)
+        bitmaps[name][i >> 3] |= 1 << (i & 7)
+
+    names = (list(events) + list(categories) +
+             ["shirt:{}".format(s) for s in shirt_sizes])
+    for i, row in enumerate(rows):
+        for name, value in zip(names, row[1:]):
+            if name == "meal":
+                for meal in split_meals(value):
+                    set_bit("meal:{}".format(meal), i)
+            elif name in categories:
+                if value:
+                    set_bit("{}:{}".format(name, value), i)
+            elif value:
+                set_bit(name, i)
+    for name in names:
+        if name not in categories and name not in bitmaps:
+            bitmaps[name] = bytearray(size)
+
+    with conn:
+        conn.execute("DROP TABLE IF EXISTS attendees")
+        conn.execute("DROP TABLE IF EXISTS attendance_bitmaps")
+        conn.execute('CREATE TABLE attendees (id INTEGER PRIMARY KEY, '
+                     '"Email" TEXT)')
+        conn.execute("CREATE TABLE attendance_bitmaps (name TEXT PRIMARY KEY, "
+                     "bitmap BLOB, registrants INT)")
+        conn.executemany("INSERT INTO attendees VALUES (?, ?)",
+                         ((i, row[0]) for i, row in enumerate(rows)))
+        conn.executemany(
+            "INSERT INTO attendance_bitmaps VALUES (?, ?, ?)",
+            ((name, bytes(bitmap), bit_count(int.from_bytes(bitmap, "little")))
+             for name, bitmap in sorted(bitmaps.items())))
+    return len(rows)
+
+
+def bit_count(bitmap):
+    """Get the number of bits set in a bitmap."""
+    return bin(bitmap).count("1")
+
+
+class AttendanceIndex():
+
+    """Bitmaps of the attendance index, read from the database."""
+
+    def __init__(self, conn):
+        """Initialise
+
+        :conn: sqlite3 connection to a database with the index
+        """
+        self.conn = conn
+        self.bitmaps = {
+            name: int.from_bytes(bitmap, "little") for name, bitmap in
+            conn.execute("SELECT name, bitmap FROM attendance_bitmaps")}
+        self.size = conn.execute("SELECT COUNT(*) FROM attendees").fetchone()[0]
+        self.everyone = (1 << self.size) - 1
+
+    def get(self, name):
+        """Get a bitmap by name, empty if nobody has it."""
+        if name not in self.bitmaps and name.split(":")[0] not in categories:
+            raise KeyError("Unknown bitmap: {}".format(name))
+        return self.bitmaps.get(name, 0)
+
+    def query(self, expression):
+        """Evaluate an expression over the bitmaps.
+
+        :expression: e.g. "workshops & ~banquet & (meal:Vegan | meal:Kosher)"
+        :returns: bitmap
+        """
+        tokens = [t.strip() for t in re.split(r"([&|~()])", expression)
+                  if t.strip()]
+        bitmap, rest = self.__parse_or(tokens)
+        if rest:
+            raise ValueError("Unexpected {!r} in {!r}".format(rest[0],
+                                                              expression))
+        return bitmap
+
+    def __parse_or(self, tokens):
+        """Parse "a | b | ...", returning the bitmap and the tokens left."""
+        bitmap, tokens = self.__parse_and(tokens)
+        while tokens and tokens[0] == "|":
+            right, tokens = self.__parse_and(tokens[1:])
+            bitmap |= right
+        return bitmap, tokens
+
+    def __parse_and(self, tokens):
+        """Parse "a & b & ...", returning the bitmap and the tokens left."""
+        bitmap, tokens = self.__parse_not(tokens)
+        while tokens and tokens[0] == "&":
+            right, tokens = self.__parse_not(tokens[1:])
+            bitmap &= right
+        return bitmap, tokens
+
+    def __parse_not(self, tokens):
+        """Parse "~a", "(...)" or a name."""
+        if not tokens:
+            raise ValueError("Incomplete expression")
+        if tokens[0] == "~":
+            bitmap, tokens = self.__parse_not(tokens[1:])
+            return self.everyone & ~bitmap, tokens
+        if tokens[0] == "(":
+            bitmap, tokens = self.__parse_or(tokens[1:])
+            if not tokens or tokens[0] != ")":
+                raise ValueError("Missing )")
+            return bitmap, tokens[1:]
+        if tokens[0] in ["&", "|", ")"]:
+            raise ValueError("Unexpected {!r}".format(tokens[0]))
+        return self.get(tokens[0]), tokens[1:]
+
+    def count(self, expression):
+        """Count the registrants matching an expression."""
+        return bit_count(self.query(expression))
+
+    def emails(self, bitmap):
+        """Get the e-mails of the registrants of a bitmap, in id order."""
+        ids = [i * 8 + bit
+               for i, byte in enumerate(bitmap.to_bytes((self.size + 7) // 8,
+                                                        "little"))
+               if byte for bit in range(8) if byte >> bit & 1]
+        emails = dict(self.conn.execute("SELECT id, \"Email\" FROM attendees"))
+        return [emails[i] for i in ids]
+
+    def values(self, prefix):
+        """Get the names of the bitmaps of a category, e.g. meal."""
+        return sorted(n for n in self.bitmaps
+                      if n.startswith("{}:".format(prefix)))
+
+
+def catering_report(index, master=master_table):
+    """Get the numbers the caterers need.
+
+    :index: AttendanceIndex
+    :master: name of the master table, for the banquet tickets
+    :returns: list of (what, registrants), or tickets for the banquet line
+    """
+    report = []
+    for event in ["main_meeting", "workshops", "tutorials", "banquet"]:
+        if event == "banquet":
+            tickets = index.conn.execute(
+                'SELECT SUM("Banquet Tickets") FROM {}'.format(
+                    master)).fetchone()[0]
+            report.append(("banquet tickets", tickets or 0))
+        else:
+            report.append((event, index.count(event)))
+        for meal in index.values("meal"):
+            report.append(("  {}".format(meal),
+                           bit_count(index.get(event) & index.get(meal))))
+    return report
+
+
+def rooms_report(index):
+    """Get the numbers the room planning needs.
+
+    :index: AttendanceIndex
+    :returns: list of (what, registrants)
+    """
+    report = [(event, index.count(event))
+              for event in ["main_meeting", "workshops", "tutorials"]]
+    report += [
+        ("workshops and tutorials", index.count("workshops & tutorials")),
+        ("workshops only", index.count("workshops & ~main_meeting & ~tutorials")),
+        ("tutorials only", index.count("tutorials & ~main_meeting & ~workshops")),
+        ("main meeting only",
+         index.count("main_meeting & ~workshops & ~tutorials")),
+    ]
+    for group in index.values("group"):
+        report.append((group, bit_count(index.get(group) &
+                                        index.get("main_meeting"))))
+    return report
+
+
+reports = {"catering": catering_report, "rooms": rooms_report}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Query the attendance index")
+    parser.add_argument("--db", default="CNS2019.sqlite",
+                        help="database written by registration-metrics-sqlite.py")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="build the index again")
+    count_parser = subparsers.add_parser(
+        "count", help="count the registrants matching an expression")
+    count_parser.add_argument("expression")
+    list_parser = subparsers.add_parser(
+        "list", help="list the e-mails of the registrants matching an "
+        "expression")
+    list_parser.add_argument("expression")
+    report_parser = subparsers.add_parser("report", help="print a report")
+    report_parser.add_argument("report", choices=reports)
+    subparsers.add_parser("bitmaps", help="list the bitmaps")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.command == "build":
+        print("{} registrants indexed".format(build(conn)), file=sys.stderr)
+        sys.exit(0)
+
+    index = AttendanceIndex(conn)
+    try:
+        if args.command == "count":
+            print(index.count(args.expression))
+        elif args.command == "list":
+            for email in index.emails(index.query(args.expression)):
+                print(email)
+        elif args.command == "bitmaps":
+            for name, registrants in conn.execute(
+                    "SELECT name, registrants FROM attendance_bitmaps "
+                    "ORDER BY name"):
+                print("{}: {}".format(name, registrants))
+        else:
+            for what, registrants in reports[args.report](index):
+                print("{:40} {}".format(what, registrants))
+    except (KeyError, ValueError) as e:
+        print("ERROR: {}".format(e.args[0]), file=sys.stderr)
+        sys.exit(1)
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 import csv
 import sys
-import time
 import os
 
 from docx import Document
@@ -11,6 +10,10 @@ document = Document()
 
 from collections import OrderedDict
 
+from registrant import (Registrant, paid_flags, shirt_sizes, MAIN_MEETING,
+                        TUTORIAL, WORKSHOPS_1DAY, WORKSHOPS_2DAY)
+from review_rules import Rules
+
 registered_email         = OrderedDict()
 registered_fullname      = OrderedDict()
 conf_year                = 2019
@@ -19,6 +22,7 @@ main_registrations_csv   = 'Main2019.csv'   #  All reciepts exported, e.g. Expor
 add_to_registrations_csv = 'AddToReg2019.csv'   #  Add to regs..
 extras_csv               = 'AddExtras2019.csv'   #  Extras..
 display                  = True
+prior_answers            = ['review-answers-2018.json']   #  Answers to the review queue of earlier years
 countries                = {}
 
 tshirts = {'S'  : 0,
@@ -63,59 +67,19 @@ to_write_badges = {"Name" : 'full_name',
                     "Country" : 'country'}
 
 
-def query_yes_no(question, default="yes"):
-    """Ask a yes/no question via raw_input() and return their answer.
-
-    "question" is a string that is presented to the user.
-    "default" is the presumed answer if the user just hits <Enter>.
-        It must be "yes" (the default), "no" or None (meaning
-        an answer is required of the user).
-
-    The "answer" return value is True for "yes" or False for "no".
-    """
-    valid = {"yes": True, "y": True, "ye": True,
-             "no": False, "n": False}
-    if default is None:
-        prompt = " [y/n] "
-    elif default == "yes":
-        prompt = " [Y/n] "
-    elif default == "no":
-        prompt = " [y/N] "
-    else:
-        raise ValueError("invalid default answer: '%s'" % default)
-
-    while True:
-        sys.stdout.write(question + prompt)
-        sys.stdout.flush()
-        choice = raw_input().lower()
-        if default is not None and choice == '':
-            return valid[default]
-        elif choice in valid:
-            return valid[choice]
-        else:
-            sys.stdout.write("Please respond with 'yes' or 'no' "
-                             "(or 'y' or 'n').\n")
-
-def find_best_user(row, registered_email):
-    print('%s is not found in the main registration! Trying to auto guess...' %email)
-    from difflib import SequenceMatcher
-    best_ratio  = 0
-    last_name   = row['Last Name'].strip().title()
-    middle_name = row['Middle Name'].strip()
-    first_name  = row['First Name'].strip().title()
-    full_name   = '%s %s'%(last_name, first_name)
-
-    for user in registered_email.keys():
-        ratio_1 = SequenceMatcher(None, email, registered_email[user]['email']).ratio()
-        ratio_2 = SequenceMatcher(None, full_name, registered_email[user]['full_name']).ratio()
-        ratio   =  ratio_1 + ratio_2
-        if ratio > best_ratio:
-            best_user  = user
-            best_ratio = ratio
-    print('Best match found for %s is user %s' %(email, best_user))
-    return best_user
+def count_items(flags):
+    """Count the items of a registrant in the meeting totals."""
+    if flags & MAIN_MEETING:
+        meeting['main'] +=1
+    if flags & TUTORIAL:
+        meeting['tutorial'] +=1
+    if flags & WORKSHOPS_1DAY:
+        meeting['ws1'] +=1
+    if flags & WORKSHOPS_2DAY:
+        meeting['ws2'] +=1
 
 
+rules = Rules(prior_answers)
 
 with open(main_registrations_csv, 'r') as csvfile:
 
@@ -123,110 +87,36 @@ with open(main_registrations_csv, 'r') as csvfile:
 
     for count, row in enumerate(reader):
 
-        user = {}
-        user['email'] = row['Email']
+        user = Registrant(row)
 
         if display:
-            print('Handling registration for %s'%user['email'])
-
-        last_name     = row['Last Name'].strip().title()
-        middle_name   = row['Middle Name'].strip()
-        first_name    = row['First Name'].strip().title()
-        user['name']  = ('<b>%s</b> %s %s'%(last_name, first_name, middle_name)).strip()
-        user['full_name']   = '%s %s'%(last_name, first_name)
-        user['first_name']  = '%s' %first_name
-        user['middle_name'] = '%s' %middle_name
-        user['last_name']   = '%s' %last_name
-
-        date         = row['Submit Date']
-        user['date'] = time.strptime(date, '%m/%d/%Y %H:%M:%S')
-
-        reg_nm = row['Reg Fee (Non-Member)']
-        reg_f  = row['Reg Fee (Faculty)']
-        reg_p  = row['Reg Fee (Postdoc)']
-        reg_s  = row['Reg Fee (Student)']
-        reg_type = row['Registration Type']
-
-        user['type'] = 'Non member' if len(reg_nm)>0 else ('Faculty' if len(reg_f)>0 else ('Postdoc' if len(reg_p)>0 else 'Student'))
-        payment_info = reg_nm+reg_f+reg_p+reg_s
-
-        if user['type'] in ['Faculty', 'Postdoc', 'Student']:
-            members[user['type'].lower()] +=1
+            print('Handling registration for %s'%user.email)
+
+        reg_type = user.reg_type
+
+        if user.fee_type in ['Faculty', 'Postdoc', 'Student']:
+            members[user.fee_type.lower()] +=1
         elif reg_type in ['Faculty', 'Postdoc', 'Student']:
             non_members[reg_type.lower()] += 1
         else:
-            print('Problem at line %d with user %s %s %s'%(count, user['email'], user['type'], reg_type))
-            print('Press f/p/s if you know Faculty/Postdoc/student, q to quit')
-            key = ''
-            while key not in ['f', 'p', 's', 'q']:
-                key = raw_input('').lower()
-
-            if key == "q":
-                sys.exit()
-            elif key == 's':
-                non_members['student'] += 1
-                reg_type = 'Student'
-            elif key == 'f':
-                non_members['faculty'] += 1
-                reg_type = 'Faculty'
-            elif key == 'p':
-                non_members['postdoc'] += 1
-                reg_type = 'Postdoc'
-
-
-        user['type0'] = '%s %s'%(user['type'], reg_type if len(reg_type)>0 else 'Member')
-        user['paid']  = ''
-
-        if 'Main Meeting' in payment_info:
-            user['paid'] += 'MM '
-            meeting['main'] +=1
-
-        if 'Tutorial' in payment_info:
-            user['paid'] += 'T '
-            meeting['tutorial']+=1
-
-        if 'Workshops 1 Day Only' in payment_info:
-            user['paid'] += 'WS1day '
-            meeting['ws1']+=1
-
-        elif 'Workshops' in payment_info:
-            user['paid'] += 'WS2day '
-            meeting['ws2']+=1
-
-        shirt = ''
-        for size in ['S', 'M', 'L', 'XL']:
-            nb_shirt = row['Shirt {}'.format(size)]
-            if int(nb_shirt) > 0: shirt += nb_shirt + ' * {} '.format(size)
-            user['shirt'] = shirt
-            tshirts[size]+= int(nb_shirt)
-
-        banquet = row['BanquetTickets']
-        extraba = row['ExtraBanquetTickets']
-        meal    = row['Special Meal']
-
-        user['banquet']      = '%s'%('' if banquet == '0' else banquet)
-        user['extrabanquet'] = '%s'%('' if extraba == '0' else extraba)
-        extras['banquet']   += int(banquet) + int(extraba)
-        user['meal']         = meal
-
-        inst = row['Institution'].strip()
-        city = row['City'].strip()
-
-        country = row['Country'].strip()
-        user['location'] = '%s, %s'%(inst, country)
-        user['inst']     = inst
-        user['country']  = country
-        user['city']     = city
-
-        if not country in countries.keys():
-            countries[country] = 0
-        countries[country] +=1
-
-        balance = -1*float(row['Balance'])
-        user['balance'] = '' if balance==0 else '${:10.2f}'.format(balance)
-
-        registered_email[user['email']] = user
-        registered_fullname[user['full_name']] = user
+            reg_type = rules.member_type(user, count)
+            if reg_type is not None:
+                non_members[reg_type.lower()] += 1
+                user.reg_type = reg_type
+
+        count_items(user.paid_items)
+
+        for size in shirt_sizes:
+            tshirts[size] += user.shirts(size)
+
+        extras['banquet'] += user.banquet_tickets + user.extrabanquet_tickets
+
+        if not user.country in countries.keys():
+            countries[user.country] = 0
+        countries[user.country] +=1
+
+        registered_email[user.email] = user
+        registered_fullname[user.full_name] = user
 
 
 print('Processed %d Main Registrations' %len(registered_email))
@@ -242,56 +132,14 @@ if os.path.exists(add_to_registrations_csv):
             email = row['Email']
             if display:
                 print('Add items to registration of %s'%email)
-            if email in registered_email:
-                user = registered_email[email]
-            else:
-                best_user = find_best_user(row, registered_email)
-                accept = query_yes_no('Do you want to merge users?')
-                if accept:
-                    user = registered_email[best_user]
-                else:
-                    print('Please find a match for user %s in file %s' %(email, add_to_registrations_csv))
-                    sys.exit()
-
-            changed = False
-
-            reg_nm = row['Reg Fee (Non-Member)']
-            reg_f  = row['Reg Fee (Faculty)']
-            reg_p  = row['Reg Fee (Postdoc)']
-            reg_s  = row['Reg Fee (Student)']
-
-            payment_info = reg_nm+reg_f+reg_p+reg_s
+            user = rules.match(row, add_to_registrations_csv, registered_email)
+            if user is None:
+                continue
 
-            #if display:
-            #    print('Paid: %s'%payment_info)
-
-            curr = user['paid']
-
-            if 'Main Meeting' in payment_info:
-                if curr.find('MM') == -1:
-                    curr += ' MM '
-                meeting['main'] +=1
-                changed = True
-
-            if 'Tutorial' in payment_info:
-                if curr.find('T') == -1:
-                    curr += ' T '
-                meeting['tutorial']+=1
-                changed = True
-
-            if 'Workshops 1 Day Only' in payment_info:
-                if curr.find('WS1day') == -1:
-                    curr += ' WS1day'
-                meeting['ws1'] +=1
-                changed = True
-
-            elif 'Workshops' in payment_info:
-                if curr.find('WS2day') == -1:
-                    curr += ' WS2day '
-                meeting['ws2'] +=1
-                changed = True
-
-            user['paid'] = curr
+            flags = paid_flags(row)
+            count_items(flags)
+            user.paid_items |= flags
+            changed = flags != 0
 
             if not changed:
                 print('Please check: Nothing changed for {m} at line {l} !!'.format(m=email, l=count))
@@ -309,17 +157,9 @@ if os.path.exists(extras_csv):
             if display:
                 print('Add extras to registration of %s'%email)
 
-            if email in registered_email:
-                user = registered_email[email]
-            else:
-                best_user = find_best_user(row, registered_email)
-
-                accept = query_yes_no('Do you want to merge users?')
-                if accept:
-                    user = registered_email[best_user]
-                else:
-                    print('Please find a match for user %s in file %s' %(email, add_to_registrations_csv))
-                    sys.exit()
+            user = rules.match(row, extras_csv, registered_email)
+            if user is None:
+                continue
 
 
             changed = False
@@ -327,27 +167,20 @@ if os.path.exists(extras_csv):
             exbanq  = int(row['ExtraBanquetTickets'])
 
             if banq > 0:
-                curr = 0 if len(user['banquet']) == 0 else int(user['banquet'])
-                user['banquet'] = curr + banq
+                user.banquet_tickets += banq
                 changed = True
                 extras['banquet'] += banq
-                #print('Increasing banquet tickets from %d to %d'%(curr, user['banquet']))
 
             if exbanq > 0:
                 extras['banquet'] += exbanq
-                curr = 0 if len(user['extrabanquet']) == 0 else int(user['extrabanquet'])
-                user['extrabanquet'] = curr + exbanq
+                user.extrabanquet_tickets += exbanq
                 changed = True
-                #print('Increasing extra banquet tickets from %d to %d'%(curr, user['extrabanquet']))
-
-            for size in ['S', 'M', 'L', 'XL']:
-                nb_shirt = row['Shirt {}'.format(size)]
-                shirt = ''
-                if int(nb_shirt) > 0: shirt += nb_shirt + ' * {} '.format(size)
-                user['shirt'] += shirt
-                tshirts[size] += int(nb_shirt)
-                if int(nb_shirt) > 0:
-                    #print("Adding %d shirts of size %s" %(int(nb_shirt), size))
+
+            for size in shirt_sizes:
+                nb_shirt = int(row['Shirt {}'.format(size)])
+                user.add_shirts(size, nb_shirt)
+                tshirts[size] += nb_shirt
+                if nb_shirt > 0:
                     changed = True
 
             if not changed:
@@ -355,6 +188,8 @@ if os.path.exists(extras_csv):
 
 
 
+rules.write_queue()
+
 registrations = []
 for name in sorted(registered_fullname.keys()):
     user = registered_fullname[name]
@@ -364,8 +199,8 @@ for name in sorted(registered_fullname.keys()):
 balance_paid = []
 
 for reg in registrations:
-    if reg['email'] in balance_paid:
-        reg['balance'] = 'PAID'
+    if reg.email in balance_paid:
+        reg.balance_paid = True
 
 variables = {}
 variables['title'] = "CNS %d registrants" %conf_year
@@ -475,8 +310,8 @@ for reg in registrations:
     r = 0 if count in [0,1] else (1 if count in [2,3] else 2)
     c = 0 if count in [0,2,4] else 1
 
-    name = reg['full_name']
-    loc = reg['location']
+    name = reg.full_name
+    loc = reg.location
 
     mycell = table.rows[r].cells[c]
 
@@ -491,7 +326,7 @@ for reg in registrations:
     r2.font.size = Pt(8)
 
     p3 = mycell.add_paragraph()
-    r3 = p3.add_run('%s %s'%(reg['type0'], reg['paid']))
+    r3 = p3.add_run('%s %s'%(reg.type0, reg.paid))
     r3.font.size = Pt(8)
 
     p4 = mycell.add_paragraph()
@@ -502,8 +337,8 @@ for reg in registrations:
     run = paragraph.add_run()
     run.add_picture('ocns.png')
 
-    full_csv   += "\t".join([str(reg[value]).replace(',', ' ') for value in to_write_full.values()]) + "\n"
-    badges_csv += "\t".join([str(reg[value]).replace(',', ' ') for value in to_write_badges.values()]) + "\n"
+    full_csv   += "\t".join([str(getattr(reg, value)).replace(',', ' ') for value in to_write_full.values()]) + "\n"
+    badges_csv += "\t".join([str(getattr(reg, value)).replace(',', ' ') for value in to_write_badges.values()]) + "\n"
 
     count  += 1
     if count == 6:
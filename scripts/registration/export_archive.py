@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Archive the raw Memberclicks and Confmaster exports as Parquet files.
+
+Each export is converted once, and kept in a directory per export type and
+year:
+
+    archive/export=receipts/year=2019/part-0.parquet
+
+so that the exports of all years can be read back as one dataset, reading
+only the columns and the row groups needed. All columns are kept as text, as
+in the CSV, so nothing is lost in the conversion.
+
+Column names change between years. When an export is added, its columns can
+be renamed to the names used now, and the mapping is recorded in the schema
+registry, `archive/schemas.json`, with the source file, its hash and the
+number of rows:
+
+    {"receipts": {"2014": {"columns": {"Reg Fee (Faculty)": "Reg Fee (Faculty)", ...},
+                           "source": ..., "sha256": ..., "rows": ...}}}
+
+The reader API is `read_export`, with column projection and row filters in
+the form pyarrow takes them, e.g. [("Country", "==", "Germany")]. The
+exports of all years are read with one schema, the union of their columns,
+and a column that an export does not have is null for its year. Filter values
+are cast to the type of their column, so "year == 2019" works from the
+command line too.
+
+pyarrow is needed: pip install pyarrow
+
+Usage:
+
+    export_archive.py add receipts 2019 ReceiptExport.csv [--rename Old=New ...]
+    export_archive.py list
+    export_archive.py read receipts [--columns Email Country] \\
+        [--where Country == Germany] [--year 2018 2019]
+
+File: export_archive.py
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+archive_dir = "archive"
+registry_fn = "schemas.json"
+export_types = ["profiles", "receipts", "add_to_registration", "add_extras",
+                "active", "inactive", "submissions", "confmaster_users"]
+compression = "zstd"
+
+
+def require_pyarrow():
+    """Raise ImportError if pyarrow is not installed."""
+    if pa is None:
+        raise ImportError("pyarrow is needed for the export archive: "
+                          "pip install pyarrow")
+
+
+def partition_dir(export, year, archive=archive_dir):
+    """Get the directory of an export of a year."""
+    return os.path.join(archive, "export={}".format(export),
+                        "year={}".format(year))
+
+
+def read_registry(archive=archive_dir):
+    """Read the schema registry.
+
+    :archive: archive directory
+    :returns: dict of export to year to entry
+    """
+    fname = os.path.join(archive, registry_fn)
+    if not os.path.isfile(fname):
+        return {}
+    with open(fname, 'r') as fh:
+        return json.load(fh)
+
+
+def write_registry(registry, archive=archive_dir):
+    """Write the schema registry."""
+    with open(os.path.join(archive, registry_fn), 'w') as fh:
+        json.dump(registry, fh, indent=1, sort_keys=True)
+
+
+def file_hash(filename):
+    """Get the sha256 of a file."""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def add_export(export, year, filename, renames=None, archive=archive_dir):
+    """Convert an export to Parquet and record its schema.
+
+    Adding an export of a year again replaces it.
+
+    :export: one of export_types
+    :year: year of the export
+    :filename: CSV export
+    :renames: dict of column name in the export to the name used now
+    :archive: archive directory
+    :returns: registry entry of the export
+    """
+    require_pyarrow()
+    if export not in export_types:
+        raise ValueError("Unknown export type: {}".format(export))
+    renames = renames or {}
+
+    # Read the header first, to read every column as text
+    with open(filename, 'r', newline='') as fh:
+        header = next(csv.reader(fh), [])
+    table = pacsv.read_csv(
+        filename,
+        convert_options=pacsv.ConvertOptions(
+            column_types={c: pa.string() for c in header},
+            strings_can_be_null=False))
+    columns = {c: renames.get(c, c) for c in table.column_names}
+    unknown = set(renames) - set(columns)
+    if unknown:
+        raise ValueError("Not in {}: {}".format(filename,
+                                                ", ".join(sorted(unknown))))
+    table = table.rename_columns([columns[c] for c in table.column_names])
+
+    directory = partition_dir(export, year, archive)
+    os.makedirs(directory, exist_ok=True)
+    for old in os.listdir(directory):
+        os.remove(os.path.join(directory, old))
+    pq.write_table(table, os.path.join(directory, "part-0.parquet"),
+                   compression=compression)
+
+    registry = read_registry(archive)
+    entry = {"columns": columns, "source": os.path.basename(filename),
+             "sha256": file_hash(filename), "rows": table.num_rows,
+             "archived": datetime.now().isoformat(timespec="seconds")}
+    registry.setdefault(export, {})[str(year)] = entry
+    write_registry(registry, archive)
+    return entry
+
+
+def export_schema(export, archive=archive_dir):
+    """Get the schema of an export over all the years archived.
+
+    The columns of the exports of each year are unified, so that a column
+    only some years have is read as null for the others.
+
+    :export: one of export_types
+    :archive: archive directory
+    :returns: pyarrow.Schema, with the year last
+    """
+    require_pyarrow()
+    directory = os.path.join(archive, "export={}".format(export))
+    schemas = [pq.read_schema(os.path.join(root, name))
+               for root, _, names in sorted(os.walk(directory))
+               for name in sorted(names) if name.endswith(".parquet")]
+    if not schemas:
+        raise ValueError("No {} export archived".format(export))
+    return pa.unify_schemas(schemas + [pa.schema([("year", pa.int32())])])
+
+
+def cast_filter(schema, column, operator, value):
+    """Cast the value of a filter to the type of its column.
+
+    :schema: schema of the export
+    :returns: (column, operator, value)
+    """
+    if column not in schema.names:
+        raise ValueError("Unknown column: {}".format(column))
+    field_type = schema.field(column).type
+
+    def cast(v):
+        return pa.scalar(v).cast(field_type).as_py()
+
+    if operator in ["in", "not in"]:
+        if isinstance(value, str):
+            value = value.split(",")
+        return column, operator, [cast(v) for v in value]
+    return column, operator, cast(value)
+
+
+def read_export(export, columns=None, filters=None, years=None,
+                archive=archive_dir):
+    """Read an export of one or more years.
+
+    Only the columns asked for are read, and the filters are applied to the
+    row group statistics and the year directories before any data is read.
+    Columns missing from the export of a year are null for that year.
+
+    :export: one of export_types
+    :columns: columns to read, all by default. "year" is a column too.
+    :filters: list of (column, operator, value), all of which must hold
+    :years: years to read, all by default
+    :archive: archive directory
+    :returns: pyarrow.Table
+    """
+    schema = export_schema(export, archive)
+    for column in columns or []:
+        if column not in schema.names:
+            raise ValueError("Unknown column: {}".format(column))
+    filters = [cast_filter(schema, *f) for f in filters or []]
+    if years:
+        filters.append(("year", "in", [int(y) for y in years]))
+    partitioning = ds.partitioning(pa.schema([schema.field("year")]),
+                                   flavor="hive")
+    return pq.read_table(os.path.join(archive, "export={}".format(export)),
+                         columns=columns, filters=filters or None,
+                         schema=schema, partitioning=partitioning)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Archive the raw exports as Parquet files")
+    parser.add_argument("--archive", default=archive_dir,
+                        help="archive directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_parser = subparsers.add_parser("add", help="archive an export")
+    add_parser.add_argument("export", choices=export_types)
+    add_parser.add_argument("year", type=int)
+    add_parser.add_argument("filename", help="CSV export")
+    add_parser.add_argument("--rename", action="append", default=[],
+                            metavar="OLD=NEW",
+                            help="rename a column to the name used now")
+    subparsers.add_parser("list", help="list the archived exports")
+    read_parser = subparsers.add_parser(
+        "read", help="print an archived export as CSV")
+    read_parser.add_argument("export", choices=export_types)
+    read_parser.add_argument("--columns", nargs="+")
+    read_parser.add_argument("--where", nargs=3, action="append", default=[],
+                             metavar=("COLUMN", "OPERATOR", "VALUE"),
+                             help="only rows where the condition holds")
+    read_parser.add_argument("--year", nargs="+", type=int)
+    args = parser.parse_args()
+    if args.command != "list":
+        # Only listing works without pyarrow, reading the registry
+        try:
+            require_pyarrow()
+        except ImportError as e:
+            print("ERROR: {}".format(e), file=sys.stderr)
+            sys.exit(1)
+
+    if args.command == "add":
+        renames = dict(r.split("=", 1) for r in args.rename)
+        try:
+            entry = add_export(args.export, args.year, args.filename, renames,
+                               args.archive)
+        except ValueError as e:
+            print("ERROR: {}".format(e), file=sys.stderr)
+            sys.exit(1)
+        print("{} {}: {} rows from {}".format(args.export, args.year,
+                                              entry["rows"], entry["source"]),
+              file=sys.stderr)
+    elif args.command == "list":
+        for export, years in sorted(read_registry(args.archive).items()):
+            for year, entry in sorted(years.items()):
+                print("{} {}: {} rows, {} columns, from {}".format(
+                    export, year, entry["rows"], len(entry["columns"]),
+                    entry["source"]))
+    else:
+        try:
+            table = read_export(args.export, args.columns,
+                                [tuple(w) for w in args.where], args.year,
+                                args.archive)
+        except (ValueError, pa.ArrowInvalid) as e:
+            print("ERROR: {}".format(e), file=sys.stderr)
+            sys.exit(1)
+        pacsv.write_csv(table, sys.stdout.buffer)
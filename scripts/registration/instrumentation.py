@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Time and profile the stages of the registration scripts.
+
+Each stage is run inside `Instrumentation.stage`, or decorated with `stage`,
+and the following are recorded for it:
+
+- wall time and CPU time, including the CPU time of child processes such as
+  the sqlite3 command line tool
+- rows processed, as reported by the stage with `add_rows`
+- SQL statements issued on connections that were passed to `trace`
+- peak resident memory of the process and of its children so far
+
+One stage can also be profiled, either with cProfile, or with a sampling
+profiler that records the Python stack every few milliseconds of CPU time.
+The sampler has much less overhead than cProfile, so it shows where time goes
+in stages that issue many small SQL statements, and it writes the stacks in
+the "collapsed" format that flame graph tools read.
+
+The results can be written to a JSON report with `write_report`.
+
+File: instrumentation.py
+"""
+
+import cProfile
+import functools
+import json
+import pstats
+import signal
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+profilers = ["cprofile", "sample"]
+# CPU time between two samples of the sampling profiler, in seconds
+sample_interval = 0.005
+
+
+def peak_rss_kb():
+    """Get the peak resident memory of this process and of its children.
+
+    :returns: (self, children) in kB, or (None, None) if unknown
+    """
+    if resource is None:
+        return None, None
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def children_cpu_time():
+    """Get the CPU time used by child processes that have finished."""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Sampler():
+
+    """Sample the Python stack on a CPU time timer."""
+
+    def __init__(self, interval=sample_interval):
+        """Initialise
+
+        :interval: CPU time between two samples, in seconds
+        """
+        self.interval = interval
+        self.stacks = Counter()
+
+    def __handler(self, signum, frame):
+        """Record the current stack."""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("{}:{}".format(code.co_filename.split("/")[-1],
+                                        code.co_name))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        """Start sampling."""
+        self.previous = signal.signal(signal.SIGPROF, self.__handler)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        """Stop sampling."""
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous)
+
+    def write(self, filename):
+        """Write the stacks in the collapsed format, one stack per line.
+
+        :filename: output file
+        :returns: nothing
+        """
+        with open(filename, 'w') as fh:
+            for stack, count in self.stacks.most_common():
+                print("{} {}".format(stack, count), file=fh)
+
+    def summary(self, top=15):
+        """Get the functions that were on top of the stack most often.
+
+        :top: number of functions to list
+        :returns: string
+        """
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return "\n".join("{:6.1f}% {}".format(100 * count / total, leaf)
+                         for leaf, count in leaves.most_common(top))
+
+
+class Instrumentation():
+
+    """Record the resources used by each stage."""
+
+    def __init__(self, profile_stage=None, profiler="cprofile",
+                 profile_prefix=""):
+        """Initialise
+
+        :profile_stage: name of the stage to profile, if any
+        :profiler: one of `profilers`
+        :profile_prefix: prefix of the profile output file
+        """
+        if profiler not in profilers:
+            raise ValueError("Unknown profiler: {}".format(profiler))
+        self.profile_stage = profile_stage
+        self.profiler = profiler
+        self.profile_prefix = profile_prefix
+        self.stages = {}
+        self.__active = []
+
+    def trace(self, conn):
+        """Count the SQL statements issued on a connection.
+
+        :conn: sqlite3 connection
+        :returns: the connection
+        """
+        conn.set_trace_callback(self.__count_statement)
+        return conn
+
+    def __count_statement(self, statement):
+        """Trace callback of the connections."""
+        if self.__active:
+            self.__active[-1]["sql_statements"] += 1
+
+    def add_rows(self, rows):
+        """Add to the number of rows processed by the current stage.
+
+        :rows: number of rows
+        :returns: nothing
+        """
+        if self.__active:
+            self.__active[-1]["rows"] += rows
+
+    @contextmanager
+    def stage(self, name):
+        """Record a stage.
+
+        :name: name of the stage
+        """
+        record = {"rows": 0, "sql_statements": 0}
+        self.__active.append(record)
+        profiler = None
+        if name == self.profile_stage:
+            profiler = (cProfile.Profile() if self.profiler == "cprofile"
+                        else Sampler())
+            if self.profiler == "cprofile":
+                profiler.enable()
+            else:
+                profiler.start()
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        children_cpu = children_cpu_time()
+        try:
+            yield record
+        finally:
+            record["wall_seconds"] = round(time.perf_counter() - wall, 4)
+            record["cpu_seconds"] = round(
+                time.process_time() - cpu +
+                children_cpu_time() - children_cpu, 4)
+            record["peak_rss_kb"], record["peak_rss_children_kb"] = \
+                peak_rss_kb()
+            self.__active.pop()
+            if profiler is not None:
+                record["profile"] = self.__save_profile(name, profiler)
+            self.stages[name] = record
+            print("{}: {:.2f}s wall, {:.2f}s CPU, {} rows, {} statements".format(
+                name, record["wall_seconds"], record["cpu_seconds"],
+                record["rows"], record["sql_statements"]), file=sys.stderr)
+
+    def __save_profile(self, name, profiler):
+        """Stop a profiler and write its results.
+
+        :name: name of the stage
+        :profiler: cProfile.Profile or Sampler
+        :returns: name of the file written
+        """
+        if self.profiler == "cprofile":
+            profiler.disable()
+            filename = "{}{}.prof".format(self.profile_prefix, name)
+            profiler.dump_stats(filename)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats(
+                "cumulative").print_stats(15)
+        else:
+            profiler.stop()
+            filename = "{}{}.stacks.txt".format(self.profile_prefix, name)
+            profiler.write(filename)
+            print(profiler.summary(), file=sys.stderr)
+        print("Profile of {} written to {}".format(name, filename),
+              file=sys.stderr)
+        return filename
+
+    def report(self):
+        """Get the records of all stages.
+
+        :returns: dict
+        """
+        return {"date": datetime.now().isoformat(timespec="seconds"),
+                "stages": self.stages}
+
+    def write_report(self, filename):
+        """Write the records of all stages as JSON.
+
+        :filename: output file
+        :returns: nothing
+        """
+        with open(filename, 'w') as fh:
+            json.dump(self.report(), fh, indent=1)
+
+
+def stage(name):
+    """Decorate a method so that it runs as a stage.
+
+    The object must have an `instrumentation` attribute.
+
+    :name: name of the stage
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.instrumentation.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
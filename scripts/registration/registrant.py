@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Compact record of a registrant, used by conference-master.py and tohtml.py.
+
+A registrant used to be a dict with some 25 string keys. A Registrant keeps
+the same information in slots, with:
+
+- the member type, registration type, institution, city, country and meal
+  interned, so that the registrants of a country share one string
+- the items paid for as bit flags (MAIN_MEETING, TUTORIAL, ...)
+- ticket and shirt counts as ints, and the submit date as seconds since the
+  epoch
+
+The fields that the templates and output files use (name, full_name, type0,
+paid, shirt, banquet, balance, ...) are computed from these when read, so
+the record can be used in the templates as the dict was.
+
+Works with Python 2 and 3.
+
+File: registrant.py
+"""
+
+import calendar
+import time
+
+try:
+    intern
+except NameError:
+    from sys import intern
+
+
+# Items paid for, as bit flags
+MAIN_MEETING = 1
+TUTORIAL = 2
+WORKSHOPS_1DAY = 4
+WORKSHOPS_2DAY = 8
+paid_labels = [(MAIN_MEETING, 'MM'), (TUTORIAL, 'T'),
+               (WORKSHOPS_1DAY, 'WS1day'), (WORKSHOPS_2DAY, 'WS2day')]
+shirt_sizes = ['S', 'M', 'L', 'XL']
+date_format = '%m/%d/%Y %H:%M:%S'
+
+
+def paid_flags(row):
+    """Get the items paid for in a receipt or add to registration row.
+
+    :row: row of the export, as a dict
+    :returns: bit flags
+    """
+    payment_info = (row['Reg Fee (Non-Member)'] + row['Reg Fee (Faculty)'] +
+                    row['Reg Fee (Postdoc)'] + row['Reg Fee (Student)'])
+    flags = 0
+    if 'Main Meeting' in payment_info:
+        flags |= MAIN_MEETING
+    if 'Tutorial' in payment_info:
+        flags |= TUTORIAL
+    if 'Workshops 1 Day Only' in payment_info:
+        flags |= WORKSHOPS_1DAY
+    elif 'Workshops' in payment_info:
+        flags |= WORKSHOPS_2DAY
+    return flags
+
+
+class Registrant(object):
+
+    """A registrant, read from a row of the receipts export."""
+
+    __slots__ = ('email', 'first_name', 'middle_name', 'last_name',
+                 'fee_type', 'reg_type', 'paid_items', 'added_items',
+                 'submitted', 'shirt_s', 'shirt_m', 'shirt_l', 'shirt_xl',
+                 'banquet_tickets', 'extrabanquet_tickets', 'meal', 'inst',
+                 'city', 'country', 'balance_due', 'balance_paid')
+
+    def __init__(self, row):
+        """Initialise
+
+        :row: row of the receipts export, as a dict
+        """
+        self.email = row['Email']
+        self.last_name = row['Last Name'].strip().title()
+        self.middle_name = row['Middle Name'].strip()
+        self.first_name = row['First Name'].strip().title()
+        self.submitted = calendar.timegm(time.strptime(row['Submit Date'],
+                                                       date_format))
+
+        if len(row['Reg Fee (Non-Member)']) > 0:
+            fee_type = 'Non member'
+        elif len(row['Reg Fee (Faculty)']) > 0:
+            fee_type = 'Faculty'
+        elif len(row['Reg Fee (Postdoc)']) > 0:
+            fee_type = 'Postdoc'
+        else:
+            fee_type = 'Student'
+        self.fee_type = intern(fee_type)
+        self.reg_type = intern(row['Registration Type'])
+        self.paid_items = paid_flags(row)
+        # Items added later, with the add to registrations export
+        self.added_items = 0
+
+        self.shirt_s = int(row['Shirt S'])
+        self.shirt_m = int(row['Shirt M'])
+        self.shirt_l = int(row['Shirt L'])
+        self.shirt_xl = int(row['Shirt XL'])
+        self.banquet_tickets = int(row['BanquetTickets'])
+        self.extrabanquet_tickets = int(row['ExtraBanquetTickets'])
+        self.meal = intern(row['Special Meal'])
+
+        self.inst = intern(row['Institution'].strip())
+        self.city = intern(row['City'].strip())
+        self.country = intern(row['Country'].strip())
+        self.balance_due = -1 * float(row['Balance'])
+        self.balance_paid = False
+
+    def shirts(self, size):
+        """Get the number of shirts of a size."""
+        return getattr(self, 'shirt_' + size.lower())
+
+    def add_shirts(self, size, number):
+        """Add shirts of a size."""
+        name = 'shirt_' + size.lower()
+        setattr(self, name, getattr(self, name) + number)
+
+    @property
+    def name(self):
+        return ('<b>%s</b> %s %s' % (self.last_name, self.first_name,
+                                     self.middle_name)).strip()
+
+    @property
+    def full_name(self):
+        return '%s %s' % (self.last_name, self.first_name)
+
+    @property
+    def type0(self):
+        return '%s %s' % (self.fee_type,
+                          self.reg_type if len(self.reg_type) > 0
+                          else 'Member')
+
+    @property
+    def paid(self):
+        """Items paid for, e.g. "MM T ", and " & WS1day" for each item added
+        later."""
+        text = ''.join(label + ' ' for flag, label in paid_labels
+                       if self.paid_items & flag)
+        for flag, label in paid_labels:
+            if self.added_items & flag:
+                text += ' & ' + label
+        return text
+
+    @property
+    def date(self):
+        return time.gmtime(self.submitted)
+
+    @property
+    def shirt(self):
+        return ''.join('%d * %s ' % (self.shirts(size), size)
+                       for size in shirt_sizes if self.shirts(size) > 0)
+
+    @property
+    def banquet(self):
+        return '' if self.banquet_tickets == 0 else str(self.banquet_tickets)
+
+    @property
+    def extrabanquet(self):
+        return ('' if self.extrabanquet_tickets == 0
+                else str(self.extrabanquet_tickets))
+
+    @property
+    def location(self):
+        return '%s, %s' % (self.inst, self.country)
+
+    @property
+    def balance(self):
+        if self.balance_paid:
+            return 'PAID'
+        return ('' if self.balance_due == 0
+                else '${:10.2f}'.format(self.balance_due))
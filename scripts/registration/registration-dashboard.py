@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Serve the registration metrics to the organisers while registration is open.
+
+The metrics of registration-metrics-sqlite.py (the same numbers as in
+`2019-metrics.txt`) are served from its database at:
+
+- /: an HTML page that reloads itself every minute
+- /metrics.json: JSON
+
+The metrics are computed once and kept in memory until the database changes,
+which is checked on each request with `PRAGMA data_version` (changed by
+commits of other connections) and the identity of the database file: its
+device, inode and ctime, which change when the database is imported again
+from scratch, even if the new file gets the inode of the old one. Responses
+carry an ETag, made of a hash of the metrics and of the content type, so that
+polling clients get an empty 304 response when nothing changed. HEAD
+responses have the headers of the GET response, Content-Length included.
+
+The database is opened read only. registration-metrics-sqlite.py puts the
+database in WAL mode, so reading never blocks an import and the other way
+round.
+
+Usage:
+
+    registration-dashboard.py [--db CNS2019.sqlite] [--host 127.0.0.1] [--port 8019]
+
+File: registration-dashboard.py
+"""
+
+import argparse
+import asyncio
+import hashlib
+import html
+import importlib.util
+import json
+import os
+import sqlite3
+import sys
+
+
+metrics_script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "registration-metrics-sqlite.py")
+refresh_seconds = 60
+
+
+def load_metrics_module():
+    """Import registration-metrics-sqlite.py."""
+    spec = importlib.util.spec_from_file_location("registration_metrics",
+                                                  metrics_script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class MetricsCache():
+
+    """Metrics of the database, recomputed only when it changes."""
+
+    def __init__(self, db_name):
+        """Initialise
+
+        :db_name: path of the database
+        """
+        self.db_name = db_name
+        self.metrics = load_metrics_module().Metrics()
+        self.conn = None
+        self.identity = None
+        self.version = None
+        self.value = None
+        self.digest = None
+        self.lock = asyncio.Lock()
+
+    def __connect(self):
+        """Open a read only connection, again if the file was replaced.
+
+        A deleted file's inode is often given to the file created in its
+        place, so the ctime is compared too. Writes to the database also
+        change the ctime, which only costs a new connection.
+
+        :returns: (device, inode, ctime in ns) of the database file
+        """
+        stat = os.stat(self.db_name)
+        identity = (stat.st_dev, stat.st_ino, stat.st_ctime_ns)
+        if self.conn is None or identity != self.identity:
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = sqlite3.connect(
+                "file:{}?mode=ro".format(self.db_name), uri=True,
+                check_same_thread=False)
+            self.identity = identity
+        return identity
+
+    def __refresh(self):
+        """Recompute the metrics if the database changed."""
+        identity = self.__connect()
+        version = (identity,
+                   self.conn.execute("PRAGMA data_version").fetchone()[0])
+        if version != self.version:
+            self.value = self.metrics.collect_metrics(self.conn)
+            self.version = version
+            self.digest = hashlib.sha256(json.dumps(
+                self.value, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    async def get(self):
+        """Get the metrics.
+
+        :returns: (metrics dict, hash of the metrics)
+        """
+        async with self.lock:
+            await asyncio.get_running_loop().run_in_executor(None,
+                                                             self.__refresh)
+            return self.value, self.digest
+
+
+def render_table(title, rows):
+    """Render [value, count] pairs as a table.
+
+    :title: heading of the table
+    :rows: list of [value, count]
+    :returns: HTML string
+    """
+    cells = "".join("<tr><td>{}</td><td>{}</td></tr>".format(
+        html.escape(str(value)), count) for value, count in rows)
+    return "<h3>{}</h3><table border=\"1\">{}</table>".format(title, cells)
+
+
+def render_html(metrics):
+    """Render the metrics as an HTML page.
+
+    :metrics: dict returned by Metrics.collect_metrics
+    :returns: HTML string
+    """
+    overall = [["Total", metrics["registrants"]],
+               ["Main meeting", metrics["main_meeting"]],
+               ["Workshops", metrics["workshops"]],
+               ["Tutorials", metrics["tutorials"]],
+               ["Banquet tickets", metrics["banquet_tickets"]]]
+    members = metrics["members"]
+    non_members = metrics["non_members"]
+    return "\n".join([
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\">",
+        "<meta http-equiv=\"refresh\" content=\"{}\">".format(refresh_seconds),
+        "<title>Registration metrics</title></head><body>",
+        "<h2>Overall</h2>",
+        render_table("Registrants", overall),
+        render_table("Groups", metrics["groups"]),
+        render_table("Gender", metrics["genders"]),
+        render_table("Location", metrics["countries"]),
+        render_table("Shirts", list(metrics["shirts"].items())),
+        "<h2>Members: {}</h2>".format(members["registrants"]),
+        render_table("Groups", members["groups"]),
+        render_table("Gender", members["genders"]),
+        render_table("Location", members["countries"]),
+        "<h2>Non members: {}</h2>".format(non_members["registrants"]),
+        render_table("Groups", non_members["groups"]),
+        "</body></html>"])
+
+
+async def respond(writer, status, headers, body=b"", head=False):
+    """Write an HTTP response and close the connection.
+
+    :head: only write the headers, with the Content-Length of the body
+    """
+    lines = ["HTTP/1.1 {}".format(status), "Connection: close",
+             "Content-Length: {}".format(len(body))]
+    lines += ["{}: {}".format(k, v) for k, v in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") +
+                 (b"" if head else body))
+    await writer.drain()
+    writer.close()
+
+
+def handler(cache):
+    """Get the connection handler of the server.
+
+    :cache: MetricsCache
+    :returns: coroutine function
+    """
+    async def handle(reader, writer):
+        try:
+            request = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+        except (ConnectionError, UnicodeDecodeError):
+            writer.close()
+            return
+
+        if len(request) < 2 or request[0] not in ["GET", "HEAD"]:
+            await respond(writer, "405 Method Not Allowed", {"Allow": "GET, HEAD"})
+            return
+        path = request[1].split("?")[0]
+        if path not in ["/", "/metrics.json"]:
+            await respond(writer, "404 Not Found", {})
+            return
+
+        try:
+            metrics, digest = await cache.get()
+        except (OSError, sqlite3.Error) as e:
+            print("ERROR: {}".format(e), file=sys.stderr)
+            await respond(writer, "503 Service Unavailable", {},
+                          str(e).encode("utf-8"))
+            return
+
+        # The HTML and the JSON are different representations, so each
+        # needs its own ETag
+        representation = "html" if path == "/" else "json"
+        etag = '"{}-{}"'.format(digest, representation)
+        if headers.get("if-none-match") == etag:
+            await respond(writer, "304 Not Modified", {"ETag": etag})
+            return
+        if representation == "html":
+            body = render_html(metrics).encode("utf-8")
+            content_type = "text/html; charset=utf-8"
+        else:
+            body = json.dumps(metrics, indent=1).encode("utf-8")
+            content_type = "application/json"
+        await respond(writer, "200 OK",
+                      {"Content-Type": content_type, "ETag": etag,
+                       "Cache-Control": "no-cache"},
+                      body, head=request[0] == "HEAD")
+
+    return handle
+
+
+async def serve(db_name, host, port):
+    """Run the server until interrupted."""
+    cache = MetricsCache(db_name)
+    server = await asyncio.start_server(handler(cache), host, port)
+    print("Serving {} on http://{}:{}/".format(db_name, host, port),
+          file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve the registration metrics over HTTP")
+    parser.add_argument("--db", default="CNS2019.sqlite",
+                        help="database written by registration-metrics-sqlite.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8019)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.db, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -8,8 +8,44 @@ database.
 The following tables will be created
 
 > .tables
-add_extras             registration_master    registration_receipts
-add_to_registration    registration_profiles
+add_extras             registration_cube      summary_breakdown
+add_to_registration    registration_master    summary_totals
+attendance_bitmaps     registration_profiles
+attendees              registration_receipts
+
+The summary tables hold the counts and sums that the metrics are made of,
+for members and non members. They are filled in bulk once the master table
+is populated, and are then kept up to date by triggers on the master table,
+so the metrics are read from them without scanning the registrants.
+
+The attendees and attendance_bitmaps tables are the attendance index of
+attendance_index.py, which answers questions over several events with bit
+operations. registration_cube holds the rollups of registration_cube.py, which
+answers any breakdown of the registrants. Both are built from the master
+table at the end of the import. The master table is then recorded in the
+history, `CNS2019-history.sqlite`, which keeps every version of each
+registrant across imports (registration_history.py).
+
+The database is `CNS2019.sqlite` and the outputs are named `2019-*`; use
+--year for other years. registration_warehouse.py collects the master tables
+of all years into one database to compare them.
+
+With --engine duckdb, nothing is imported: the master table is derived
+directly from the csv (or Parquet) files by DuckDB, using all cores, and the
+metrics and dumps are made from it in memory. --query runs an ad-hoc query on
+the master table, with either engine, e.g.:
+
+    registration-metrics-sqlite.py --engine duckdb --query \
+        "SELECT COUNT(*) FROM registration_master WHERE \"Country\" = 'Germany'
+         AND \"Registration Group\" = 'Student' AND \"Banquet Tickets\" > 0" \
+        profiles.csv receipts.csv add-to-registration.csv add-extras.csv
+
+Each stage is timed by instrumentation.py, and the wall and CPU time, rows,
+SQL statements and peak memory of each stage are written to a JSON report.
+One stage can be profiled with --profile, e.g.:
+
+    registration-metrics-sqlite.py --profile add-extras --profiler sample \
+        profiles.csv receipts.csv add-to-registration.csv add-extras.csv
 
 File: registration-metrics-sqlite.py
 
@@ -18,19 +54,85 @@ Author: Ankur Sinha <sanjay DOT ankur AT gmail DOT com>
 """
 
 
+import argparse
+import csv
+import html
 import sys
 import sqlite3
 import os
 import textwrap
 import subprocess
 
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+import attendance_index
+import registration_cube
+import registration_history
+from instrumentation import Instrumentation, profilers, stage
+
+
+# Stages that can be profiled
+stages = ["import", "create-master", "populate-master", "summaries",
+          "add-extras", "attendance-index", "cube", "history",
+          "derive-master", "metrics", "dump"]
+engines = ["sqlite", "duckdb"]
+# Prepared statements kept per connection. The stages only reuse a handful,
+# this just leaves room for the metrics queries as well.
+cached_statements = 64
+# Columns of the summary totals, and how each registrant ("{row}") adds to
+# them
+summary_totals = [
+    ("registrants", "1"),
+    ("main_meeting", """{row}."Main meeting Registration" == 'Y'"""),
+    ("workshops", """{row}."Workshop Registration" == 'Y'"""),
+    ("tutorials", """{row}."Tutorial Registration" == 'Y'"""),
+    ("shirt_s", '{row}."Shirt S"'),
+    ("shirt_m", '{row}."Shirt M"'),
+    ("shirt_l", '{row}."Shirt L"'),
+    ("shirt_xl", '{row}."Shirt XL"'),
+    ("banquet_tickets", '{row}."Banquet Tickets"'),
+]
+# Columns the registrants are counted by in the summary breakdown
+summary_dimensions = ["Registration Group", "Gender", "Country"]
+
+
+def csv_field(value):
+    """Format a value as the sqlite3 command line tool does in csv mode.
+
+    Fields are quoted if they are empty or contain anything but printable
+    ASCII other than space and quotes.
+    """
+    text = "" if value is None else str(value)
+    if value is None or (text and all(
+            32 < ord(c) < 127 and c not in "\"',\x7f" for c in text)):
+        return text
+    return '"{}"'.format(text.replace('"', '""'))
+
+
+def html_row(tag, values):
+    """Format a row as the sqlite3 command line tool does in html mode."""
+    return "<TR>" + "\n".join(
+        "<{0}>{1}</{0}>".format(tag, html.escape(
+            "" if v is None else str(v)).replace("&#x27;", "&#39;"))
+        for v in values) + "\n</TR>"
+
 
 class Metrics():
 
     """Generate metrics for the yearly CNS conference"""
 
-    def __init__(self):
-        """Initialise"""
+    def __init__(self, instrumentation=None, year=2019, engine="sqlite"):
+        """Initialise
+
+        :instrumentation: Instrumentation to record the stages with
+        :year: year of the conference, used in the database and output file
+            names
+        :engine: "sqlite" to import the data into a database, or "duckdb" to
+            query the files in place
+        """
         self.common_data = '"Email"'
         self.metrics_fn = "Registration-metrics.txt"
         self.tabs = {
@@ -38,11 +140,24 @@ class Metrics():
             "RegProfiles": "registration_profiles",
             "AddToRegs": "add_to_registration",
             "AddExtras": "add_extras",
-            "Master": "registration_master"
+            "Master": "registration_master",
+            "Totals": "summary_totals",
+            "Breakdown": "summary_breakdown",
 
 
         }
-        self.db_name = "CNS2019.sqlite"
+        self.year = year
+        self.db_name = "CNS{}.sqlite".format(year)
+        self.report_fn = "{}-stages.json".format(year)
+        self.history_db = registration_history.history_db.format(year)
+        self.instrumentation = instrumentation or Instrumentation()
+        if engine not in engines:
+            raise ValueError("Unknown engine: {}".format(engine))
+        if engine == "duckdb" and duckdb is None:
+            raise ImportError("duckdb is needed for the duckdb engine: "
+                              "pip install duckdb")
+        self.engine = engine
+        self.duckdb_conn = None
 
     def usage(self):
         """Print usage instructions
@@ -75,6 +190,10 @@ class Metrics():
         :filenames: list of files names
         :returns: TODO
         """
+        if self.engine == "duckdb":
+            self.__derive_master_table(filenames)
+            return
+
         if os.path.isfile(self.db_name):
             print("{} exists. Removing and re importing".format(self.db_name))
             subprocess.run(["rm", "-fv", self.db_name], check=True)
@@ -82,8 +201,13 @@ class Metrics():
             self.__import_from_csv(filenames)
             self.__create_master_table()
             self.__populate_master_table()
+            self.__create_summary_tables()
             self.__add_extras()
+            self.__build_attendance_index()
+            self.__build_cube()
+            self.__record_history()
 
+    @stage("import")
     def __import_from_csv(self, filenames):
         """
         Import data from csv to the tables.
@@ -113,6 +237,13 @@ class Metrics():
 
         subprocess.run(["sqlite3"], input=sqlite_init, text=True, check=True)
 
+        conn = self.__get_db_conn()
+        for key in ["RegProfiles", "RegReceipts", "AddToRegs", "AddExtras"]:
+            self.instrumentation.add_rows(conn.execute(
+                'SELECT COUNT(*) FROM {}'.format(self.tabs[key])).fetchone()[0])
+        conn.close()
+
+    @stage("create-master")
     def __create_master_table(self):
         """
         Create the master table
@@ -154,12 +285,19 @@ class Metrics():
 
         conn = self.__get_db_conn()
         cur = conn.cursor()
+        # Readers such as registration-dashboard.py are not blocked by
+        # writers in WAL mode, which is kept in the database file
+        cur.execute("PRAGMA journal_mode=WAL")
         cur.execute(sqlite_create_table)
         conn.commit()
 
+    @stage("populate-master")
     def __populate_master_table(self):
         """
         Parse data and populate the master table
+
+        All rows are inserted with one prepared statement, in one transaction.
+
         :returns: nothing
 
         """
@@ -170,10 +308,41 @@ class Metrics():
             """
         ).format(self.tabs["RegReceipts"])
 
+        insert_query = textwrap.dedent(
+            """\
+            INSERT INTO {} (\
+            "Email",\
+            "First Name",\
+            "Middle Name",\
+            "Last Name",\
+            "Gender",\
+            "Institution",\
+            "Country",\
+            "OCNS Member",\
+            "Registration Group",\
+            "Invitation Letter",\
+            "Main meeting Registration",\
+            "Workshop Registration",\
+            "Tutorial Registration",\
+            "Banquet Tickets",\
+            "Special Meal",\
+            "Shirt S",\
+            "Shirt M",\
+            "Shirt L",\
+            "Shirt XL",\
+            "Payment Type",\
+            "Payment Total",\
+            "Balance",\
+            "Discount Code"\
+            )\
+            VALUES ({})
+            """
+        ).format(self.tabs["Master"], ",".join(["?"] * 23))
+
         read_conn = self.__get_db_conn()
         read_cur = read_conn.cursor()
-        write_conn = self.__get_db_conn()
-        write_cur = write_conn.cursor()
+        values = []
+        emails = set()
         for row in read_cur.execute(query):
             #  print(row.keys())
             reg_grp = ""
@@ -228,41 +397,15 @@ class Metrics():
                 int(row["ExtraBanquetTickets"])
             )
 
-            insert_query = textwrap.dedent(
-                """\
-                INSERT INTO {} (\
-                "Email",\
-                "First Name",\
-                "Middle Name",\
-                "Last Name",\
-                "Gender",\
-                "Institution",\
-                "Country",\
-                "OCNS Member",\
-                "Registration Group",\
-                "Invitation Letter",\
-                "Main meeting Registration",\
-                "Workshop Registration",\
-                "Tutorial Registration",\
-                "Banquet Tickets",\
-                "Special Meal",\
-                "Shirt S",\
-                "Shirt M",\
-                "Shirt L",\
-                "Shirt XL",\
-                "Payment Type",\
-                "Payment Total",\
-                "Balance",\
-                "Discount Code"\
-                )\
-                VALUES (\
-                "{}","{}","{}","{}","{}","{}","{}","{}",\
-                "{}","{}","{}","{}","{}",{},"{}",{},\
-                {},{},{},"{}",{},{},"{}"\
-                )
-                """
-            ).format(
-                self.tabs["Master"],
+            # The first receipt of a registrant is kept
+            if row["Email"] in emails:
+                print("ERROR: ", "UNIQUE constraint failed: {}.Email".format(
+                    self.tabs["Master"]), file=sys.stderr)
+                print("Row was: ", tuple(row), file=sys.stderr)
+                continue
+            emails.add(row["Email"])
+
+            values.append((
                 row["Email"],
                 row["First Name"],
                 row["Middle Name"],
@@ -290,31 +433,142 @@ class Metrics():
                 ("" if
                  (not row["Discount Code"] or row["Discount Code"] == "None")
                  else row["Discount Code"]),
-            )
-            #  print(insert_query)
-            try:
-                write_cur.execute(insert_query)
-            except sqlite3.Error as e:
-                print("ERROR: ", e.args[0], file=sys.stderr)
-                print("Query was: ", insert_query, file=sys.stderr)
-
-        write_conn.commit()
+            ))
+        read_conn.close()
+        self.instrumentation.add_rows(len(values))
+
+        write_conn = self.__get_db_conn()
+        with write_conn:
+            write_conn.executemany(insert_query, values)
         write_conn.close()
 
+    @stage("summaries")
+    def __create_summary_tables(self):
+        """
+        Create the summary tables, fill them from the master table, and add
+        the triggers that keep them up to date
+
+        The triggers are only added once the tables are filled in bulk, so
+        that they do not slow down the initial import.
+
+        :returns: nothing
+
+        """
+        print("Creating summary tables", file=sys.stderr)
+
+        columns = [name for name, _ in summary_totals]
+        statements = [
+            'DROP TABLE IF EXISTS {}'.format(self.tabs["Totals"]),
+            'DROP TABLE IF EXISTS {}'.format(self.tabs["Breakdown"]),
+            textwrap.dedent(
+                """\
+                CREATE TABLE {} (\
+                "member" TEXT PRIMARY KEY,\
+                {}\
+                )
+                """
+            ).format(self.tabs["Totals"],
+                     ",".join('"{}" INT'.format(c) for c in columns)),
+            textwrap.dedent(
+                """\
+                CREATE TABLE {} (\
+                "dimension" TEXT,\
+                "value" TEXT,\
+                "member" TEXT,\
+                "registrants" INT,\
+                PRIMARY KEY ("dimension", "value", "member")\
+                )
+                """
+            ).format(self.tabs["Breakdown"]),
+            textwrap.dedent(
+                """\
+                INSERT INTO {} ("member", {})\
+                SELECT "OCNS Member", {} FROM {} AS m\
+                GROUP BY "OCNS Member"
+                """
+            ).format(self.tabs["Totals"],
+                     ",".join('"{}"'.format(c) for c in columns),
+                     ",".join("SUM({})".format(e.format(row="m"))
+                              for _, e in summary_totals),
+                     self.tabs["Master"]),
+        ]
+        for dimension in summary_dimensions:
+            statements.append(textwrap.dedent(
+                """\
+                INSERT INTO {} ("dimension", "value", "member", "registrants")\
+                SELECT '{}', "{}", "OCNS Member", COUNT(*) FROM {}\
+                GROUP BY "{}", "OCNS Member"
+                """
+            ).format(self.tabs["Breakdown"], dimension, dimension,
+                     self.tabs["Master"], dimension))
+
+        # Triggers: add the new row, take away the old one
+        for event, rows in [("INSERT", [("NEW", "")]),
+                            ("UPDATE", [("OLD", "-"), ("NEW", "")]),
+                            ("DELETE", [("OLD", "-")])]:
+            steps = []
+            for row, sign in rows:
+                steps.append(textwrap.dedent(
+                    """\
+                    INSERT INTO {} ("member", {})\
+                    VALUES ({}."OCNS Member", {})\
+                    ON CONFLICT ("member") DO UPDATE SET {};
+                    """
+                ).format(self.tabs["Totals"],
+                         ",".join('"{}"'.format(c) for c in columns),
+                         row,
+                         ",".join("{}IFNULL({}, 0)".format(sign,
+                                                          e.format(row=row))
+                                  for _, e in summary_totals),
+                         ",".join('"{0}" = "{0}" + excluded."{0}"'.format(c)
+                                  for c in columns)))
+                for dimension in summary_dimensions:
+                    steps.append(textwrap.dedent(
+                        """\
+                        INSERT INTO {} ("dimension", "value", "member",\
+                        "registrants")\
+                        VALUES ('{}', {}."{}", {}."OCNS Member", {}1)\
+                        ON CONFLICT ("dimension", "value", "member")\
+                        DO UPDATE SET "registrants" = "registrants" +\
+                        excluded."registrants";
+                        """
+                    ).format(self.tabs["Breakdown"], dimension, row,
+                             dimension, row, sign))
+            trigger = "{}_summary_{}".format(self.tabs["Master"],
+                                             event.lower())
+            statements.append("DROP TRIGGER IF EXISTS {}".format(trigger))
+            statements.append(textwrap.dedent(
+                """\
+                CREATE TRIGGER {} AFTER {} ON {}\
+                BEGIN {} END
+                """
+            ).format(trigger, event, self.tabs["Master"], "".join(steps)))
+
+        conn = self.__get_db_conn()
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+        conn.close()
+
+    @stage("add-extras")
     def __add_extras(self):
         """
         Add extra registrations, either workshops and tutorials that were added
         later, or banquet tickets and t-shirts
 
+        The new values are computed by the UPDATE statements from the current
+        ones, so each export is merged with one prepared statement, in one
+        transaction.
+
         :returns: nothing
 
         """
         print("Adding extras:")
 
-        read_conn = self.__get_db_conn()
-        read_cur = read_conn.cursor()
-        read_conn_1 = self.__get_db_conn()
-        read_cur_1 = read_conn_1.cursor()
+        conn = self.__get_db_conn()
+        registered = set(email for email, in conn.execute(
+            'SELECT "Email" FROM {}'.format(self.tabs["Master"])))
+
         query = textwrap.dedent(
             """\
             SELECT * from {};
@@ -322,12 +576,10 @@ class Metrics():
             """
         ).format(self.tabs["AddToRegs"])
 
-        read_cur.execute(query)
-        rows = read_cur.fetchall()
+        rows = conn.execute(query).fetchall()
+        self.instrumentation.add_rows(len(rows))
+        values = []
         for row in rows:
-            new_reg_mm = "N"
-            new_reg_ws = "N"
-            new_reg_tut = "N"
             reg_mm = "N"
             reg_ws = "N"
             reg_tut = "N"
@@ -350,57 +602,30 @@ class Metrics():
             if 'Tutorial' in registrations:
                 reg_tut = "Y"
 
-            check_query = textwrap.dedent(
-                """\
-                SELECT * FROM {} WHERE "Email"=="{}"
-                """
-            ).format(self.tabs["Master"], row["Email"])
-            # There should only be one entry, but let's check them all anyway.
-            read_cur_1.execute(check_query)
-            newrows = read_cur_1.fetchall()
-            for newrow in newrows:
-                initial_reg_mm = newrow["Main meeting Registration"]
-                initial_reg_ws = newrow["Workshop Registration"]
-                initial_reg_tut = newrow["Tutorial Registration"]
-                initial_payment = newrow["Payment Total"]
-                initial_discount_code = (newrow["Discount Code"] if
-                                         newrow["Discount Code"] else "")
-
-                new_reg_mm = ("Y" if
-                              (reg_mm == "Y" or initial_reg_mm == "Y")
-                              else "N")
-                new_reg_ws = ("Y" if
-                              (reg_ws == "Y" or initial_reg_ws == "Y")
-                              else "N")
-                new_reg_tut = ("Y" if
-                               (reg_tut == "Y" or initial_reg_tut == "Y")
-                               else "N")
-                new_payment = initial_payment + payment
-                new_discount_code = (discount_code + " " + initial_discount_code)
-
-            print("{}: {}{}{} + {}{}{} = {}{}{}".format(
-                newrow["Email"], initial_reg_mm, initial_reg_ws,
-                initial_reg_tut, reg_mm, reg_ws, reg_tut, new_reg_mm,
-                new_reg_ws, new_reg_tut))
-
-            update_query = textwrap.dedent(
-                """\
-                UPDATE {}\
-                SET "Main meeting Registration" = "{}",\
-                "Workshop Registration" = "{}",\
-                "Tutorial Registration" = "{}",\
-                "Payment Total" = "{}",\
-                "Discount Code" = "{}"\
-                WHERE "Email"=="{}"
-                """
-            ).format(self.tabs["Master"], new_reg_mm, new_reg_ws, new_reg_tut,
-                     new_payment, new_discount_code, row["Email"])
-            #  print(update_query)
-            write_conn = self.__get_db_conn()
-            write_cur = write_conn.cursor()
-            write_cur.execute(update_query)
-            write_conn.commit()
-            write_conn.close()
+            if row["Email"] not in registered:
+                print("{}: not registered, skipped".format(row["Email"]),
+                      file=sys.stderr)
+                continue
+            print("{}: + {}{}{}".format(row["Email"], reg_mm, reg_ws, reg_tut))
+            values.append((reg_mm, reg_ws, reg_tut, payment, discount_code,
+                           row["Email"]))
+
+        update_query = textwrap.dedent(
+            """\
+            UPDATE {}\
+            SET "Main meeting Registration" = CASE WHEN\
+            ? == 'Y' OR "Main meeting Registration" == 'Y' THEN 'Y' ELSE 'N' END,\
+            "Workshop Registration" = CASE WHEN\
+            ? == 'Y' OR "Workshop Registration" == 'Y' THEN 'Y' ELSE 'N' END,\
+            "Tutorial Registration" = CASE WHEN\
+            ? == 'Y' OR "Tutorial Registration" == 'Y' THEN 'Y' ELSE 'N' END,\
+            "Payment Total" = "Payment Total" + ?,\
+            "Discount Code" = ? || ' ' || COALESCE("Discount Code", '')\
+            WHERE "Email"==?
+            """
+        ).format(self.tabs["Master"])
+        with conn:
+            conn.executemany(update_query, values)
 
         # banquet tickets and and t-shirts
         query = textwrap.dedent(
@@ -410,11 +635,10 @@ class Metrics():
             """
         ).format(self.tabs["AddExtras"])
 
-        read_cur.execute(query)
-        rows = read_cur.fetchall()
+        rows = conn.execute(query).fetchall()
+        self.instrumentation.add_rows(len(rows))
+        values = []
         for row in rows:
-            new_banquet_tickets = 0
-            new_special_meal = ""
             banquet_tickets = int(row["BanquetTickets"])
             special_meal = ("" if (not row["Special Meal"] or
                                    row["Special Meal"] == "None")
@@ -422,63 +646,230 @@ class Metrics():
             extra_banquet_tickets = int(row["ExtraBanquetTickets"])
             payment = float(row["Payment Total"])
 
-            new_t_s_s = 0
-            new_t_s_m = 0
-            new_t_s_l = 0
-            new_t_s_xl = 0
             t_s_s = int(row["Shirt S"])
             t_s_m = int(row["Shirt M"])
             t_s_l = int(row["Shirt L"])
             t_s_xl = int(row["Shirt XL"])
 
-            check_query = textwrap.dedent(
-                """\
-                SELECT * FROM {} WHERE "Email"=="{}"
-                """
-            ).format(self.tabs["Master"], row["Email"])
-
-            # There should only be one entry, but let's check them all anyway.
-            read_cur_1.execute(check_query)
-            newrows = read_cur_1.fetchall()
-            for newrow in newrows:
-                initial_banquet_tickets = newrow["Banquet Tickets"]
-                initial_special_meal = newrow["Special Meal"]
-                initial_t_s_s = newrow["Shirt S"]
-                initial_t_s_m = newrow["Shirt M"]
-                initial_t_s_l = newrow["Shirt L"]
-                initial_t_s_xl = newrow["Shirt XL"]
-                initial_payment = newrow["Payment Total"]
-
-                new_banquet_tickets = (initial_banquet_tickets +
-                                       banquet_tickets + extra_banquet_tickets)
-                new_special_meal = initial_special_meal + special_meal
-                new_t_s_s = initial_t_s_s + t_s_s
-                new_t_s_m = initial_t_s_m + t_s_m
-                new_t_s_l = initial_t_s_l + t_s_l
-                new_t_s_xl = initial_t_s_xl + t_s_xl
-                new_payment = initial_payment + payment
-
-            update_query = textwrap.dedent(
+            if row["Email"] not in registered:
+                print("{}: not registered, skipped".format(row["Email"]),
+                      file=sys.stderr)
+                continue
+            values.append((banquet_tickets + extra_banquet_tickets,
+                           special_meal, t_s_s, t_s_m, t_s_l, t_s_xl, payment,
+                           row["Email"]))
+
+        update_query = textwrap.dedent(
+            """\
+            UPDATE {}\
+            SET "Banquet Tickets" = "Banquet Tickets" + ?,\
+            "Special Meal" = "Special Meal" || ?,\
+            "Shirt S" = "Shirt S" + ?,\
+            "Shirt M" = "Shirt M" + ?,\
+            "Shirt L" = "Shirt L" + ?,\
+            "Shirt XL" = "Shirt XL" + ?,\
+            "Payment Total" = "Payment Total" + ?\
+            WHERE "Email"==?
+            """
+        ).format(self.tabs["Master"])
+        with conn:
+            conn.executemany(update_query, values)
+        conn.close()
+
+    @stage("attendance-index")
+    def __build_attendance_index(self):
+        """
+        Build the attendance bitmaps of attendance_index.py
+
+        :returns: nothing
+
+        """
+        print("Building attendance index", file=sys.stderr)
+        conn = self.__get_db_conn()
+        self.instrumentation.add_rows(
+            attendance_index.build(conn, self.tabs["Master"]))
+        conn.close()
+
+    @stage("cube")
+    def __build_cube(self):
+        """
+        Build the cube of registration_cube.py
+
+        :returns: nothing
+
+        """
+        print("Building registration cube", file=sys.stderr)
+        conn = self.__get_db_conn()
+        self.instrumentation.add_rows(
+            registration_cube.build(conn, self.tabs["Master"]))
+        conn.close()
+
+    @stage("history")
+    def __record_history(self):
+        """
+        Record the master table in the history of registration_history.py
+
+        :returns: nothing
+
+        """
+        print("Recording history in {}".format(self.history_db),
+              file=sys.stderr)
+        conn = registration_history.get_conn(self.history_db)
+        registrants, added, closed = registration_history.record_snapshot(
+            conn, self.db_name)
+        conn.close()
+        print("{} versions added, {} closed".format(added, closed),
+              file=sys.stderr)
+        self.instrumentation.add_rows(added + closed)
+
+    @stage("derive-master")
+    def __derive_master_table(self, filenames):
+        """
+        Derive the master table with DuckDB, directly from the files
+
+        The same rules as __populate_master_table and __add_extras are
+        applied, in SQL: the first receipt of each registrant is kept, and
+        the add-ons of registrants who are not in the receipts are ignored.
+
+        :filenames: list of files names, in the same order as setup_new_db
+        :returns: nothing
+
+        """
+        print("Deriving master table from the files", file=sys.stderr)
+        self.duckdb_conn = duckdb.connect()
+        conn = self.duckdb_conn
+
+        for fname, key in zip(filenames[1:5], ["RegProfiles", "RegReceipts",
+                                               "AddToRegs", "AddExtras"]):
+            if fname.endswith(".parquet"):
+                source = "read_parquet('{}')".format(fname.replace("'", "''"))
+            else:
+                source = "read_csv('{}', header=true, all_varchar=true)".format(
+                    fname.replace("'", "''"))
+            # Empty fields are empty strings in sqlite, NULL in DuckDB. The
+            # row number keeps the order of the export.
+            conn.execute(textwrap.dedent(
                 """\
-                UPDATE {}\
-                SET "Banquet Tickets" = "{}",\
-                "Special Meal" = "{}",\
-                "Shirt S" = "{}",\
-                "Shirt M" = "{}",\
-                "Shirt L" = "{}",\
-                "Shirt XL" = "{}",\
-                "Payment Total" = "{}"\
-                WHERE "Email"=="{}"
+                CREATE VIEW {} AS\
+                SELECT COALESCE(COLUMNS(*), ''),\
+                row_number() OVER () AS "row number"\
+                FROM {}
                 """
-            ).format(self.tabs["Master"], new_banquet_tickets,
-                     new_special_meal, new_t_s_s, new_t_s_m, new_t_s_l,
-                     new_t_s_xl, new_payment, row["Email"])
-            #  print(update_query)
-            write_conn = self.__get_db_conn()
-            write_cur = write_conn.cursor()
-            write_cur.execute(update_query)
-            write_conn.commit()
-            write_conn.close()
+            ).format(self.tabs[key], source))
+
+        fees = ("concat(\"Reg Fee (Non-Member)\", \"Reg Fee (Faculty)\", "
+                "\"Reg Fee (Postdoc)\", \"Reg Fee (Student)\", "
+                "\"Reg Fee (Board)\")")
+        meal = ("CASE WHEN \"Special Meal\" IN ('', 'None') THEN '' "
+                "ELSE \"Special Meal\" END")
+        query = textwrap.dedent(
+            """\
+            CREATE TABLE {master} AS\
+            WITH receipts AS (\
+            SELECT * FROM {receipts}\
+            QUALIFY row_number() OVER (\
+            PARTITION BY "Email" ORDER BY "row number") = 1\
+            ), added AS (\
+            SELECT "Email",\
+            bool_or(contains({fees}, 'Main Meeting')) AS mm,\
+            bool_or(contains({fees}, 'Workshops')) AS ws,\
+            bool_or(contains({fees}, 'Tutorial')) AS tut,\
+            SUM(CAST("Payment Total" AS DOUBLE)) AS payment,\
+            string_agg("Discount Code", ' ' ORDER BY "row number" DESC)\
+            AS codes\
+            FROM {add_to_regs} GROUP BY "Email"\
+            ), extras AS (\
+            SELECT "Email",\
+            SUM(CAST("BanquetTickets" AS INT) +\
+            CAST("ExtraBanquetTickets" AS INT)) AS banquet,\
+            string_agg({meal}, '' ORDER BY "row number") AS meals,\
+            SUM(CAST("Shirt S" AS INT)) AS s,\
+            SUM(CAST("Shirt M" AS INT)) AS m,\
+            SUM(CAST("Shirt L" AS INT)) AS l,\
+            SUM(CAST("Shirt XL" AS INT)) AS xl,\
+            SUM(CAST("Payment Total" AS DOUBLE)) AS payment\
+            FROM {add_extras} GROUP BY "Email"\
+            )\
+            SELECT r."Email", r."First Name", r."Middle Name", r."Last Name",\
+            r."Gender", r."Institution", r."Country",\
+            CASE WHEN r."Reg Fee (Faculty)" != '' OR\
+            r."Reg Fee (Postdoc)" != '' OR r."Reg Fee (Student)" != '' OR\
+            r."Reg Fee (Board)" != '' THEN 'Y' ELSE 'N' END\
+            AS "OCNS Member",\
+            r."Invitation Letter",\
+            CASE WHEN r."Reg Fee (Faculty)" != '' THEN 'Faculty'\
+            WHEN r."Reg Fee (Postdoc)" != '' THEN 'Postdoc'\
+            WHEN r."Reg Fee (Student)" != '' THEN 'Student'\
+            WHEN r."Reg Fee (Board)" != '' THEN 'Board'\
+            WHEN r."Reg Fee (Non-Member)" != '' THEN r."Registration Type"\
+            ELSE '' END AS "Registration Group",\
+            CASE WHEN contains({r_fees}, 'Main Meeting') OR a.mm\
+            THEN 'Y' ELSE 'N' END AS "Main meeting Registration",\
+            CASE WHEN contains({r_fees}, 'Workshops') OR a.ws\
+            THEN 'Y' ELSE 'N' END AS "Workshop Registration",\
+            CASE WHEN contains({r_fees}, 'Tutorial') OR a.tut\
+            THEN 'Y' ELSE 'N' END AS "Tutorial Registration",\
+            CAST(r."BanquetTickets" AS INT) +\
+            CAST(r."ExtraBanquetTickets" AS INT) + COALESCE(e.banquet, 0)\
+            AS "Banquet Tickets",\
+            {r_meal} || COALESCE(e.meals, '') AS "Special Meal",\
+            CAST(r."Shirt S" AS INT) + COALESCE(e.s, 0) AS "Shirt S",\
+            CAST(r."Shirt M" AS INT) + COALESCE(e.m, 0) AS "Shirt M",\
+            CAST(r."Shirt L" AS INT) + COALESCE(e.l, 0) AS "Shirt L",\
+            CAST(r."Shirt XL" AS INT) + COALESCE(e.xl, 0) AS "Shirt XL",\
+            r."Payment Type",\
+            CAST(r."Payment Total" AS DOUBLE) + COALESCE(a.payment, 0) +\
+            COALESCE(e.payment, 0) AS "Payment Total",\
+            CAST(r."Balance" AS DOUBLE) AS "Balance",\
+            CASE WHEN a.codes IS NULL THEN '' ELSE a.codes || ' ' END ||\
+            CASE WHEN r."Discount Code" = 'None' THEN ''\
+            ELSE r."Discount Code" END AS "Discount Code"\
+            FROM receipts AS r\
+            LEFT JOIN added AS a ON a."Email" = r."Email"\
+            LEFT JOIN extras AS e ON e."Email" = r."Email"
+            """
+        ).format(master=self.tabs["Master"],
+                 receipts=self.tabs["RegReceipts"],
+                 add_to_regs=self.tabs["AddToRegs"],
+                 add_extras=self.tabs["AddExtras"],
+                 fees=fees, meal=meal,
+                 r_fees=fees.replace('("', '(r."').replace(', "', ', r."'),
+                 r_meal=meal.replace(' "', ' r."'))
+        conn.execute(query)
+        self.instrumentation.add_rows(conn.execute(
+            "SELECT COUNT(*) FROM {}".format(self.tabs["Master"])).fetchone()[0])
+
+    def __dump_duckdb_data(self, output_filename, query, output_format="csv"):
+        """
+        Dump results of query to a file, in the same formats as sqlite
+
+        :output_filename: File to dump data to
+        :query: SQL query to execute
+        :output_format: what format to output in. html, csv
+        :returns: nothing
+
+        """
+        cur = self.duckdb_conn.execute(query)
+        columns = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+        with open(output_filename, 'w', newline='') as fh:
+            if output_format == "html":
+                print(html_row("TH", columns), file=fh)
+                for row in rows:
+                    print(html_row("TD", row), file=fh)
+            else:
+                for row in [columns] + rows:
+                    fh.write(",".join(csv_field(c) for c in row) + "\r\n")
+
+    def run_query(self, query):
+        """Run an ad-hoc query.
+
+        :query: SQL query
+        :returns: (column names, rows)
+        """
+        cur = self.__get_db_conn().cursor()
+        cur.execute(query)
+        return [d[0] for d in cur.description], cur.fetchall()
 
     def __get_db_conn(self, db_name=None):
         """Connect to sqlite3 database
@@ -487,12 +878,22 @@ class Metrics():
         :returns: connection to the db
 
         """
+        if self.engine == "duckdb":
+            if self.duckdb_conn is None:
+                print("The duckdb engine needs the raw files",
+                      file=sys.stderr)
+                self.usage()
+                sys.exit(-1)
+            return self.duckdb_conn
+
         if not db_name:
             db_name = self.db_name
 
         if os.path.isfile(self.db_name):
-            conn = sqlite3.connect(db_name)
+            conn = sqlite3.connect(db_name,
+                                   cached_statements=cached_statements)
             conn.row_factory = sqlite3.Row
+            self.instrumentation.trace(conn)
         else:
             print("Could not find db file: {}".format(db_name),
                   file=sys.stderr)
@@ -501,217 +902,163 @@ class Metrics():
 
         return conn
 
+    def collect_metrics(self, conn=None):
+        """Collect the metrics.
+
+        They are read from the summary tables, or computed from the master
+        table if the database does not have them.
+
+        Counts broken down by a column are lists of [value, count] pairs, in
+        the order they are reported.
+
+        :conn: connection to use, by default a new one to the database
+        :returns: dict
+        """
+        if conn is None:
+            conn = self.__get_db_conn()
+        cur = conn.cursor()
+        cur.execute('SELECT COUNT(*) FROM sqlite_master WHERE name IN (?, ?)',
+                    (self.tabs["Totals"], self.tabs["Breakdown"]))
+        summaries = cur.fetchone()[0] == 2
+        totals = dict(summary_totals)
+        metrics = {}
+
+        def total(name, member=None):
+            if summaries:
+                query = textwrap.dedent(
+                    """\
+                    SELECT SUM("{}") from {}\
+                    {};\
+                    """
+                ).format(name, self.tabs["Totals"],
+                         'WHERE "member"==?' if member else "")
+            else:
+                query = textwrap.dedent(
+                    """\
+                    SELECT SUM({}) from {}\
+                    {};\
+                    """
+                ).format(totals[name].format(row=self.tabs["Master"]),
+                         self.tabs["Master"],
+                         'WHERE "OCNS Member"==?' if member else "")
+            cur.execute(query, (member,) if member else ())
+            return cur.fetchone()[0]
+
+        def breakdown(column, member=None, order=True):
+            if summaries:
+                query = textwrap.dedent(
+                    """\
+                    SELECT "value", SUM("registrants") from {}\
+                    WHERE "dimension"=='{}' {}\
+                    GROUP BY "value"\
+                    HAVING SUM("registrants") > 0\
+                    ORDER BY {}"value" ASC NULLS FIRST;\
+                    """
+                ).format(self.tabs["Breakdown"], column,
+                         'AND "member"==?' if member else "",
+                         'SUM("registrants") ASC, ' if order else "")
+            else:
+                query = textwrap.dedent(
+                    """\
+                    SELECT "{}", COUNT(*) from {}\
+                    {}\
+                    GROUP BY "{}"\
+                    ORDER BY {}"{}" ASC NULLS FIRST;\
+                    """
+                ).format(column, self.tabs["Master"],
+                         'WHERE "OCNS Member"==?' if member else "", column,
+                         "COUNT(*) ASC, " if order else "", column)
+            cur.execute(query, (member,) if member else ())
+            return [list(row) for row in cur.fetchall()]
+
+        # Overall numbers. SUM is NULL without registrants.
+        metrics["registrants"] = total("registrants") or 0
+        metrics["main_meeting"] = total("main_meeting") or 0
+        metrics["workshops"] = total("workshops") or 0
+        metrics["tutorials"] = total("tutorials") or 0
+        metrics["groups"] = breakdown("Registration Group")
+        metrics["genders"] = breakdown("Gender", order=False)
+        metrics["countries"] = breakdown("Country")
+
+        # Shirts
+        metrics["shirts"] = {}
+        for shirtsize in ["S", "M", "L", "XL"]:
+            metrics["shirts"][shirtsize] = total(
+                "shirt_{}".format(shirtsize.lower()))
+
+        # Banquet tickets
+        metrics["banquet_tickets"] = total("banquet_tickets")
+
+        # Members, and non members
+        for key, flag in [("members", "Y"), ("non_members", "N")]:
+            metrics[key] = {
+                "registrants": total("registrants", flag) or 0,
+                "groups": breakdown("Registration Group", flag),
+            }
+        metrics["members"]["genders"] = breakdown("Gender", "Y", order=False)
+        metrics["members"]["countries"] = breakdown("Country", "Y")
+
+        self.instrumentation.add_rows(metrics["registrants"])
+        return metrics
+
+    @stage("metrics")
     def generate_metrics(self):
         """Generate metrics.
 
         :returns: nothing
         """
-        conn = self.__get_db_conn()
-        cur = conn.cursor()
-        with open("2019-metrics.txt", 'w') as fh:
+        metrics = self.collect_metrics()
+
+        def print_breakdown(rows, fh):
+            for group, numbers in rows:
+                print("{}: {}".format(group, numbers), file=fh)
+
+        with open("{}-metrics.txt".format(self.year), 'w') as fh:
             # Overall numbers
             print("** OVERALL METRICS**", file=fh)
-            query = textwrap.dedent(
-                """\
-                SELECT COUNT(*) from {};\
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            total_registrants = cur.fetchone()[0]
-
-            print("Total registrants: {}".format(total_registrants),
+            print("Total registrants: {}".format(metrics["registrants"]),
                   file=fh)
-
-            # Main meeting
-            query = textwrap.dedent(
-                """\
-                SELECT COUNT(*) from {}\
-                WHERE "Main meeting Registration"=="Y";
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            total_registrants = cur.fetchone()[0]
-
             print("Total registrants (main meeting): {}".format(
-                total_registrants), file=fh)
-
-            # Workshops
-            query = textwrap.dedent(
-                """\
-                SELECT COUNT(*) from {}\
-                WHERE "Workshop Registration"=="Y";
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            total_registrants = cur.fetchone()[0]
-
+                metrics["main_meeting"]), file=fh)
             print("Total registrants (workshops): {}".format(
-                total_registrants), file=fh)
-
-            # Tutorials
-            query = textwrap.dedent(
-                """\
-                SELECT COUNT(*) from {}\
-                WHERE "Tutorial Registration"=="Y";
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            total_registrants = cur.fetchone()[0]
-
+                metrics["workshops"]), file=fh)
             print("Total registrants (tutorials): {}".format(
-                total_registrants), file=fh)
+                metrics["tutorials"]), file=fh)
 
-            # Overall breakdown by groups
             print("\nGroup metrics:", file=fh)
-            query = textwrap.dedent(
-                """\
-                SELECT "Registration Group", COUNT(*) from {}\
-                GROUP BY "Registration Group"\
-                ORDER BY COUNT(*) ASC;\
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            rows = cur.fetchall()
-            for group, numbers in rows:
-                print("{}: {}".format(group, numbers), file=fh)
-
-            # Overall breakdown by gender
+            print_breakdown(metrics["groups"], fh)
             print("\nGender metrics:", file=fh)
-            query = textwrap.dedent(
-                """\
-                SELECT "Gender", COUNT(*) FROM {}\
-                GROUP BY "Gender";\
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            rows = cur.fetchall()
-            for group, numbers in rows:
-                print("{}: {}".format(group, numbers), file=fh)
-
-            # Overall breakdown by country
+            print_breakdown(metrics["genders"], fh)
             print("\nLocation metrics:", file=fh)
-            query = textwrap.dedent(
-                """\
-                SELECT "Country", COUNT(*) FROM {}\
-                GROUP BY "Country"\
-                ORDER BY COUNT(*) ASC;\
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            rows = cur.fetchall()
-            for group, numbers in rows:
-                print("{}: {}".format(group, numbers), file=fh)
+            print_breakdown(metrics["countries"], fh)
 
             # Shirts
             print("\nShirts requested:", file=fh)
-            totalshirts = 0
-            for shirtsize in ["S", "M", "L", "XL"]:
-                query = textwrap.dedent(
-                    """\
-                    SELECT SUM("Shirt {}") from {};\
-                    """
-                ).format(shirtsize, self.tabs["Master"])
-                cur.execute(query)
-                shirts = cur.fetchone()[0]
-                totalshirts += shirts
-
-                print("Shirts ({}): {}".format(
-                    shirtsize, shirts), file=fh)
-            print("Shirts (total): {}".format(totalshirts), file=fh)
-
-            # Banquet tickets
-            query = textwrap.dedent(
-                """\
-                SELECT SUM("Banquet Tickets") from {};\
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            banquet_tickets = cur.fetchone()[0]
-            print("\nBanquet tickets purchased: {}".format(banquet_tickets),
+            for shirtsize, shirts in metrics["shirts"].items():
+                print("Shirts ({}): {}".format(shirtsize, shirts), file=fh)
+            print("Shirts (total): {}".format(sum(metrics["shirts"].values())),
                   file=fh)
 
+            print("\nBanquet tickets purchased: {}".format(
+                metrics["banquet_tickets"]), file=fh)
+
             # Members
             print("\n** MEMBER METRICS**", file=fh)
-            query = textwrap.dedent(
-                """\
-                SELECT COUNT(*) from {}\
-                WHERE "OCNS Member"=="Y";\
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            total_registrants = cur.fetchone()[0]
-            print("OCNS members registered: {}".format(total_registrants),
-                  file=fh)
-
-            # Members breakdown
-            query = textwrap.dedent(
-                """\
-                SELECT "Registration Group", COUNT(*) from {}\
-                WHERE "OCNS Member"=="Y"\
-                GROUP BY "Registration Group"\
-                ORDER BY COUNT(*) ASC;\
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            rows = cur.fetchall()
-            for group, numbers in rows:
-                print("{}: {}".format(group, numbers), file=fh)
-
-            # Overall breakdown by gender
+            print("OCNS members registered: {}".format(
+                metrics["members"]["registrants"]), file=fh)
+            print_breakdown(metrics["members"]["groups"], fh)
             print("\nGender metrics:", file=fh)
-            query = textwrap.dedent(
-                """\
-                SELECT "Gender", COUNT(*) FROM {}\
-                WHERE "OCNS Member"=="Y"\
-                GROUP BY "Gender";\
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            rows = cur.fetchall()
-            for group, numbers in rows:
-                print("{}: {}".format(group, numbers), file=fh)
-
+            print_breakdown(metrics["members"]["genders"], fh)
             print("\nLocation metrics:", file=fh)
-            query = textwrap.dedent(
-                """\
-                SELECT "Country", COUNT(*) FROM {}\
-                WHERE "OCNS Member"=="Y"\
-                GROUP BY "Country"\
-                ORDER BY COUNT(*) ASC;\
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            rows = cur.fetchall()
-            for group, numbers in rows:
-                print("{}: {}".format(group, numbers), file=fh)
+            print_breakdown(metrics["members"]["countries"], fh)
 
             # Non-Members
             print("\n** NON-MEMBER METRICS**", file=fh)
-            query = textwrap.dedent(
-                """\
-                SELECT COUNT(*) from {}\
-                WHERE "OCNS Member"=="N";\
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            total_registrants = cur.fetchone()[0]
-            print("Non members registered: {}".format(total_registrants),
-                  file=fh)
-
-            # Members breakdown
-            query = textwrap.dedent(
-                """\
-                SELECT "Registration Group", COUNT(*) from {}\
-                WHERE "OCNS Member"=="N"\
-                GROUP BY "Registration Group"\
-                ORDER BY COUNT(*) ASC;\
-                """
-            ).format(self.tabs["Master"])
-            cur.execute(query)
-            rows = cur.fetchall()
-            for group, numbers in rows:
-                print("{}: {}".format(group, numbers), file=fh)
+            print("Non members registered: {}".format(
+                metrics["non_members"]["registrants"]), file=fh)
+            print_breakdown(metrics["non_members"]["groups"], fh)
 
+    @stage("dump")
     def dump_all_data(self):
         """
         Dump data to files.
@@ -726,8 +1073,10 @@ class Metrics():
             ORDER BY "Email";
             """
         ).format(self.tabs['Master'])
-        self.__dump_data("2019-Registration-master.csv", query, "csv")
-        self.__dump_data("2019-Registration-master.html", query, "html")
+        self.__dump_data(
+            "{}-Registration-master.csv".format(self.year), query, "csv")
+        self.__dump_data(
+            "{}-Registration-master.html".format(self.year), query, "html")
 
         # Full table dump selected fields
         query = textwrap.dedent(
@@ -750,40 +1099,48 @@ class Metrics():
             ORDER BY "Email";
             """
         ).format(self.tabs['Master'])
-        self.__dump_data("2019-Registration-all.csv", query, "csv")
-        self.__dump_data("2019-Registration-all.html", query, "html")
+        self.__dump_data(
+            "{}-Registration-all.csv".format(self.year), query, "csv")
+        self.__dump_data(
+            "{}-Registration-all.html".format(self.year), query, "html")
 
         # Main meeting attendees
         query = textwrap.dedent(
             """\
             SELECT * FROM {}\
-            WHERE "Main meeting Registration"=="Y"\
+            WHERE "Main meeting Registration"=='Y'\
             ORDER BY "Email";
             """).format(self.tabs['Master'])
-        self.__dump_data("2019-Main-meeting-attendees.csv", query, "csv")
-        self.__dump_data("2019-Main-meeting-attendees.html", query, "html")
+        self.__dump_data(
+            "{}-Main-meeting-attendees.csv".format(self.year), query, "csv")
+        self.__dump_data(
+            "{}-Main-meeting-attendees.html".format(self.year), query, "html")
 
         # Workshop
         query = textwrap.dedent(
             """\
             SELECT *\
             FROM {}\
-            WHERE "Workshop Registration"=="Y"\
+            WHERE "Workshop Registration"=='Y'\
             ORDER BY "Email";
             """).format(self.tabs['Master'])
-        self.__dump_data("2019-Workshop-attendees.csv", query, "csv")
-        self.__dump_data("2019-Workshop-attendees.html", query, "html")
+        self.__dump_data(
+            "{}-Workshop-attendees.csv".format(self.year), query, "csv")
+        self.__dump_data(
+            "{}-Workshop-attendees.html".format(self.year), query, "html")
 
         # Tutorials
         query = textwrap.dedent(
             """\
             SELECT *\
             FROM {}\
-            WHERE "Tutorial Registration"=="Y"\
+            WHERE "Tutorial Registration"=='Y'\
             ORDER BY "Email";
             """).format(self.tabs['Master'])
-        self.__dump_data("2019-Tutorial-attendees.csv", query, "csv")
-        self.__dump_data("2019-Tutorial-attendees.html", query, "html")
+        self.__dump_data(
+            "{}-Tutorial-attendees.csv".format(self.year), query, "csv")
+        self.__dump_data(
+            "{}-Tutorial-attendees.html".format(self.year), query, "html")
 
         # Banquets
         query = textwrap.dedent(
@@ -799,8 +1156,10 @@ class Metrics():
             WHERE not "Banquet Tickets"==0\
             ORDER BY "Email";
             """).format(self.tabs['Master'])
-        self.__dump_data("2019-Banquet-attendees.csv", query, "csv")
-        self.__dump_data("2019-Banquet-attendees.html", query, "html")
+        self.__dump_data(
+            "{}-Banquet-attendees.csv".format(self.year), query, "csv")
+        self.__dump_data(
+            "{}-Banquet-attendees.html".format(self.year), query, "html")
 
         # T-shirts
         query = textwrap.dedent(
@@ -815,8 +1174,10 @@ class Metrics():
             ORDER BY "Email";
             """).format(self.tabs['Master'])
 
-        self.__dump_data("2019-shirts.csv", query, "csv")
-        self.__dump_data("2019-shirts.html", query, "html")
+        self.__dump_data(
+            "{}-shirts.csv".format(self.year), query, "csv")
+        self.__dump_data(
+            "{}-shirts.html".format(self.year), query, "html")
 
     def __dump_data(self, output_filename, query, output_format="csv"):
         """
@@ -830,6 +1191,10 @@ class Metrics():
         :returns: TODO
 
         """
+        if self.engine == "duckdb":
+            self.__dump_duckdb_data(output_filename, query, output_format)
+            return
+
         commands = textwrap.dedent(
             """\
             .open {}
@@ -846,11 +1211,48 @@ class Metrics():
 
 
 if __name__ == "__main__":
-    new_gen = Metrics()
-
-    if len(sys.argv) == 5:
+    parser = argparse.ArgumentParser(
+        description="Generate registration metrics from Memberclicks data")
+    parser.add_argument("files", nargs="*",
+                        help="db_name, or the 4 raw csv files")
+    parser.add_argument("--profile", choices=stages,
+                        help="profile this stage")
+    parser.add_argument("--profiler", choices=profilers, default="cprofile",
+                        help="profiler to use with --profile")
+    parser.add_argument("--engine", choices=engines, default="sqlite",
+                        help="import into sqlite, or query the files in "
+                        "place with duckdb")
+    parser.add_argument("--query", help="only run this query and print the "
+                        "result as csv")
+    parser.add_argument("--year", type=int, default=2019,
+                        help="year of the conference (default: 2019)")
+    parser.add_argument("--report", help="file to write the JSON report of "
+                        "the stages to")
+    args = parser.parse_args()
+
+    try:
+        new_gen = Metrics(Instrumentation(args.profile, args.profiler),
+                          args.year, args.engine)
+    except ImportError as e:
+        print("ERROR: {}".format(e), file=sys.stderr)
+        sys.exit(1)
+    if len(args.files) not in [0, 1, 4]:
+        new_gen.usage()
+        sys.exit(-1)
+
+    if len(args.files) == 1:
+        new_gen.db_name = args.files[0]
+    elif len(args.files) == 4:
         print("Loading csv data to table", file=sys.stderr)
-        new_gen.setup_new_db(sys.argv)
+        new_gen.setup_new_db([sys.argv[0]] + args.files)
+
+    if args.query:
+        columns, rows = new_gen.run_query(args.query)
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows(rows)
+        sys.exit(0)
 
     new_gen.generate_metrics()
     new_gen.dump_all_data()
+    new_gen.instrumentation.write_report(args.report or new_gen.report_fn)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Cube of the registrations, to answer any breakdown without writing SQL.
+
+The registrants of the master table are summed by these dimensions:
+
+- group, member, gender, country, payment_type
+- main_meeting, workshops, tutorials, banquet: Y or N
+
+with the measures registrants, banquet_tickets, shirts, shirt_s, shirt_m,
+shirt_l, shirt_xl and payment_total.
+
+Grouping by all the dimensions at once gives about as many cells as
+registrants, so instead the rollups by the combinations of `cuboids` are
+precomputed, and stored in the `registration_cube` table of the same
+database, one row per cell, with the name of its cuboid and NULL for the
+dimensions it does not have. registration-metrics-sqlite.py builds them at
+the end of the import.
+
+A query is answered from the smallest cuboid that has all the dimensions it
+uses, e.g. students at the workshops by country, or banquet tickets of
+members by group:
+
+    registration_cube.py --by country --where group=Student --where workshops=Y
+    registration_cube.py --by group --where member=Y --measures banquet_tickets
+    registration_cube.py --by group --measures shirt_m
+
+A query over dimensions that no cuboid has together, e.g. gender with the
+events by country, is summed from the master table instead, and the command
+line says so on stderr. A --where on the same dimension twice matches either
+value. With no --by, the totals are printed.
+
+File: registration_cube.py
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import textwrap
+
+from registration_warehouse import parse_condition, print_table
+
+
+master_table = "registration_master"
+cube_table = "registration_cube"
+# Dimensions, and their expressions on the master table
+dimensions = {
+    "group": '"Registration Group"',
+    "member": '"OCNS Member"',
+    "gender": '"Gender"',
+    "country": '"Country"',
+    "payment_type": '"Payment Type"',
+    "main_meeting": '"Main meeting Registration"',
+    "workshops": '"Workshop Registration"',
+    "tutorials": '"Tutorial Registration"',
+    "banquet": """CASE WHEN "Banquet Tickets" > 0 THEN 'Y' ELSE 'N' END""",
+}
+# Measures, and their aggregates over the master table
+measures = {
+    "registrants": "COUNT(*)",
+    "banquet_tickets": 'SUM("Banquet Tickets")',
+    "shirts": 'SUM("Shirt S" + "Shirt M" + "Shirt L" + "Shirt XL")',
+    "shirt_s": 'SUM("Shirt S")',
+    "shirt_m": 'SUM("Shirt M")',
+    "shirt_l": 'SUM("Shirt L")',
+    "shirt_xl": 'SUM("Shirt XL")',
+    "payment_total": 'SUM("Payment Total")',
+}
+events = ["main_meeting", "workshops", "tutorials", "banquet"]
+# Precomputed rollups, and their dimensions
+cuboids = {
+    "events": ["group", "member", "gender"] + events,
+    "country": ["group", "member", "gender", "country", "payment_type"],
+    "country_events": ["country", "group"] + events,
+    "payment": ["group", "member", "payment_type"],
+}
+
+
+def build(conn, master=master_table):
+    """Build the cuboids from the master table, replacing the previous ones.
+
+    :conn: sqlite3 connection
+    :master: name of the master table
+    :returns: number of cells of the cube
+    """
+    with conn:
+        conn.execute("DROP TABLE IF EXISTS {}".format(cube_table))
+        conn.execute("CREATE TABLE {} (cuboid TEXT, {}, {})".format(
+            cube_table, ", ".join('"{}"'.format(d) for d in dimensions),
+            ", ".join('"{}"'.format(m) for m in measures)))
+        for name, cuboid in cuboids.items():
+            conn.execute(textwrap.dedent(
+                """\
+                INSERT INTO {} (cuboid, {}, {})\
+                SELECT ?, {}, {} FROM {}\
+                GROUP BY {}
+                """
+            ).format(cube_table,
+                     ", ".join('"{}"'.format(d) for d in cuboid),
+                     ", ".join('"{}"'.format(m) for m in measures),
+                     ", ".join(dimensions[d] for d in cuboid),
+                     ", ".join(measures.values()),
+                     master,
+                     ", ".join(str(i + 2) for i in range(len(cuboid)))),
+                (name,))
+        conn.execute("CREATE INDEX {0}_cuboid ON {0} (cuboid)".format(
+            cube_table))
+    return conn.execute(
+        "SELECT COUNT(*) FROM {}".format(cube_table)).fetchone()[0]
+
+
+def choose_cuboid(conn, names):
+    """Get the smallest cuboid that has some dimensions.
+
+    :conn: sqlite3 connection to a database with the cube
+    :names: dimensions that the query uses
+    :returns: name of the cuboid, or None if no cuboid has them all
+    """
+    sizes = dict(conn.execute(
+        "SELECT cuboid, COUNT(*) FROM {} GROUP BY cuboid".format(cube_table)))
+    covering = [c for c in cuboids
+                if set(names) <= set(cuboids[c]) and c in sizes]
+    return min(covering, key=lambda c: sizes[c]) if covering else None
+
+
+def query(conn, by=(), where=None, measure_names=None, master=master_table):
+    """Sum the measures of the cube by some dimensions.
+
+    :conn: sqlite3 connection to a database with the cube
+    :by: dimensions to break down by, none for the totals
+    :where: dict of dimension to a value or a list of values
+    :measure_names: measures to sum, all by default
+    :master: name of the master table, read if no cuboid has the dimensions
+    :returns: list of dicts, in the order of the dimensions
+    """
+    where = where or {}
+    measure_names = list(measure_names or measures)
+    for name in list(by) + list(where):
+        if name not in dimensions:
+            raise ValueError("Unknown dimension: {}".format(name))
+    for name in measure_names:
+        if name not in measures:
+            raise ValueError("Unknown measure: {}".format(name))
+
+    cuboid = choose_cuboid(conn, list(by) + list(where))
+    if cuboid is None:
+        # Sum the master table by the dimensions instead
+        table = master
+        expressions = dimensions
+        aggregates = measures
+        conditions = []
+    else:
+        table = cube_table
+        expressions = {d: '"{}"'.format(d) for d in dimensions}
+        aggregates = {m: 'SUM("{}")'.format(m) for m in measures}
+        conditions = ["cuboid == ?"]
+    params = [] if cuboid is None else [cuboid]
+    for name, values in where.items():
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        conditions.append('{} IN ({})'.format(
+            expressions[name], ", ".join("?" for v in values)))
+        params += values
+    columns = ['{} AS "{}"'.format(expressions[d], d) for d in by]
+    group = ", ".join(str(i + 1) for i in range(len(by)))
+    query = textwrap.dedent(
+        """\
+        SELECT {} FROM {}\
+        {}\
+        {}
+        """
+    ).format(", ".join(columns + ['{} AS "{}"'.format(aggregates[m], m)
+                                  for m in measure_names]),
+             table,
+             "WHERE " + " AND ".join(conditions) if conditions else "",
+             "GROUP BY {0} ORDER BY {0}".format(group) if by else "")
+    cur = conn.execute(query, params)
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Query the cube of the registrations")
+    parser.add_argument("--db", default="CNS2019.sqlite",
+                        help="database written by registration-metrics-sqlite.py")
+    parser.add_argument("--build", action="store_true",
+                        help="build the cube again first")
+    parser.add_argument("--by", nargs="+", default=[], choices=dimensions,
+                        help="dimensions to break down by")
+    parser.add_argument("--where", action="append", default=[],
+                        metavar="DIMENSION=VALUE",
+                        help="only count registrants with this value")
+    parser.add_argument("--measures", nargs="+", choices=measures,
+                        help="measures to sum (default: all)")
+    parser.add_argument("--json", action="store_true",
+                        help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.build:
+        print("{} cells".format(build(conn)), file=sys.stderr)
+
+    where = {}
+    try:
+        for condition in args.where:
+            name, value = parse_condition(condition)
+            where.setdefault(name, []).append(value)
+        result = query(conn, args.by, where, args.measures)
+    except (ValueError, sqlite3.OperationalError) as e:
+        print("ERROR: {}".format(e), file=sys.stderr)
+        sys.exit(1)
+    cuboid = choose_cuboid(conn, list(args.by) + list(where))
+    if cuboid is None:
+        print("WARNING: no cuboid has {}, summed from {}".format(
+            ", ".join(sorted(set(args.by) | set(where))), master_table),
+            file=sys.stderr)
+    else:
+        print("From the {} cuboid".format(cuboid), file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(result, indent=1))
+    else:
+        print_table(result)
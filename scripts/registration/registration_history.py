@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Keep the history of the registrations across imports.
+
+registration-metrics-sqlite.py imports the exports into a new database each
+time. After each import, the master table is compared to the history, and
+only the registrants that were added, changed or removed are written:
+
+    registration_history ("Email", "valid_from", "valid_to", <columns of the
+                          master table>, "Submitted")
+
+A registrant has one row per version, valid from the import that first saw
+it to the import that saw it change or disappear (NULL while current). Rows
+are only ever added, and closed by setting valid_to, so the history grows
+with the changes, not with the number of imports. The imports themselves are
+listed in `snapshots`.
+
+"Submitted" is the first Submit Date of the registrant in the receipts, as
+YYYY-MM-DD HH:MM:SS, and "Submitted Day" its date. The daily velocity series
+groups on "Submitted Day" and reads only the indexes: a partial index of the
+current versions for the series of now, and one on ("Submitted Day",
+"valid_from", "valid_to") for the series as of an earlier time. The partial
+index also lets each import find the current versions without scanning the
+whole history.
+
+The history is kept in `CNS<year>-history.sqlite`, next to the database of
+the year. It can be queried as of any time, e.g. the students registered on
+the early bird deadline, or the registrations per day:
+
+    registration_history.py as-of "2019-05-15 23:59:59" --by "Registration Group"
+    registration_history.py velocity
+    registration_history.py record CNS2019.sqlite --taken "2019-05-15 12:00:00"
+    registration_history.py snapshots
+
+File: registration_history.py
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import textwrap
+from datetime import datetime
+
+from registration_warehouse import columns, parse_condition, print_table
+
+
+history_db = "CNS{}-history.sqlite"
+master_table = "registration_master"
+receipts_table = "registration_receipts"
+submit_date_format = "%m/%d/%Y %H:%M:%S"
+history_columns = columns + ["Submitted", "Submitted Day"]
+
+
+def iso_date(submit_date):
+    """Convert a Memberclicks Submit Date to YYYY-MM-DD HH:MM:SS."""
+    try:
+        return datetime.strptime(submit_date, submit_date_format).isoformat(
+            sep=" ")
+    except (TypeError, ValueError):
+        return None
+
+
+def get_conn(db_name):
+    """Open the history, creating the tables and indexes if needed.
+
+    :db_name: path of the history database
+    :returns: sqlite3 connection
+    """
+    conn = sqlite3.connect(db_name)
+    conn.create_function("iso_date", 1, iso_date, deterministic=True)
+    conn.execute(textwrap.dedent(
+        """\
+        CREATE TABLE IF NOT EXISTS registration_history (\
+        "valid_from" TEXT NOT NULL,\
+        "valid_to" TEXT,\
+        {}\
+        )
+        """
+    ).format(",".join('"{}"'.format(c) for c in history_columns)))
+    conn.execute(textwrap.dedent(
+        """\
+        CREATE TABLE IF NOT EXISTS snapshots (\
+        "taken" TEXT PRIMARY KEY,\
+        "source" TEXT,\
+        "registrants" INT,\
+        "added" INT,\
+        "closed" INT\
+        )
+        """))
+    conn.execute('CREATE INDEX IF NOT EXISTS registration_history_email '
+                 'ON registration_history ("Email", "valid_to")')
+    conn.execute('CREATE INDEX IF NOT EXISTS registration_history_valid '
+                 'ON registration_history ("valid_from", "valid_to")')
+    # Histories made before "Submitted Day" existed
+    if "Submitted Day" not in [row[1] for row in conn.execute(
+            "PRAGMA table_info(registration_history)")]:
+        with conn:
+            conn.execute('ALTER TABLE registration_history '
+                         'ADD COLUMN "Submitted Day"')
+            conn.execute('UPDATE registration_history '
+                         'SET "Submitted Day" = substr("Submitted", 1, 10)')
+    conn.execute('DROP INDEX IF EXISTS registration_history_submitted')
+    conn.execute('CREATE INDEX IF NOT EXISTS registration_history_current '
+                 'ON registration_history ("Submitted Day", "Email") '
+                 'WHERE "valid_to" IS NULL')
+    conn.execute('CREATE INDEX IF NOT EXISTS registration_history_day '
+                 'ON registration_history ("Submitted Day", "valid_from", '
+                 '"valid_to")')
+    return conn
+
+
+def record_snapshot(conn, master_db, taken=None):
+    """Record the state of a master table in the history.
+
+    :conn: connection to the history
+    :master_db: database written by registration-metrics-sqlite.py
+    :taken: time of the snapshot, YYYY-MM-DD HH:MM:SS, now by default. It
+        must be later than the last snapshot.
+    :returns: (registrants, rows added, rows closed)
+    :raises ValueError: if the snapshot is not the latest, or master_db does
+        not exist or has no master and receipts tables
+    """
+    taken = taken or datetime.now().isoformat(sep=" ", timespec="seconds")
+    last = conn.execute('SELECT MAX("taken") FROM snapshots').fetchone()[0]
+    if last is not None and taken <= last:
+        raise ValueError("Snapshot at {} is not after the last one, at {}"
+                         .format(taken, last))
+
+    quoted = ",".join('"{}"'.format(c) for c in history_columns)
+    same = " AND ".join('c."{0}" IS registration_history."{0}"'.format(c)
+                        for c in history_columns)
+    # ATTACH would create an empty database if the file did not exist
+    if not os.path.isfile(master_db):
+        raise ValueError("No such database: {}".format(master_db))
+    conn.execute("ATTACH DATABASE ? AS master", (master_db,))
+    try:
+        tables = set(row[0] for row in conn.execute(
+            "SELECT name FROM master.sqlite_master WHERE type='table'"))
+        missing = [t for t in [master_table, receipts_table]
+                   if t not in tables]
+        if missing:
+            raise ValueError("{}: no {} table, run "
+                             "registration-metrics-sqlite.py first".format(
+                                 master_db, " or ".join(missing)))
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS temp.current")
+            conn.execute(textwrap.dedent(
+                """\
+                CREATE TEMP TABLE current AS\
+                SELECT m.*, s."Submitted",\
+                substr(s."Submitted", 1, 10) AS "Submitted Day"\
+                FROM master.{} AS m\
+                LEFT JOIN (\
+                SELECT "Email", MIN(iso_date("Submit Date")) AS "Submitted"\
+                FROM master.{} GROUP BY "Email"\
+                ) AS s USING ("Email")
+                """
+            ).format(master_table, receipts_table))
+            conn.execute('CREATE INDEX temp.current_email ON current ("Email")')
+            # Close the versions that changed or are gone
+            closed = conn.execute(textwrap.dedent(
+                """\
+                UPDATE registration_history SET "valid_to" = ?\
+                WHERE "valid_to" IS NULL AND NOT EXISTS (\
+                SELECT 1 FROM temp.current AS c\
+                WHERE {}\
+                )
+                """
+            ).format(same), (taken,)).rowcount
+            # Open versions for the registrants without a current one
+            added = conn.execute(textwrap.dedent(
+                """\
+                INSERT INTO registration_history ("valid_from", {})\
+                SELECT ?, {} FROM temp.current AS c\
+                WHERE NOT EXISTS (\
+                SELECT 1 FROM registration_history AS h\
+                WHERE h."Email" = c."Email" AND h."valid_to" IS NULL\
+                )
+                """
+            ).format(quoted, ",".join('c."{}"'.format(c)
+                                       for c in history_columns)),
+                (taken,)).rowcount
+            registrants = conn.execute(
+                "SELECT COUNT(*) FROM temp.current").fetchone()[0]
+            conn.execute("INSERT INTO snapshots VALUES (?, ?, ?, ?, ?)",
+                         (taken, master_db, registrants, added, closed))
+            conn.execute("DROP TABLE temp.current")
+    finally:
+        conn.execute("DETACH DATABASE master")
+    return registrants, added, closed
+
+
+def as_of(conn, when, by=None, where=None):
+    """Count the registrants as they were recorded at a time.
+
+    :conn: connection to the history
+    :when: YYYY-MM-DD HH:MM:SS, or YYYY-MM-DD for the start of the day
+    :by: column to break down by, if any
+    :where: dict of column to value the registrants must have
+    :returns: list of dicts
+    """
+    where = where or {}
+    for column in ([by] if by else []) + list(where):
+        if column not in history_columns:
+            raise ValueError("Unknown column: {}".format(column))
+    conditions = ['"valid_from" <= ?',
+                  '("valid_to" IS NULL OR "valid_to" > ?)']
+    conditions += ['"{}" == ?'.format(c) for c in where]
+    cur = conn.execute(textwrap.dedent(
+        """\
+        SELECT {}COUNT(*) AS "registrants" FROM registration_history\
+        WHERE {}\
+        {}
+        """
+    ).format('"{}", '.format(by) if by else "",
+             " AND ".join(conditions),
+             'GROUP BY "{0}" ORDER BY "{0}"'.format(by) if by else ""),
+        [when, when] + list(where.values()))
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+def velocity(conn, when=None):
+    """Get the registrations per day of submission, and their running total.
+
+    :conn: connection to the history
+    :when: count the registrants as recorded at this time, the current ones
+        by default
+    :returns: list of dicts
+    """
+    if when is None:
+        condition, params = '"valid_to" IS NULL', []
+    else:
+        condition = ('"valid_from" <= ? AND '
+                     '("valid_to" IS NULL OR "valid_to" > ?)')
+        params = [when, when]
+    rows = conn.execute(textwrap.dedent(
+        """\
+        SELECT "Submitted Day", COUNT(*),\
+        SUM(COUNT(*)) OVER (ORDER BY "Submitted Day")\
+        FROM registration_history\
+        WHERE {} AND "Submitted Day" IS NOT NULL\
+        GROUP BY "Submitted Day"\
+        ORDER BY "Submitted Day"
+        """
+    ).format(condition), params).fetchall()
+    return [{"day": day, "registrations": count, "total": total}
+            for day, count, total in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Keep and query the history of the registrations")
+    parser.add_argument("--db", help="history database "
+                        "(default: CNS<year>-history.sqlite)")
+    parser.add_argument("--year", type=int, default=2019,
+                        help="year of the conference (default: 2019)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser(
+        "record", help="record the master table of a database")
+    record_parser.add_argument("master_db")
+    record_parser.add_argument("--taken", help="time of the snapshot, "
+                               "YYYY-MM-DD HH:MM:SS (default: now)")
+    as_of_parser = subparsers.add_parser(
+        "as-of", help="count the registrants at a time")
+    as_of_parser.add_argument("when", help="YYYY-MM-DD[ HH:MM:SS]")
+    as_of_parser.add_argument("--by", help="column to break down by")
+    as_of_parser.add_argument("--where", action="append", default=[],
+                              metavar="COLUMN=VALUE")
+    velocity_parser = subparsers.add_parser(
+        "velocity", help="registrations per day of submission")
+    velocity_parser.add_argument("--as-of", dest="when",
+                                 help="as recorded at this time")
+    subparsers.add_parser("snapshots", help="list the snapshots")
+    for subparser in [as_of_parser, velocity_parser]:
+        subparser.add_argument("--json", action="store_true",
+                               help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    conn = get_conn(args.db or history_db.format(args.year))
+    try:
+        if args.command == "record":
+            registrants, added, closed = record_snapshot(conn, args.master_db,
+                                                         args.taken)
+            print("{}: {} registrants, {} versions added, {} closed".format(
+                args.master_db, registrants, added, closed), file=sys.stderr)
+            sys.exit(0)
+        if args.command == "snapshots":
+            cur = conn.execute('SELECT * FROM snapshots ORDER BY "taken"')
+            names = [d[0] for d in cur.description]
+            print_table([dict(zip(names, row)) for row in cur.fetchall()])
+            sys.exit(0)
+        if args.command == "as-of":
+            result = as_of(conn, args.when, args.by,
+                           dict(parse_condition(w) for w in args.where))
+        else:
+            result = velocity(conn, args.when)
+    except ValueError as e:
+        print("ERROR: {}".format(e), file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(result, indent=1))
+    else:
+        print_table(result)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Collect the registrations of all years into one database, to compare years.
+
+The master table that registration-metrics-sqlite.py builds for a year
+(`CNS2019.sqlite`, or `CNS<year>.sqlite` with --year) is copied into the
+`registrations` table of the warehouse, with a `year` column. Ingesting a
+year again replaces it.
+
+The years before 2019 were only processed by tohtml_2014.py to
+tohtml_2018.py, and their receipts exports do not have all the columns that
+registration-metrics-sqlite.py needs (Reg Fee (Board), Gender, Invitation
+Letter, Payment Type, Payment Total, Discount Code, and before 2017
+ExtraBanquetTickets). These years are ingested from the receipts export
+directly, with ingest-receipts: the registration group and events are derived
+as for 2019, and the columns the export does not have are NULL. Items added
+with the add to registrations and extras exports of those years are not
+included.
+
+The table is keyed on (year, Email), and indexed on (year, group) with the
+columns the comparisons read, so that the comparisons only read the indexes
+and answer in milliseconds however many years there are:
+
+- growth: registrants by country, with the change from the previous year
+  ingested. A country with no registrants in the previous year is counted
+  from 0, and a country with none this year is listed with 0.
+- mix: registrants by group and membership, as a share of the year
+- uptake: share of registrants of the main meeting, workshops, tutorials and
+  banquet
+
+Usage:
+
+    registration_warehouse.py ingest 2019 [CNS2019.sqlite]
+    registration_warehouse.py ingest-receipts 2016 Main2016.csv
+    registration_warehouse.py growth|mix|uptake [--json]
+
+File: registration_warehouse.py
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import textwrap
+
+
+warehouse_db = "registration-warehouse.sqlite"
+master_table = "registration_master"
+# Columns copied from the master table
+columns = ["Email", "First Name", "Middle Name", "Last Name", "Gender",
+           "Institution", "Country", "OCNS Member", "Invitation Letter",
+           "Registration Group", "Main meeting Registration",
+           "Workshop Registration", "Tutorial Registration",
+           "Banquet Tickets", "Special Meal", "Shirt S", "Shirt M", "Shirt L",
+           "Shirt XL", "Payment Type", "Payment Total", "Balance",
+           "Discount Code"]
+
+
+def get_conn(db_name=warehouse_db):
+    """Open the warehouse, creating the table and indexes if needed.
+
+    :db_name: path of the warehouse
+    :returns: sqlite3 connection
+    """
+    conn = sqlite3.connect(db_name)
+    conn.execute(textwrap.dedent(
+        """\
+        CREATE TABLE IF NOT EXISTS registrations (\
+        "year" INT NOT NULL,\
+        {},\
+        PRIMARY KEY ("year", "Email")\
+        ) WITHOUT ROWID
+        """
+    ).format(",".join('"{}"'.format(c) for c in columns)))
+    conn.execute(textwrap.dedent(
+        """\
+        CREATE INDEX IF NOT EXISTS registrations_year_group ON registrations\
+        ("year", "Registration Group", "OCNS Member",\
+        "Main meeting Registration", "Workshop Registration",\
+        "Tutorial Registration", "Banquet Tickets")
+        """))
+    conn.execute(textwrap.dedent(
+        """\
+        CREATE INDEX IF NOT EXISTS registrations_year_country ON registrations\
+        ("year", "Country")
+        """))
+    return conn
+
+
+def ingest(conn, year, master_db):
+    """Copy the master table of a year into the warehouse.
+
+    :conn: connection to the warehouse
+    :year: year of the conference
+    :master_db: database written by registration-metrics-sqlite.py
+    :returns: number of registrants copied
+    :raises ValueError: if master_db does not exist or has no master table
+    """
+    # ATTACH would create an empty database if the file did not exist
+    if not os.path.isfile(master_db):
+        raise ValueError("No such database: {}".format(master_db))
+    conn.execute("ATTACH DATABASE ? AS master", (master_db,))
+    try:
+        if conn.execute(
+                "SELECT 1 FROM master.sqlite_master WHERE type='table' "
+                "AND name=?", (master_table,)).fetchone() is None:
+            raise ValueError("{}: no {} table, run "
+                             "registration-metrics-sqlite.py first".format(
+                                 master_db, master_table))
+        quoted = ",".join('"{}"'.format(c) for c in columns)
+        with conn:
+            conn.execute('DELETE FROM registrations WHERE "year"==?', (year,))
+            cur = conn.execute(textwrap.dedent(
+                """\
+                INSERT INTO registrations ("year", {})\
+                SELECT ?, {} FROM master.{}
+                """
+            ).format(quoted, quoted, master_table), (year,))
+        conn.execute("ANALYZE")
+        return cur.rowcount
+    finally:
+        conn.execute("DETACH DATABASE master")
+
+
+def receipt_values(row):
+    """Get the warehouse columns of a row of a receipts export.
+
+    :row: row of the export, as a dict
+    :returns: list of values, in the order of columns, None for the columns
+        the export does not have
+    """
+    fees = {group: row.get("Reg Fee ({})".format(group)) or ""
+            for group in ["Non-Member", "Faculty", "Postdoc", "Student",
+                          "Board"]}
+    group = ""
+    member = "Y"
+    for fee_group in ["Faculty", "Postdoc", "Student", "Board"]:
+        if fees[fee_group]:
+            group = fee_group
+            break
+    else:
+        member = "N"
+        if fees["Non-Member"]:
+            group = row.get("Registration Type", "")
+    registrations = "".join(fees.values())
+
+    def number(column, convert=int):
+        value = row.get(column)
+        return convert(value) if value else None
+
+    derived = {
+        "OCNS Member": member,
+        "Registration Group": group,
+        "Main meeting Registration":
+            "Y" if "Main Meeting" in registrations else "N",
+        "Workshop Registration": "Y" if "Workshops" in registrations else "N",
+        "Tutorial Registration": "Y" if "Tutorial" in registrations else "N",
+        "Banquet Tickets": ((number("BanquetTickets") or 0) +
+                            (number("ExtraBanquetTickets") or 0)),
+        "Special Meal": ("" if row.get("Special Meal") in [None, "", "None"]
+                         else row["Special Meal"]),
+        "Payment Total": number("Payment Total", float),
+        "Balance": number("Balance", float),
+    }
+    for size in ["S", "M", "L", "XL"]:
+        derived["Shirt " + size] = number("Shirt " + size)
+    return [derived[c] if c in derived else row.get(c) for c in columns]
+
+
+def ingest_receipts(conn, year, receipts_csv):
+    """Copy the registrants of a receipts export into the warehouse.
+
+    This is for the years that have no master table. The first receipt of
+    each registrant is kept.
+
+    :conn: connection to the warehouse
+    :year: year of the conference
+    :receipts_csv: Memberclicks receipts export of the year
+    :returns: number of registrants copied
+    """
+    values = {}
+    with open(receipts_csv, 'r', newline='') as fh:
+        for row in csv.DictReader(fh):
+            if row["Email"] not in values:
+                values[row["Email"]] = [year] + receipt_values(row)
+    with conn:
+        conn.execute('DELETE FROM registrations WHERE "year"==?', (year,))
+        conn.executemany(
+            'INSERT INTO registrations ("year", {}) VALUES ({})'.format(
+                ",".join('"{}"'.format(c) for c in columns),
+                ",".join(["?"] * (len(columns) + 1))),
+            values.values())
+    conn.execute("ANALYZE")
+    return len(values)
+
+
+def growth(conn):
+    """Get the registrants by country and year, with the yearly change.
+
+    The change is from the previous year in the warehouse, in which a country
+    without registrants counts as 0. A country that had registrants in the
+    previous year but has none in a year is listed with 0 for that year.
+    There is no change for the first year.
+
+    :conn: connection to the warehouse
+    :returns: list of dicts
+    """
+    rows = conn.execute(textwrap.dedent(
+        """\
+        SELECT "year", "Country", COUNT(*) FROM registrations\
+        GROUP BY "year", "Country"
+        """)).fetchall()
+    counts = {(year, country): count for year, country, count in rows}
+    years = sorted(set(year for year, _ in counts))
+    countries = sorted(set(country for _, country in counts),
+                       key=lambda c: (c is None, c))
+    result = []
+    for country in countries:
+        for i, year in enumerate(years):
+            count = counts.get((year, country), 0)
+            before = counts.get((years[i - 1], country), 0) if i else None
+            if not count and not before:
+                continue
+            result.append({
+                "year": year, "country": country, "registrants": count,
+                "change": None if before is None else count - before,
+                "change_percent": (None if not before else
+                                   round(100 * (count - before) / before, 1)),
+            })
+    return result
+
+
+def mix(conn):
+    """Get the share of each group and membership in each year.
+
+    :conn: connection to the warehouse
+    :returns: list of dicts
+    """
+    rows = conn.execute(textwrap.dedent(
+        """\
+        SELECT "year", "Registration Group", "OCNS Member", COUNT(*),\
+        SUM(COUNT(*)) OVER (PARTITION BY "year")\
+        FROM registrations\
+        GROUP BY "year", "Registration Group", "OCNS Member"\
+        ORDER BY "year", "Registration Group", "OCNS Member"
+        """)).fetchall()
+    return [{"year": year, "group": group, "member": member,
+             "registrants": count,
+             "share_percent": round(100 * count / total, 1)}
+            for year, group, member, count, total in rows]
+
+
+def uptake(conn):
+    """Get the share of registrants of each event in each year.
+
+    :conn: connection to the warehouse
+    :returns: list of dicts
+    """
+    rows = conn.execute(textwrap.dedent(
+        """\
+        SELECT "year", COUNT(*),\
+        SUM("Main meeting Registration" == 'Y'),\
+        SUM("Workshop Registration" == 'Y'),\
+        SUM("Tutorial Registration" == 'Y'),\
+        SUM("Banquet Tickets" > 0)\
+        FROM registrations\
+        GROUP BY "year"\
+        ORDER BY "year"
+        """)).fetchall()
+    result = []
+    for year, total, *counts in rows:
+        entry = {"year": year, "registrants": total}
+        for event, count in zip(["main_meeting", "workshops", "tutorials",
+                                 "banquet"], counts):
+            entry[event] = count
+            entry[event + "_percent"] = round(100 * count / total, 1)
+        result.append(entry)
+    return result
+
+
+comparisons = {"growth": growth, "mix": mix, "uptake": uptake}
+
+
+def parse_condition(condition):
+    """Split a COLUMN=VALUE condition given on the command line.
+
+    :condition: the condition
+    :returns: (column, value)
+    :raises ValueError: if the condition has no "=" or no column
+    """
+    column, equals, value = condition.partition("=")
+    if not equals or not column:
+        raise ValueError("expected COLUMN=VALUE, got {!r}".format(condition))
+    return column, value
+
+
+def print_table(rows, fh=sys.stdout):
+    """Print a list of dicts with the same keys as an aligned table."""
+    if not rows:
+        return
+    keys = list(rows[0])
+    cells = [keys] + [["" if r[k] is None else str(r[k]) for k in keys]
+                      for r in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(keys))]
+    for row in cells:
+        print("  ".join(c.ljust(w) for c, w in zip(row, widths)), file=fh)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the registrations of several years")
+    parser.add_argument("--db", default=warehouse_db,
+                        help="warehouse database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="copy the master table of a year into the warehouse")
+    ingest_parser.add_argument("year", type=int)
+    ingest_parser.add_argument("master_db", nargs="?",
+                               help="database written by "
+                               "registration-metrics-sqlite.py "
+                               "(default: CNS<year>.sqlite)")
+    receipts_parser = subparsers.add_parser(
+        "ingest-receipts", help="copy the registrants of a receipts export "
+        "into the warehouse, for the years before 2019")
+    receipts_parser.add_argument("year", type=int)
+    receipts_parser.add_argument("receipts_csv",
+                                 help="Memberclicks receipts export")
+    for name, comparison in comparisons.items():
+        subparser = subparsers.add_parser(
+            name, help=comparison.__doc__.splitlines()[0])
+        subparser.add_argument("--json", action="store_true",
+                               help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    conn = get_conn(args.db)
+    if args.command == "ingest":
+        master_db = args.master_db or "CNS{}.sqlite".format(args.year)
+        try:
+            count = ingest(conn, args.year, master_db)
+        except ValueError as e:
+            print("ERROR: {}".format(e), file=sys.stderr)
+            sys.exit(1)
+        print("{}: {} registrants from {}".format(args.year, count, master_db),
+              file=sys.stderr)
+    elif args.command == "ingest-receipts":
+        count = ingest_receipts(conn, args.year, args.receipts_csv)
+        print("{}: {} registrants from {}".format(args.year, count,
+                                                  args.receipts_csv),
+              file=sys.stderr)
+    else:
+        result = comparisons[args.command](conn)
+        if args.json:
+            print(json.dumps(result, indent=1))
+        else:
+            print_table(result)
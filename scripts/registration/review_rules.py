@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Decide the ambiguous cases of a registration run without stopping for them.
+
+conference-master.py and tohtml.py need a decision for:
+
+- member_type: a non member whose registration type is not Faculty, Postdoc
+  or Student
+- match: an e-mail in the add to registrations or extras exports that is not
+  in the receipts, and the registrant it should be merged with
+
+Each case is decided by the first of these rules that gives an answer:
+
+1. the answers file, `review-answers.json`, which the operator maintains
+2. for member_type, the keywords of `member_type_keywords` in the
+   registration type; for match, the most similar registrant, if both the
+   e-mail and the name are similar enough (`auto_merge_ratio`)
+3. the answers files of earlier years, e.g. `review-answers-2018.json`
+
+Cases that no rule decides are written to the review queue,
+`review-queue.json`, and the run goes on without them: the registrant is
+counted without a member type, or the row is not merged. To resume, fill in
+the "answer" of the cases in the queue and run again: answers in the queue
+are moved to the answers file when the next run starts. An answer to a
+member_type case is Faculty, Postdoc or Student; an answer to a match case
+is the e-mail to merge with, or "" to drop the row. Answers are checked when
+they are used: a member type that is not one of these three (in any case),
+or an e-mail that is not in the receipts, is reported and the case is
+queued again.
+
+    {"match": {"jdoe@example.org": "jane.doe@example.org"},
+     "member_type": {"jsmith@example.org": "Student"}}
+
+The queue can also be listed and answered with:
+
+    review_rules.py list
+    review_rules.py answer member_type jsmith@example.org Student
+    review_rules.py accept-suggestions
+
+Works with Python 2 and 3.
+
+File: review_rules.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+from difflib import SequenceMatcher
+
+
+answers_json = 'review-answers.json'
+queue_json = 'review-queue.json'
+kinds = ['member_type', 'match']
+member_types = ['Faculty', 'Postdoc', 'Student']
+# Keywords of the registration type, lower case, and the member type they
+# give
+member_type_keywords = [('postdoc', 'Postdoc'), ('post-doc', 'Postdoc'),
+                        ('post doc', 'Postdoc'), ('student', 'Student'),
+                        ('phd', 'Student'), ('graduate', 'Student'),
+                        ('faculty', 'Faculty'), ('professor', 'Faculty'),
+                        ('lecturer', 'Faculty')]
+# Sum of the similarity of the e-mails and of the names, out of 2, above
+# which a registrant is merged without review
+auto_merge_ratio = 1.8
+
+
+def read_json(filename, default):
+    """Read a JSON file, or return default if it does not exist."""
+    if not os.path.isfile(filename):
+        return default
+    with open(filename, 'r') as fh:
+        return json.load(fh)
+
+
+def write_json(filename, value):
+    """Write a JSON file."""
+    with open(filename, 'w') as fh:
+        json.dump(value, fh, indent=1, sort_keys=True)
+
+
+def canonical_member_type(answer):
+    """Get the member type an answer names, ignoring case and spaces.
+
+    :answer: answer to a member_type case
+    :returns: one of member_types, or None if the answer is not one
+    """
+    if not isinstance(answer, str if sys.version_info[0] >= 3 else basestring):
+        return None
+    for member_type in member_types:
+        if answer.strip().lower() == member_type.lower():
+            return member_type
+    return None
+
+
+def best_match(email, full_name, registered_email):
+    """Find the registrant most similar to an e-mail and a name.
+
+    :email: e-mail to match
+    :full_name: "Last First" name to match
+    :registered_email: dict of e-mail to Registrant
+    :returns: (e-mail of the best match, ratio out of 2), or (None, 0)
+    """
+    best_user = None
+    best_ratio = 0
+    for user, reg in registered_email.items():
+        ratio = (SequenceMatcher(None, email, reg.email).ratio() +
+                 SequenceMatcher(None, full_name, reg.full_name).ratio())
+        if ratio > best_ratio:
+            best_user = user
+            best_ratio = ratio
+    return best_user, best_ratio
+
+
+class Rules(object):
+
+    """Decide the ambiguous cases, queueing the ones that need review."""
+
+    def __init__(self, prior_answers=(), answers_fn=answers_json,
+                 queue_fn=queue_json):
+        """Initialise
+
+        Answers that were filled in in the queue are moved to the answers
+        file.
+
+        :prior_answers: answers files of earlier years
+        :answers_fn: answers file
+        :queue_fn: review queue file
+        """
+        self.answers_fn = answers_fn
+        self.queue_fn = queue_fn
+        self.answers = read_json(answers_fn, {})
+        for kind in kinds:
+            self.answers.setdefault(kind, {})
+        self.prior = {kind: {} for kind in kinds}
+        for filename in prior_answers:
+            for kind, answers in read_json(filename, {}).items():
+                self.prior.setdefault(kind, {}).update(answers)
+
+        answered = 0
+        for kind, cases in read_json(queue_fn, {}).items():
+            for case in cases:
+                if case.get('answer') is not None:
+                    self.answers[kind][case['email']] = case['answer']
+                    answered += 1
+        if answered:
+            write_json(answers_fn, self.answers)
+            print('%d answers read from %s' % (answered, queue_fn))
+        self.queue = {kind: [] for kind in kinds}
+
+    def __enqueue(self, kind, email, **details):
+        """Add a case to the review queue."""
+        case = dict(details, email=email, answer=None)
+        self.queue[kind].append(case)
+        print('Queued for review: %s %s' % (kind, email))
+
+    def __invalid(self, kind, email, answer, source):
+        """Report an answer that cannot be used."""
+        print('WARNING: invalid %s answer for %s in %s: %r' %
+              (kind, email, source, answer), file=sys.stderr)
+
+    def member_type(self, reg, line):
+        """Decide the member type of a non member.
+
+        :reg: Registrant
+        :line: line of the receipts export
+        :returns: Faculty, Postdoc or Student, or None if queued
+        """
+        invalid = None
+        if reg.email in self.answers['member_type']:
+            answer = self.answers['member_type'][reg.email]
+            member_type = canonical_member_type(answer)
+            if member_type is not None:
+                return member_type
+            self.__invalid('member_type', reg.email, answer, self.answers_fn)
+            invalid = answer
+        else:
+            reg_type = reg.reg_type.lower()
+            for keyword, member_type in member_type_keywords:
+                if keyword in reg_type:
+                    return member_type
+            if reg.email in self.prior['member_type']:
+                answer = self.prior['member_type'][reg.email]
+                member_type = canonical_member_type(answer)
+                if member_type is not None:
+                    return member_type
+                self.__invalid('member_type', reg.email, answer,
+                               'the prior answers')
+        details = {} if invalid is None else {'invalid_answer': invalid}
+        self.__enqueue('member_type', reg.email, line=line,
+                       name=reg.full_name, fee_type=reg.fee_type,
+                       registration_type=reg.reg_type, **details)
+        return None
+
+    def match(self, row, filename, registered_email):
+        """Decide the registrant a row of an add on export belongs to.
+
+        :row: row of the export, as a dict
+        :filename: name of the export
+        :registered_email: dict of e-mail to Registrant
+        :returns: the Registrant, or None if dropped or queued
+        """
+        email = row['Email']
+        if email in registered_email:
+            return registered_email[email]
+        full_name = '%s %s' % (row['Last Name'].strip().title(),
+                               row['First Name'].strip().title())
+        details = {}
+        if email in self.answers['match']:
+            answer = self.answers['match'][email]
+            if answer == '':
+                return None
+            if answer in registered_email:
+                return registered_email[answer]
+            self.__invalid('match', email, answer, self.answers_fn)
+            details['invalid_answer'] = answer
+
+        best_user, ratio = best_match(email, full_name, registered_email)
+        if ratio >= auto_merge_ratio and not details:
+            print('Merging %s with %s' % (email, best_user))
+            return registered_email[best_user]
+        prior = self.prior['match'].get(email)
+        if prior in registered_email and not details:
+            return registered_email[prior]
+        self.__enqueue('match', email, file=filename, name=full_name,
+                       suggestion=best_user, ratio=round(ratio, 3), **details)
+        return None
+
+    def pending(self):
+        """Get the number of cases queued for review."""
+        return sum(len(cases) for cases in self.queue.values())
+
+    def write_queue(self):
+        """Write the review queue, replacing the previous one.
+
+        :returns: number of cases queued
+        """
+        write_json(self.queue_fn, self.queue)
+        pending = self.pending()
+        if pending:
+            print('%d cases need review: answer them in %s and run again' %
+                  (pending, self.queue_fn))
+        return pending
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="List and answer the review queue")
+    parser.add_argument("--queue", default=queue_json,
+                        help="review queue file")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    subparsers.add_parser("list", help="list the cases")
+    answer_parser = subparsers.add_parser("answer", help="answer a case")
+    answer_parser.add_argument("kind", choices=kinds)
+    answer_parser.add_argument("email")
+    answer_parser.add_argument("answer")
+    subparsers.add_parser("accept-suggestions",
+                          help="answer the match cases with the suggestion")
+    args = parser.parse_args()
+
+    queue = read_json(args.queue, {})
+    if args.command == "list":
+        for kind in kinds:
+            for case in queue.get(kind, []):
+                print('%s %s: %s' % (kind, case['email'], ', '.join(
+                    '%s=%s' % (k, v) for k, v in sorted(case.items())
+                    if k not in ['email'])))
+        sys.exit(0)
+
+    if args.command == "answer":
+        if (args.kind == 'member_type' and
+                canonical_member_type(args.answer) is None):
+            print('ERROR: member type must be one of %s' %
+                  ', '.join(member_types), file=sys.stderr)
+            sys.exit(1)
+        cases = [c for c in queue.get(args.kind, [])
+                 if c['email'] == args.email]
+        if not cases:
+            print('ERROR: %s %s is not in the queue' % (args.kind, args.email),
+                  file=sys.stderr)
+            sys.exit(1)
+        for case in cases:
+            case['answer'] = (canonical_member_type(args.answer)
+                              if args.kind == 'member_type' else args.answer)
+    else:
+        for case in queue.get('match', []):
+            if case['answer'] is None and case['suggestion'] is not None:
+                case['answer'] = case['suggestion']
+    write_json(args.queue, queue)
@@ -0,0 +1,57 @@
+"""
+Tests of the export archive, run with: python -m pytest test_export_archive.py
+
+File: test_export_archive.py
+"""
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import export_archive  # noqa: E402
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """Archive of two years of receipts whose columns differ."""
+    exports = {2018: "Email,Country\na@x.org,Germany\nb@x.org,France\n",
+               2019: "Email,Country,Gender\nc@x.org,Germany,F\n"
+                     "d@x.org,Spain,M\n"}
+    for year, text in exports.items():
+        fname = tmp_path / "receipts-{}.csv".format(year)
+        fname.write_text(text)
+        export_archive.add_export("receipts", year, str(fname),
+                                  archive=str(tmp_path / "archive"))
+    return str(tmp_path / "archive")
+
+
+def test_columns_of_all_years(archive):
+    table = export_archive.read_export("receipts", archive=archive)
+    assert table.column_names == ["Email", "Country", "Gender", "year"]
+    rows = sorted(table.to_pylist(), key=lambda r: r["Email"])
+    assert [r["Gender"] for r in rows] == [None, None, "F", "M"]
+
+
+def test_column_of_one_year(archive):
+    table = export_archive.read_export("receipts", columns=["Email", "Gender"],
+                                       archive=archive)
+    assert dict(zip(*table.to_pydict().values())) == {
+        "a@x.org": None, "b@x.org": None, "c@x.org": "F", "d@x.org": "M"}
+
+
+def test_filters_are_cast(archive):
+    table = export_archive.read_export("receipts", columns=["Email"],
+                                       filters=[("year", "==", "2019")],
+                                       archive=archive)
+    assert sorted(table.column("Email").to_pylist()) == ["c@x.org", "d@x.org"]
+    table = export_archive.read_export(
+        "receipts", columns=["Email"],
+        filters=[("year", "in", "2018,2019"), ("Country", "==", "Germany")],
+        archive=archive)
+    assert sorted(table.column("Email").to_pylist()) == ["a@x.org", "c@x.org"]
+
+
+def test_unknown_column(archive):
+    with pytest.raises(ValueError):
+        export_archive.read_export("receipts", columns=["Foo"],
+                                   archive=archive)
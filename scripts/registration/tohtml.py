@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 import csv
 import sys
-import time
 
 from docx import Document
 from docx.shared import Pt
@@ -10,6 +9,10 @@ document = Document()
 
 from collections import OrderedDict
 
+from registrant import (Registrant, paid_flags, shirt_sizes, MAIN_MEETING,
+                        TUTORIAL, WORKSHOPS_1DAY, WORKSHOPS_2DAY)
+from review_rules import Rules
+
 registered_email         = OrderedDict()
 registered_fullname      = OrderedDict()
 conf_year                = 2017
@@ -18,6 +21,7 @@ main_registrations_csv   = 'Main.csv'   #  All reciepts exported, e.g. Export-OC
 add_to_registrations_csv = 'AddToReg.csv'   #  Add to regs..
 extras_csv               = 'Extras.csv'   #  Extras..
 display                  = True
+prior_answers            = ['review-answers-2016.json']   #  Answers to the review queue of earlier years
 countries                = {}
 
 tshirts = {'S'  : 0, 
@@ -47,6 +51,7 @@ lunches = {'1507' : 0,
            '1807' : 0,
            '1907' : 0,
            '2007' : 0}
+lunch_dates = ['1507', '1607', '1707', '1807', '1907', '2007']
 
 to_write_full = {"First name" : 'first_name',
                  "Middle"     : 'middle_name',
@@ -71,179 +76,73 @@ to_write_badges = {"Name" : 'full_name',
                     "Country" : 'country'}
 
 
-def query_yes_no(question, default="yes"):
-    """Ask a yes/no question via raw_input() and return their answer.
-
-    "question" is a string that is presented to the user.
-    "default" is the presumed answer if the user just hits <Enter>.
-        It must be "yes" (the default), "no" or None (meaning
-        an answer is required of the user).
-
-    The "answer" return value is True for "yes" or False for "no".
-    """
-    valid = {"yes": True, "y": True, "ye": True,
-             "no": False, "n": False}
-    if default is None:
-        prompt = " [y/n] "
-    elif default == "yes":
-        prompt = " [Y/n] "
-    elif default == "no":
-        prompt = " [y/N] "
-    else:
-        raise ValueError("invalid default answer: '%s'" % default)
-
-    while True:
-        sys.stdout.write(question + prompt)
-        sys.stdout.flush()
-        choice = raw_input().lower()
-        if default is not None and choice == '':
-            return valid[default]
-        elif choice in valid:
-            return valid[choice]
-        else:
-            sys.stdout.write("Please respond with 'yes' or 'no' "
-                             "(or 'y' or 'n').\n")
-
-def find_best_user(row, registered_email):
-    print('%s is not found in the main registration! Trying to auto guess...' %email)
-    from difflib import SequenceMatcher
-    best_ratio  = 0
-    last_name   = row['Last Name'].strip().title()
-    middle_name = row['Middle Name'].strip()
-    first_name  = row['First Name'].strip().title()
-    full_name   = '%s %s'%(last_name, first_name)
-
-    for user in registered_email.keys():
-        ratio_1 = SequenceMatcher(None, email, registered_email[user]['email']).ratio()
-        ratio_2 = SequenceMatcher(None, full_name, registered_email[user]['full_name']).ratio()
-        ratio   =  ratio_1 + ratio_2
-        if ratio > best_ratio:
-            best_user  = user
-            best_ratio = ratio
-    print('Best match found for %s is user %s' %(email, best_user))
-    return best_user
+class Registrant2017(Registrant):
+
+    """Registrant with the printed program and the lunches of 2017."""
+
+    __slots__ = ('program',) + tuple('lunch' + date for date in lunch_dates)
+
+    def __init__(self, row):
+        Registrant.__init__(self, row)
+        self.program = 'Yes' if row['Printed Program'] == 'Yes' else ''
+        for date in lunch_dates:
+            setattr(self, 'lunch' + date, int(row['lunch' + date]))
 
 
+def count_items(flags):
+    """Count the items of a registrant in the meeting totals."""
+    if flags & MAIN_MEETING:
+        meeting['main'] +=1
+    if flags & TUTORIAL:
+        meeting['tutorial'] +=1
+    if flags & WORKSHOPS_1DAY:
+        meeting['ws1'] +=1
+    if flags & WORKSHOPS_2DAY:
+        meeting['ws2'] +=1
+
+
+rules = Rules(prior_answers)
 
 with open(main_registrations_csv, 'rb') as csvfile:
 
     reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
 
     for count, row in enumerate(reader):
-   
-        user = {}
-        user['email'] = row['Email']
+
+        user = Registrant2017(row)
 
         if display:
-            print('Handling registration for %s'%user['email'])
-
-        last_name     = row['Last Name'].strip().title()
-        middle_name   = row['Middle Name'].strip()
-        first_name    = row['First Name'].strip().title()
-        user['name']  = ('<b>%s</b> %s %s'%(last_name, first_name, middle_name)).strip()
-        user['full_name']   = '%s %s'%(last_name, first_name)
-        user['first_name']  = '%s' %first_name
-        user['middle_name'] = '%s' %middle_name
-        user['last_name']   = '%s' %last_name
-                
-        date         = row['Submit Date']
-        user['date'] = time.strptime(date, '%m/%d/%Y %H:%M:%S')
-
-        reg_nm = row['Reg Fee (Non-Member)']
-        reg_f  = row['Reg Fee (Faculty)']
-        reg_p  = row['Reg Fee (Postdoc)']
-        reg_s  = row['Reg Fee (Student)']
-        reg_type = row['Registration Type']
-
-        user['type'] = 'Non member' if len(reg_nm)>0 else ('Faculty' if len(reg_f)>0 else ('Postdoc' if len(reg_p)>0 else 'Student'))
-        payment_info = reg_nm+reg_f+reg_p+reg_s
-
-        if user['type'] in ['Faculty', 'Postdoc', 'Student']: 
-            members[user['type'].lower()] +=1
+            print('Handling registration for %s'%user.email)
+
+        reg_type = user.reg_type
+
+        if user.fee_type in ['Faculty', 'Postdoc', 'Student']:
+            members[user.fee_type.lower()] +=1
         elif reg_type in ['Faculty', 'Postdoc', 'Student']:
             non_members[reg_type.lower()] += 1
         else:
-            print('Problem at line %d with user %s %s %s'%(count, user['email'], user['type'], reg_type))
-            print('Press f/p/s if you know Faculty/Postdoc/student, q to quit')
-            key = ''
-            while key not in ['f', 'p', 's', 'q']:
-                key = raw_input('').lower()
+            reg_type = rules.member_type(user, count)
+            if reg_type is not None:
+                non_members[reg_type.lower()] += 1
+                user.reg_type = reg_type
 
-            if key == "q":
-                sys.exit()
-            elif key == 's':
-                non_members['student'] += 1
-                reg_type = 'Student'
-            elif key == 'f':
-                non_members['faculty'] += 1
-                reg_type = 'Faculty'
-            elif key == 'p':
-                non_members['postdoc'] += 1
-                reg_type = 'Postdoc'
-
-
-        user['type0'] = '%s %s'%(user['type'], reg_type if len(reg_type)>0 else 'Member')
-        user['paid']  = ''
-
-        if 'Main Meeting' in payment_info:
-            user['paid'] += 'MM '
-            meeting['main'] +=1
-
-        if 'Tutorial' in payment_info:
-            user['paid'] += 'T '
-            meeting['tutorial']+=1
-
-        if 'Workshops 1 Day Only' in payment_info:
-            user['paid'] += 'WS1day '  
-            meeting['ws1']+=1
-
-        elif 'Workshops' in payment_info:
-            user['paid'] += 'WS2day ' 
-            meeting['ws2']+=1
-
-        shirt = ''
-        for size in ['S', 'M', 'L', 'XL']:
-            nb_shirt = row['Shirt {}'.format(size)]
-            if int(nb_shirt) > 0: shirt += nb_shirt + ' * {} '.format(size)
-            user['shirt'] = shirt
-            tshirts[size]+= int(nb_shirt)
-
-
-        program = row['Printed Program']
-        banquet = row['BanquetTickets']
-        extraba = row['ExtraBanquetTickets']
-        meal    = row['Special Meal']
-
-        user['program']      = '%s'%(program if program == 'Yes' else '')
-        extras['program']   += 1 if program == 'Yes' else 0
-        user['banquet']      = '%s'%('' if banquet == '0' else banquet)
-        user['extrabanquet'] = '%s'%('' if extraba == '0' else extraba)
-        extras['banquet']   += int(banquet) + int(extraba)
-        user['meal']         = meal
-
-        inst = row['Institution'].strip()
-        city = row['City'].strip()          
-            
-        country = row['Country'].strip()
-        user['location'] = '%s, %s'%(inst, country)
-        user['inst']     = inst
-        user['country']  = country
-        user['city']     = city
+        count_items(user.paid_items)
 
-        if not country in countries.keys(): 
-            countries[country] = 0
-        countries[country] +=1
+        for size in shirt_sizes:
+            tshirts[size] += user.shirts(size)
 
-        balance = -1*float(row['Balance'])
-        user['balance'] = '' if balance==0 else '${:10.2f}'.format(balance)
+        extras['program']   += 1 if user.program == 'Yes' else 0
+        extras['banquet']   += user.banquet_tickets + user.extrabanquet_tickets
 
-        for date in ['1507', '1607', '1707', '1807', '1907', '2007']:    
-            lunch = row['lunch' + date]
-            user['lunch' + date] = '%s'%('' if lunch == '0' else lunch)
-            lunches[date]+= int(lunch)
+        if not user.country in countries.keys():
+            countries[user.country] = 0
+        countries[user.country] +=1
 
-        registered_email[user['email']] = user
-        registered_fullname[user['full_name']] = user
+        for date in lunch_dates:
+            lunches[date] += getattr(user, 'lunch' + date)
+
+        registered_email[user.email] = user
+        registered_fullname[user.full_name] = user
 
 
 print('Processed %d Main Registrations' %len(registered_email))
@@ -258,52 +157,14 @@ with open(add_to_registrations_csv, 'rb') as csvfile:
         email = row['Email']
         if display:
             print('Add items to registration of %s'%email)
-        if registered_email.has_key(email):
-            user = registered_email[email]
-        else:
-            best_user = find_best_user(row, registered_email)
-            accept = query_yes_no('Do you want to merge users?')
-            if accept:
-                user = registered_email[best_user]
-            else:
-                print('Please find a match for user %s in file %s' %(email, add_to_registrations_csv))
-                sys.exit()
-
-        changed = False
+        user = rules.match(row, add_to_registrations_csv, registered_email)
+        if user is None:
+            continue
 
-        reg_nm = row['Reg Fee (Non-Member)']
-        reg_f  = row['Reg Fee (Faculty)']
-        reg_p  = row['Reg Fee (Postdoc)']
-        reg_s  = row['Reg Fee (Student)']
-
-        payment_info = reg_nm+reg_f+reg_p+reg_s
-        
-        #if display:
-        #    print('Paid: %s'%payment_info)
-
-        curr = user['paid']
-
-        if 'Main Meeting' in payment_info:
-            curr += ' & MM '
-            meeting['main'] +=1
-            changed = True
-
-        if 'Tutorial' in payment_info:
-            curr += ' & T '
-            meeting['tutorial']+=1
-            changed = True
-
-        if 'Workshops 1 Day Only' in payment_info:
-            curr += ' & WS1day'
-            meeting['ws1'] +=1
-            changed = True
-
-        elif 'Workshops' in payment_info:
-            curr += ' & WS2day ' 
-            meeting['ws2'] +=1
-            changed = True
-
-        user['paid'] = curr
+        flags = paid_flags(row)
+        count_items(flags)
+        user.added_items |= flags
+        changed = flags != 0
 
         if not changed:
             print('Please check: Nothing changed for {m} at line {l} !!'.format(m=email, l=count))
@@ -320,17 +181,9 @@ with open(extras_csv, 'rb') as csvfile:
         if display:
             print('Add extras to registration of %s'%email)
             
-        if registered_email.has_key(email):
-            user = registered_email[email]
-        else:
-            best_user = find_best_user(row, registered_email)
-
-            accept = query_yes_no('Do you want to merge users?')
-            if accept:
-                user = registered_email[best_user]
-            else:
-                print('Please find a match for user %s in file %s' %(email, add_to_registrations_csv))
-                sys.exit()
+        user = rules.match(row, extras_csv, registered_email)
+        if user is None:
+            continue
 
 
         changed = False
@@ -338,45 +191,38 @@ with open(extras_csv, 'rb') as csvfile:
         exbanq  = int(row['ExtraBanquetTickets'])
 
         if banq > 0:
-            curr = 0 if len(user['banquet']) == 0 else int(user['banquet'])
-            user['banquet'] = curr + banq
+            user.banquet_tickets += banq
             changed = True
             extras['banquet'] += banq
-            #print('Increasing banquet tickets from %d to %d'%(curr, user['banquet']))
 
         if exbanq > 0:
             extras['banquet'] += exbanq
-            curr = 0 if len(user['extrabanquet']) == 0 else int(user['extrabanquet'])
-            user['extrabanquet'] = curr + exbanq
+            user.extrabanquet_tickets += exbanq
             changed = True
-            #print('Increasing extra banquet tickets from %d to %d'%(curr, user['extrabanquet']))
 
-        for size in ['S', 'M', 'L', 'XL']:
+        for size in shirt_sizes:
             nb_shirt = int(row['Shirt {}'.format(size)])
-            shirt = ''
-            if int(nb_shirt) > 0: shirt += nb_shirt + ' * {} '.format(size)
-            user['shirt'] += shirt
-            tshirts[size] += int(nb_shirt)
-            if int(nb_shirt) > 0:
-                #print("Adding %d shirts of size %s" %(int(nb_shirt), size))
+            user.add_shirts(size, nb_shirt)
+            tshirts[size] += nb_shirt
+            if nb_shirt > 0:
                 changed = True
 
         prog = row['Printed Program']
         if prog != 'No':
-            if user['program'] == 'Yes':
+            if user.program == 'Yes':
                 print('User already has a program!!')
                 sys.exit()
             else:
-                user['program'] = 'Yes'
+                user.program = 'Yes'
                 extras['program'] += 1
                 #print("Adding a Printed Program")
                 changed = True
 
-        for date in ['1507', '1607', '1707', '1807', '1907', '2007']:    
-            lunch = row['lunch' + date]
-            user['lunch' + date] = '%s'%('' if lunch == '0' else lunch)
-            lunches[date]+= int(lunch)
-            if int(lunch) > 0:
+        for date in lunch_dates:
+            lunch = int(row['lunch' + date])
+            setattr(user, 'lunch' + date, getattr(user, 'lunch' + date) + lunch)
+            lunches[date] += lunch
+            if lunch > 0:
                 #print("Adding %d lunch for the date %s" %(int(lunch), date))
                 changed = True
 
@@ -385,6 +231,8 @@ with open(extras_csv, 'rb') as csvfile:
 
 
 
+rules.write_queue()
+
 registrations = []
 for name in sorted(registered_fullname.keys()):
     user = registered_fullname[name]
@@ -394,8 +242,8 @@ for name in sorted(registered_fullname.keys()):
 balance_paid = []
 
 for reg in registrations:
-    if reg['email'] in balance_paid:
-        reg['balance'] = 'PAID'
+    if reg.email in balance_paid:
+        reg.balance_paid = True
 
 variables = {}
 variables['title'] = "CNS %d registrants" %conf_year
@@ -491,12 +339,12 @@ template = """
     <td>{{ reg.banquet }}</td>
     <td>{{ reg.balance }}</td>
     <td>{{ reg.meal }}</td>
-    <td>{{ reg.lunch1507 }}</td>
-    <td>{{ reg.lunch1607 }}</td>
-    <td>{{ reg.lunch1707 }}</td>
-    <td>{{ reg.lunch1807 }}</td>
-    <td>{{ reg.lunch1907 }}</td>
-    <td>{{ reg.lunch2007 }}</td>
+    <td>{{ reg.lunch1507 or '' }}</td>
+    <td>{{ reg.lunch1607 or '' }}</td>
+    <td>{{ reg.lunch1707 or '' }}</td>
+    <td>{{ reg.lunch1807 or '' }}</td>
+    <td>{{ reg.lunch1907 or '' }}</td>
+    <td>{{ reg.lunch2007 or '' }}</td>
   </tr>
 {% endfor %}
 </table>
@@ -527,8 +375,8 @@ for reg in registrations:
     r = 0 if count in [0,1] else (1 if count in [2,3] else 2)
     c = 0 if count in [0,2,4] else 1
 
-    name = reg['full_name']
-    loc = reg['location']
+    name = reg.full_name
+    loc = reg.location
 
     mycell = table.rows[r].cells[c]
     
@@ -543,7 +391,7 @@ for reg in registrations:
     r2.font.size = Pt(8)
     
     p3 = mycell.add_paragraph()
-    r3 = p3.add_run('%s %s'%(reg['type0'], reg['paid']))
+    r3 = p3.add_run('%s %s'%(reg.type0, reg.paid))
     r3.font.size = Pt(8)
 
     p4 = mycell.add_paragraph()
@@ -554,8 +402,8 @@ for reg in registrations:
     run = paragraph.add_run()
     run.add_picture('ocns.png')
         
-    full_csv   += "\t".join([str(reg[value]) for value in to_write_full.values()]) + "\n"
-    badges_csv += "\t".join([str(reg[value]) for value in to_write_badges.values()]) + "\n"
+    full_csv   += "\t".join([str(getattr(reg, value)) for value in to_write_full.values()]) + "\n"
+    badges_csv += "\t".join([str(getattr(reg, value)) for value in to_write_badges.values()]) + "\n"
 
     count  += 1
     if count == 6: